@@ -0,0 +1,66 @@
+"""
+Учет активности пользователей с отложенной записью.
+
+Время последнего обращения (users.last_activity) обновляется при каждом
+обновлении от пользователя. Запись на каждое обращение означала бы отдельную
+транзакцию (и fsync) на каждое нажатие, поэтому обращения накапливаются в
+памяти - для пользователя хранится только последнее - и записываются одним
+пакетным UPDATE периодической задачей и при остановке бота.
+"""
+import logging
+from datetime import datetime
+from sqlalchemy import update, bindparam
+from database import async_engine
+from models import User
+
+logger = logging.getLogger(__name__)
+
+_table = User.__table__
+
+_stats = {"touches": 0, "writes": 0, "batches": 0, "failed_batches": 0}
+
+_update_activity = (
+    update(_table)
+    .where(_table.c.telegram_id == bindparam("telegram_id_"))
+    .values(last_activity=bindparam("last_activity_"))
+)
+
+class ActivityTracker:
+    """Накопитель времени последнего обращения пользователей."""
+
+    def __init__(self):
+        # telegram_id -> время последнего обращения
+        self.pending = {}
+
+    def touch(self, telegram_id: str):
+        """Отмечает обращение пользователя; запись в базу - при следующем flush."""
+        self.pending[telegram_id] = datetime.utcnow()
+        _stats["touches"] += 1
+
+    async def flush(self):
+        """Записывает накопленное время обращений одной транзакцией."""
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, {}
+        rows = [
+            {"telegram_id_": telegram_id, "last_activity_": last_activity}
+            for telegram_id, last_activity in pending.items()
+        ]
+        try:
+            async with async_engine.begin() as connection:
+                await connection.execute(_update_activity, rows)
+        except Exception:
+            # Обращения остаются в очереди, если за это время не появились более поздние
+            for telegram_id, last_activity in pending.items():
+                self.pending.setdefault(telegram_id, last_activity)
+            _stats["failed_batches"] += 1
+            logger.exception("Не удалось сохранить активность пользователей (%d записей)", len(rows))
+            return
+        _stats["batches"] += 1
+        _stats["writes"] += len(rows)
+
+activity_tracker = ActivityTracker()
+
+def get_activity_stats() -> dict:
+    """Статистика учета активности: обращения, записанные строки и транзакции."""
+    return dict(_stats)
@@ -0,0 +1,333 @@
+from telegram import Update
+from telegram.ext import Application, ContextTypes
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+import time
+from catalog_index import refresh_catalog_index, get_catalog_index
+from render_cache import render_cache
+from auth_cache import auth_cache
+from image_cache import get_image_cache_stats
+from persistence import get_persistence_stats
+from rate_limiter import get_rate_limiter_stats
+from broadcast import dispatch_broadcasts, stop_broadcasts
+from reminders import dispatch_reminders, stop_reminders
+from activity import activity_tracker, get_activity_stats
+from flood_guard import get_flood_guard_stats
+from database import session_scope, get_session, get_pool_stats, get_storage_settings, run_storage_maintenance, async_engine
+from repository import get_all_categories, search_page, expire_subscriptions
+from handlers.catalog_handlers import render_catalog, render_category_page, render_product_card
+from handlers.search_handlers import render_manufacturer_menu, render_city_menu
+from handlers.screens import get_screen_stats
+from config import UPDATE_WORKERS, PAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Статистика обработки обновлений: очередь и время ожидания обработчика
+_update_stats = {
+    "processed": 0,
+    "waiting": 0,
+    "active": 0,
+    "max_depth": 0,
+    "total_wait_time": 0.0,
+    "max_wait_time": 0.0,
+}
+
+def get_sequence_key(update: object):
+    """Ключ упорядочивания: обновления одного чата обрабатываются по очереди."""
+    if isinstance(update, Update):
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+    return None
+
+class ChatSequencer:
+    """Блокировки по чатам: каждое обновление чата ждет завершения предыдущих."""
+
+    def __init__(self):
+        # Ключ -> [блокировка, количество обновлений, удерживающих или ожидающих ее]
+        self._locks = {}
+
+    @asynccontextmanager
+    async def hold(self, key):
+        if key is None:
+            yield
+            return
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            # asyncio.Lock пропускает ожидающих в порядке очереди
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+class BotApplication(Application):
+    """
+    Приложение бота с обработкой каждого обновления в рамках одной сессии БД.
+    Все обработчики обновления (включая check_auth) получают общую сессию
+    через database.get_session(), которая закрывается после обработки.
+
+    Обновления разных чатов обрабатываются параллельно, не более UPDATE_WORKERS
+    одновременно. Обновления одного чата обрабатываются строго по порядку
+    поступления: от этого зависит ConversationHandler.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._sequencer = ChatSequencer()
+        self._workers = asyncio.Semaphore(UPDATE_WORKERS)
+
+    async def update_persistence(self) -> None:
+        # Application передает хранилищу изменения по одному; в базу они
+        # записываются одной транзакцией после передачи всех изменений
+        await super().update_persistence()
+        if self.persistence is not None:
+            await self.persistence.write_pending()
+
+    async def process_update(self, update: object) -> None:
+        arrived = time.perf_counter()
+        waiting = True
+        _update_stats["waiting"] += 1
+        depth = _update_stats["waiting"] + self.update_queue.qsize()
+        _update_stats["max_depth"] = max(_update_stats["max_depth"], depth)
+        if isinstance(update, Update) and update.effective_user is not None:
+            activity_tracker.touch(str(update.effective_user.id))
+        try:
+            # Сначала очередь чата, затем обработчик: обновления, ждущие свой чат,
+            # не занимают обработчики, нужные другим пользователям
+            async with self._sequencer.hold(get_sequence_key(update)), self._workers:
+                waited = time.perf_counter() - arrived
+                waiting = False
+                _update_stats["waiting"] -= 1
+                _update_stats["active"] += 1
+                _update_stats["total_wait_time"] += waited
+                _update_stats["max_wait_time"] = max(_update_stats["max_wait_time"], waited)
+                try:
+                    async with session_scope():
+                        await super().process_update(update)
+                finally:
+                    _update_stats["active"] -= 1
+                    _update_stats["processed"] += 1
+        finally:
+            # Обновление отменено, не дождавшись обработчика
+            if waiting:
+                _update_stats["waiting"] -= 1
+
+def get_update_stats():
+    """
+    Возвращает статистику обработки обновлений: количество обработанных,
+    ожидающих и обрабатываемых сейчас, наибольшую глубину очереди и время
+    ожидания обработчика (в мс).
+    """
+    processed = _update_stats["processed"] + _update_stats["active"]
+    return {
+        "processed": _update_stats["processed"],
+        "waiting": _update_stats["waiting"],
+        "active": _update_stats["active"],
+        "max_depth": _update_stats["max_depth"],
+        "avg_wait_ms": _update_stats["total_wait_time"] / processed * 1000 if processed else 0.0,
+        "max_wait_ms": _update_stats["max_wait_time"] * 1000,
+    }
+
+def log_update_stats():
+    """Выводит в лог статистику обработки обновлений."""
+    stats = get_update_stats()
+    logger.info(
+        "Обновления: обработано %d, ожидают %d, в обработке %d, наибольшая очередь %d, "
+        "ожидание обработчика в среднем %.1f мс, максимум %.1f мс",
+        stats["processed"], stats["waiting"], stats["active"], stats["max_depth"],
+        stats["avg_wait_ms"], stats["max_wait_ms"]
+    )
+
+def log_pool_stats():
+    """Выводит в лог статистику пула соединений."""
+    stats = get_pool_stats()
+    logger.info(
+        "Пул соединений: выдано %d, занято %d, среднее удержание %.1f мс, максимум %.1f мс",
+        stats["checkouts"], stats["checked_out"], stats["avg_hold_ms"], stats["max_hold_ms"]
+    )
+
+def log_render_cache_stats():
+    """Выводит в лог статистику кэша отрисованных экранов."""
+    stats = render_cache.stats()
+    logger.info(
+        "Кэш экранов: записей %d, попаданий %d, промахов %d (%.0f%%)",
+        stats["size"], stats["hits"], stats["misses"], stats["hit_rate"] * 100
+    )
+
+def log_auth_cache_stats():
+    """Выводит в лог статистику кэша авторизации."""
+    stats = auth_cache.stats()
+    logger.info(
+        "Кэш авторизации: записей %d, попаданий %d, промахов %d (%.0f%%)",
+        stats["size"], stats["hits"], stats["misses"], stats["hit_rate"] * 100
+    )
+
+def log_persistence_stats():
+    """Выводит в лог статистику сохранения состояния бота."""
+    stats = get_persistence_stats()
+    logger.info(
+        "Состояние бота: загружено %d, записано %d, удалено %d за %d транзакций (ошибок %d)",
+        stats["loads"], stats["writes"], stats["deletes"], stats["batches"], stats["failed_batches"]
+    )
+
+def log_rate_limiter_stats():
+    """Выводит в лог статистику ограничителя исходящих запросов."""
+    stats = get_rate_limiter_stats()
+    for lane in ("interactive", "bulk"):
+        lane_stats = stats[lane]
+        logger.info(
+            "Исходящие запросы (%s): %d, задержано %d, ожидание %.1f с (максимум %.2f с)",
+            lane, lane_stats["requests"], lane_stats["throttled"],
+            lane_stats["wait_time"], lane_stats["max_wait_time"]
+        )
+    retry = stats["retry_after"]
+    logger.info(
+        "Ответов 429 (RetryAfter): %d, пауза %.0f с, запросов без успеха после повторов %d",
+        retry["count"], retry["wait_time"], retry["failed"]
+    )
+
+def log_image_cache_stats():
+    """Выводит в лог статистику кэша file_id изображений."""
+    stats = get_image_cache_stats()
+    logger.info(
+        "Кэш изображений: по file_id %d, загружено %d (%.0f%% попаданий), "
+        "загружено %.1f КБ, сэкономлено %.1f КБ",
+        stats["hits"], stats["misses"], stats["hit_rate"] * 100,
+        stats["bytes_uploaded"] / 1024, stats["bytes_saved"] / 1024
+    )
+
+def log_screen_stats():
+    """Выводит в лог, сколько экранов выведено изменением сообщения и сколько - заменой новым."""
+    stats = get_screen_stats()
+    logger.info("Экраны: изменено сообщений %d, заменено новыми %d", stats["edited"], stats["replaced"])
+
+def log_activity_stats():
+    """Выводит в лог статистику учета активности пользователей."""
+    stats = get_activity_stats()
+    logger.info(
+        "Активность пользователей: обращений %d, записано строк %d за %d транзакций (ошибок %d)",
+        stats["touches"], stats["writes"], stats["batches"], stats["failed_batches"]
+    )
+
+def log_flood_guard_stats():
+    """Выводит в лог статистику ограничения входящих обновлений."""
+    stats = get_flood_guard_stats()
+    logger.info(
+        "Входящие обновления: пропущено %d, отклонено %d, попыток ввода кода отклонено %d "
+        "(при блокировке %d), блокировок ввода кода %d",
+        stats["allowed"], stats["throttled"], stats["auth_throttled"], stats["locked_out"], stats["lockouts"]
+    )
+
+def log_storage_settings():
+    """Выводит в лог действующие настройки хранения SQLite."""
+    settings = get_storage_settings()
+    logger.info("Профиль хранения SQLite: %s", ", ".join(f"{k}={v}" for k, v in settings.items()))
+
+async def storage_maintenance(context: ContextTypes.DEFAULT_TYPE):
+    """Периодическая задача: контрольная точка WAL и PRAGMA optimize."""
+    busy, wal_pages, checkpointed = await run_storage_maintenance()
+    logger.info(
+        "Обслуживание SQLite: страниц в WAL %d, перенесено %d%s",
+        wal_pages, checkpointed, " (база занята)" if busy else ""
+    )
+
+async def warm_render_cache():
+    """
+    Заполняет кэш экранов для текущей версии каталога: список категорий,
+    меню производителей и городов, первые страницы категорий и карточки
+    товаров с этих страниц.
+    """
+    if get_catalog_index() is None:
+        return
+    started = time.perf_counter()
+    async with session_scope():
+        await render_catalog()
+        await render_manufacturer_menu()
+        await render_city_menu()
+        db = get_session()
+        for category in await get_all_categories(db):
+            await render_category_page(category.id)
+            for product in await search_page(db, {"category_id": category.id}, limit=PAGE_SIZE):
+                # Карточки не должны вытеснять уже построенные экраны
+                if len(render_cache.entries) >= render_cache.max_size:
+                    break
+                await render_product_card(product.id)
+    logger.info(
+        "Кэш экранов заполнен: записей %d, %.0f мс",
+        len(render_cache.entries), (time.perf_counter() - started) * 1000
+    )
+
+async def sweep_expired_subscriptions():
+    """Переводит истекшие подписки в статус EXPIRED и выводит в лог количество."""
+    async with session_scope():
+        telegram_ids, subscriptions = await expire_subscriptions(get_session())
+    logger.info(
+        "Истекшие подписки: пользователей %d, записей подписок %d",
+        len(telegram_ids), subscriptions
+    )
+
+async def post_init(application: Application):
+    """
+    Строит индекс каталога и заполняет кэш экранов до начала обработки обновлений,
+    переводит подписки, истекшие за время остановки, в статус EXPIRED,
+    продолжает прерванные рассылки.
+    """
+    await refresh_catalog_index()
+    await sweep_expired_subscriptions()
+    await warm_render_cache()
+    await dispatch_broadcasts(application.bot)
+
+async def catalog_index_refresh(context: ContextTypes.DEFAULT_TYPE):
+    """Периодическая задача: перестраивает индекс каталога, если каталог изменился."""
+    if await refresh_catalog_index():
+        await warm_render_cache()
+
+async def broadcast_check(context: ContextTypes.DEFAULT_TYPE):
+    """Периодическая задача: запускает новые рассылки."""
+    await dispatch_broadcasts(context.bot)
+
+async def subscription_reminders(context: ContextTypes.DEFAULT_TYPE):
+    """Ежедневная задача: запускает отправку напоминаний о продлении подписки."""
+    dispatch_reminders(context.bot)
+
+async def subscription_expiry(context: ContextTypes.DEFAULT_TYPE):
+    """Периодическая задача: переводит истекшие подписки в статус EXPIRED."""
+    await sweep_expired_subscriptions()
+
+async def activity_flush(context: ContextTypes.DEFAULT_TYPE):
+    """Периодическая задача: записывает накопленное время обращений пользователей."""
+    await activity_tracker.flush()
+
+async def post_stop(application: Application):
+    """
+    Останавливает рассылки и напоминания до закрытия соединений; они
+    продолжатся после перезапуска.
+    """
+    await stop_broadcasts()
+    await stop_reminders()
+
+async def post_shutdown(application: Application):
+    """
+    Завершает работу бота: записывает накопленную активность пользователей,
+    выводит статистику и закрывает соединения с БД.
+    """
+    await activity_tracker.flush()
+    log_update_stats()
+    log_pool_stats()
+    log_render_cache_stats()
+    log_auth_cache_stats()
+    log_image_cache_stats()
+    log_screen_stats()
+    log_persistence_stats()
+    log_rate_limiter_stats()
+    log_activity_stats()
+    log_flood_guard_stats()
+    # Соединения aiosqlite работают в отдельных потоках и не дают процессу завершиться
+    await async_engine.dispose()
@@ -2,6 +2,7 @@ from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 import hashlib
 from models import User, SubscriptionStatus
+from auth_cache import auth_cache
 from config import SECRET_KEY, AUTH_CODE
 
 def hash_password(password):
@@ -33,23 +34,31 @@ def register_user(db: Session, telegram_id, username=None, first_name=None, last
         db.add(user)
         db.commit()
         db.refresh(user)
+        auth_cache.invalidate(telegram_id)
         return user, True  # Возвращаем пользователя и флаг, что это новый пользователь
     else:
-        # Обновляем существующего пользователя
-        if username:
-            user.username = username
-        if first_name:
-            user.first_name = first_name
-        if last_name:
-            user.last_name = last_name
-        if phone_number:
-            user.phone_number = phone_number
-        if email:
-            user.email = email
+        # Обновляем существующего пользователя; время обращения записывает
+        # activity_tracker, поэтому без изменений профиля транзакция не нужна
+        changes = {
+            "username": username,
+            "first_name": first_name,
+            "last_name": last_name,
+            "phone_number": phone_number,
+            "email": email,
+        }
+        changed = False
+        for field, value in changes.items():
+            if value and getattr(user, field) != value:
+                setattr(user, field, value)
+                changed = True
+        # Пользователь, заблокировавший бота, снова получает рассылки после /start
+        if not user.is_active:
+            user.is_active = True
+            changed = True
         
-        user.last_activity = datetime.utcnow()
-        db.commit()
-        db.refresh(user)
+        if changed:
+            db.commit()
+            db.refresh(user)
         return user, False  # Возвращаем пользователя и флаг, что это существующий пользователь
 
 def get_user(db: Session, telegram_id):
@@ -63,13 +72,19 @@ def check_auth_code(code):
 # Добавляем функцию check_auth для совместимости с импортом в catalog_handlers.py
 async def check_auth(update, context):
     """Проверяет авторизацию пользователя."""
-    from database import get_db
+    from database import get_session
     
-    db = next(get_db())
-    user_id = update.effective_user.id
-    user = get_user(db, user_id)
+    telegram_id = str(update.effective_user.id)
+    entry = auth_cache.get(telegram_id)
+    if entry is not None:
+        authorized = entry.user_id is not None
+    else:
+        db = get_session()
+        user = await db.run_sync(get_user, telegram_id)
+        auth_cache.put(telegram_id, user)
+        authorized = user is not None
     
-    if not user:
+    if not authorized:
         await update.effective_message.reply_text(
             "❌ Вы не авторизованы. Пожалуйста, используйте команду /start для авторизации."
         )
@@ -115,11 +130,16 @@ def use_auth_code(db: Session, telegram_id, code):
     db.add(subscription)
     db.commit()
     db.refresh(user)
+    auth_cache.invalidate(telegram_id)
     
     return True, f"✅ Код активирован! Ваша подписка действительна до {subscription_end_date.strftime('%d.%m.%Y')}."
 
 def check_subscription_status(db: Session, user_id):
-    """Проверяет статус подписки пользователя и обновляет его, если срок истек."""
+    """
+    Возвращает статус подписки пользователя с учетом срока действия.
+    Статус в базе не изменяется: истекшие подписки переводит в EXPIRED
+    периодическая задача (subscription.expire_subscriptions).
+    """
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         return SubscriptionStatus.FREE
@@ -127,10 +147,7 @@ def check_subscription_status(db: Session, user_id):
     # Если подписка платная или пробная, проверяем срок действия
     if user.subscription_status in [SubscriptionStatus.PAID, SubscriptionStatus.TRIAL]:
         if user.subscription_expiry and user.subscription_expiry < datetime.utcnow():
-            # Срок подписки истек, обновляем статус
-            user.subscription_status = SubscriptionStatus.EXPIRED
-            db.commit()
-            db.refresh(user)
+            return SubscriptionStatus.EXPIRED
     
     return user.subscription_status
 
@@ -138,7 +155,9 @@ def has_active_subscription(db: Session, telegram_id):
     """Проверяет, есть ли у пользователя активная подписка."""
     user = get_user(db, telegram_id)
     if not user:
+        auth_cache.put(telegram_id)
         return False
     
     status = check_subscription_status(db, user.id)
+    auth_cache.put(telegram_id, user)
     return status == SubscriptionStatus.PAID
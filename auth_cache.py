@@ -0,0 +1,80 @@
+"""
+Кэш авторизации: telegram_id -> (id пользователя, статус подписки, дата окончания).
+
+Проверка подписки выполняется перед каждым защищенным действием. Кэш отвечает
+на нее без обращения к базе: срок действия сравнивается с сохраненной датой
+окончания. Функции, изменяющие подписку (use_auth_code, create_subscription,
+extend_subscription, cancel_subscription), сбрасывают запись пользователя
+сразу после фиксации изменений.
+"""
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from typing import Optional
+from models import SubscriptionStatus
+from config import AUTH_CACHE_TTL, AUTH_CACHE_SIZE
+
+# user_id равен None, если пользователь не зарегистрирован
+AuthEntry = namedtuple("AuthEntry", ["user_id", "status", "expiry", "cached_at"])
+
+class AuthCache:
+    """LRU-кэш статуса авторизации с ограниченным временем жизни записей."""
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, telegram_id: str) -> Optional[AuthEntry]:
+        """Возвращает запись пользователя или None, если ее нет или она устарела."""
+        entry = self.entries.get(telegram_id)
+        if entry is None or time.monotonic() - entry.cached_at > self.ttl:
+            if entry is not None:
+                del self.entries[telegram_id]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(telegram_id)
+        self.hits += 1
+        return entry
+
+    def put(self, telegram_id: str, user=None):
+        """Сохраняет статус пользователя (user=None - пользователь не найден)."""
+        if user is None:
+            entry = AuthEntry(None, None, None, time.monotonic())
+        else:
+            entry = AuthEntry(user.id, user.subscription_status, user.subscription_expiry, time.monotonic())
+        self.entries[telegram_id] = entry
+        self.entries.move_to_end(telegram_id)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, telegram_id: str):
+        """Сбрасывает запись пользователя после изменения подписки."""
+        self.entries.pop(telegram_id, None)
+
+    def is_active(self, telegram_id: str) -> Optional[bool]:
+        """
+        Проверяет активность подписки по кэшу.
+        Возвращает None, если записи нет и ответ нужно получить из базы.
+        """
+        entry = self.get(telegram_id)
+        if entry is None:
+            return None
+        if entry.status != SubscriptionStatus.PAID:
+            return False
+        # Статус в базе обновляет периодическая задача, срок проверяется здесь
+        return not (entry.expiry and entry.expiry < datetime.utcnow())
+
+    def stats(self) -> dict:
+        """Статистика попаданий в кэш."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+auth_cache = AuthCache(AUTH_CACHE_TTL, AUTH_CACHE_SIZE)
@@ -0,0 +1,114 @@
+"""
+Сравнение задержек обработки запросов при синхронном и асинхронном доступе к БД.
+
+Имитирует 200 одновременных пользователей: большинство открывает карточки
+товаров (быстрый запрос по ID), часть выполняет поиск по названию (полный
+просмотр таблицы через ilike). В синхронном режиме запросы выполняются прямо
+в цикле событий (как раньше делали обработчики), в асинхронном - через
+repository (aiosqlite).
+
+Запуск: python benchmarks/async_db_benchmark.py [количество_товаров]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_FILE}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import SessionLocal, AsyncSessionLocal, engine, async_engine
+from models import Base, Category, Product
+import catalog
+import search
+import repository
+
+USERS = 200
+REQUESTS_PER_USER = 5
+SEARCH_SHARE = 0.05
+TERMS = ["Диван", "Кресло", "Пуф", "Кровать", "Угловой", "Комфорт"]
+
+def fill_database(products_count):
+    """Создает тестовый каталог."""
+    Base.metadata.create_all(engine)
+    db = SessionLocal()
+    categories = [Category(name=name) for name in ("Диваны", "Кресла", "Пуфы", "Кровати")]
+    db.add_all(categories)
+    db.flush()
+    db.add_all([
+        Product(
+            product_code=f"B{i:06d}",
+            category_id=categories[i % len(categories)].id,
+            name=f"{random.choice(TERMS)} модель {i}",
+            description="Тестовый товар",
+            price=float(random.randint(1000, 100000)),
+            manufacturer=f"Фабрика {i % 50}",
+            city=f"Город {i % 20}",
+        )
+        for i in range(products_count)
+    ])
+    db.commit()
+    db.close()
+
+def random_search_term(products_count):
+    """Редкое название: поиск просматривает всю таблицу, но находит мало строк."""
+    return f"модель {random.randrange(products_count)}"
+
+async def sync_request(is_search, value):
+    db = SessionLocal()
+    try:
+        if is_search:
+            search.search_by_name(db, value)
+        else:
+            catalog.get_product_by_id(db, value)
+    finally:
+        db.close()
+
+async def async_request(is_search, value):
+    async with AsyncSessionLocal() as db:
+        if is_search:
+            await repository.search_by_name(db, value)
+        else:
+            await repository.get_product_by_id(db, value)
+
+async def simulate_user(request, products_count, latencies):
+    for _ in range(REQUESTS_PER_USER):
+        # Задержка считается от момента "прихода" запроса, поэтому учитывает
+        # и время ожидания, пока цикл событий занят чужими запросами
+        delay = random.random() * 2
+        arrived = time.perf_counter() + delay
+        await asyncio.sleep(delay)
+        is_search = random.random() < SEARCH_SHARE
+        value = random_search_term(products_count) if is_search else random.randint(1, products_count)
+        await request(is_search, value)
+        latencies["search" if is_search else "card"].append(time.perf_counter() - arrived)
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)] * 1000
+
+async def run_mode(name, request, products_count):
+    latencies = {"card": [], "search": []}
+    started = time.perf_counter()
+    await asyncio.gather(*(simulate_user(request, products_count, latencies) for _ in range(USERS)))
+    total = time.perf_counter() - started
+    for kind, values in latencies.items():
+        print(
+            f"{name:<6} {kind:<7} p50={percentile(values, 0.5):8.1f} мс  "
+            f"p99={percentile(values, 0.99):8.1f} мс  запросов={len(values)}"
+        )
+    print(f"{name:<6} всего {total:.2f} с")
+
+async def main():
+    products_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    fill_database(products_count)
+    print(f"Товаров: {products_count}, пользователей: {USERS}, запросов на пользователя: {REQUESTS_PER_USER}")
+    await run_mode("sync", sync_request, products_count)
+    await run_mode("async", async_request, products_count)
+    await async_engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,65 @@
+"""
+Стоимость маршрутизации нажатий кнопок в зависимости от количества экранов.
+
+Сравниваются два способа: прежний - последовательная проверка регулярных
+выражений CallbackQueryHandler и разбор callback_data через split, и
+CallbackRouter - декодирование callback_data и поиск обработчика в словаре.
+Для каждого количества экранов выводится среднее время разбора одного нажатия.
+
+Запуск: python benchmarks/callback_router_benchmark.py [--clicks 20000]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from callbacks import encode, decode
+
+SCREEN_COUNTS = (10, 25, 50, 100, 200)
+
+def regex_routes(screens):
+    """Обработчики с шаблонами вида ^screen<N>_\\d+_\\d+$, проверяемые по порядку."""
+    return [(re.compile(rf"^screen{n}_\d+_\d+$"), n) for n in range(screens)]
+
+def route_regex(routes, data):
+    for pattern, handler in routes:
+        if pattern.match(data):
+            return handler, [int(arg) for arg in data.split("_")[1:]]
+    return None, []
+
+def route_table(routes, data):
+    decoded = decode(data)
+    if decoded is None:
+        return None, ()
+    view, args = decoded
+    return routes.get(view), args
+
+def measure(route, routes, clicks):
+    started = time.perf_counter()
+    for data in clicks:
+        route(routes, data)
+    return (time.perf_counter() - started) / len(clicks) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clicks", type=int, default=20000, help="Нажатий на каждое измерение")
+    args = parser.parse_args()
+
+    print(f"{'экранов':>8} {'регулярные выражения, мкс':>27} {'CallbackRouter, мкс':>21}")
+    for screens in SCREEN_COUNTS:
+        views = [random.randrange(screens) for _ in range(args.clicks)]
+        arguments = [(random.randrange(1000), random.randrange(100000)) for _ in range(args.clicks)]
+        legacy = [f"screen{view}_{a}_{b}" for view, (a, b) in zip(views, arguments)]
+        # Номер экрана в callback_data занимает один байт
+        encoded = [encode(view + 1, a, b) for view, (a, b) in zip(views, arguments)]
+
+        regex_time = measure(route_regex, regex_routes(screens), legacy)
+        table_time = measure(route_table, {n + 1: n for n in range(screens)}, encoded)
+        print(f"{screens:>8} {regex_time:>27.2f} {table_time:>21.2f}")
+
+if __name__ == "__main__":
+    main()
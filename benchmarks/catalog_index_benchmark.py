@@ -0,0 +1,123 @@
+"""
+Сравнение поиска через SQL (search.py) и через индекс каталога в памяти.
+
+Для каждого вида запроса выполняется одинаковый набор случайных фильтров
+обоими способами; результаты сверяются по списку id товаров, затем
+выводится среднее время одного запроса.
+
+Запуск: python benchmarks/catalog_index_benchmark.py [количество_товаров]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_FILE}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import SessionLocal, engine
+from models import Base, Category, Product
+from migrations import run_migrations
+from catalog import get_catalog_version
+from catalog_index import CatalogIndex
+import search
+
+QUERIES_PER_KIND = 50
+FORMS = ["прямой", "угловой", "П-образный", None]
+MECHANISMS = ["еврокнижка", "дельфин", "книжка", None]
+FILLINGS = ["пенополиуретан", "латекс", "пружинный блок", None]
+
+def fill_database(products_count):
+    """Создает тестовый каталог."""
+    Base.metadata.create_all(engine)
+    run_migrations()
+    db = SessionLocal()
+    categories = [Category(name=name) for name in ("Диваны", "Кресла", "Пуфы", "Кровати")]
+    db.add_all(categories)
+    db.flush()
+    db.add_all([
+        Product(
+            product_code=f"B{i:06d}",
+            category_id=categories[i % len(categories)].id,
+            name=f"Товар {i}",
+            description="Тестовый товар",
+            price=float(random.randint(1000, 100000)),
+            manufacturer=f"Фабрика {i % 50}",
+            city=f"Город {i % 20}",
+            form=random.choice(FORMS),
+            mechanism=random.choice(MECHANISMS),
+            filling=random.choice(FILLINGS),
+            lifting_mechanism=random.choice([True, False, None]),
+            has_box=random.choice([True, False, None]),
+        )
+        for i in range(products_count)
+    ])
+    db.commit()
+    db.close()
+
+def random_filters():
+    """Случайная комбинация фильтров расширенного поиска."""
+    filters = {"category_id": random.randint(1, 4), "max_price": float(random.randint(5000, 100000))}
+    if random.random() < 0.5:
+        filters["form"] = random.choice(FORMS[:-1])
+    if random.random() < 0.5:
+        filters["mechanism"] = random.choice(MECHANISMS[:-1])
+    if random.random() < 0.3:
+        filters["filling"] = random.choice(FILLINGS[:-1])
+    if random.random() < 0.3:
+        filters["lifting_mechanism"] = random.choice([True, False])
+    if random.random() < 0.3:
+        filters["has_box"] = random.choice([True, False])
+    return filters
+
+def measure(run, arguments):
+    """Выполняет запросы и возвращает среднее время (мс) и результаты."""
+    results = []
+    started = time.perf_counter()
+    for args, kwargs in arguments:
+        results.append([product.id for product in run(*args, **kwargs)])
+    return (time.perf_counter() - started) * 1000 / len(arguments), results
+
+def main():
+    products_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    fill_database(products_count)
+    db = SessionLocal()
+
+    started = time.perf_counter()
+    index = CatalogIndex.load(db, get_catalog_version(db))
+    print(f"Товаров: {products_count}, построение индекса: {(time.perf_counter() - started) * 1000:.0f} мс")
+
+    kinds = {
+        "цена": (
+            lambda *a, **k: search.search_by_price(db, *a, **k), index.search_by_price,
+            [((float(random.randint(1000, 20000)),), {}) for _ in range(QUERIES_PER_KIND)],
+        ),
+        "производитель": (
+            lambda *a, **k: search.search_by_manufacturer(db, *a, **k), index.search_by_manufacturer,
+            [((random.randint(1, 50),), {}) for _ in range(QUERIES_PER_KIND)],
+        ),
+        "город": (
+            lambda *a, **k: search.search_by_city(db, *a, **k), index.search_by_city,
+            [((random.randint(1, 20),), {}) for _ in range(QUERIES_PER_KIND)],
+        ),
+        "расширенный": (
+            lambda *a, **k: search.advanced_search(db, *a, **k), index.advanced_search,
+            [((), random_filters()) for _ in range(QUERIES_PER_KIND)],
+        ),
+    }
+    for name, (sql_run, index_run, arguments) in kinds.items():
+        sql_ms, sql_results = measure(sql_run, arguments)
+        index_ms, index_results = measure(index_run, arguments)
+        # Порядок товаров с одинаковой ценой в SQL не определен, поэтому
+        # сравниваются множества id
+        same = all(set(a) == set(b) for a, b in zip(sql_results, index_results))
+        print(
+            f"{name:<14} SQL {sql_ms:8.2f} мс  индекс {index_ms:8.2f} мс  "
+            f"ускорение x{sql_ms / index_ms:6.1f}  результаты {'совпадают' if same else 'РАЗЛИЧАЮТСЯ'}"
+        )
+    db.close()
+
+if __name__ == "__main__":
+    main()
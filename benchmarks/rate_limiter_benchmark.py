@@ -0,0 +1,89 @@
+"""
+Проверка ограничителя исходящих запросов на имитации Bot API.
+
+Сценарий: идет рассылка (BULK) по --bulk чатам, и во время нее пользователи
+делают --interactive запросов (INTERACTIVE). Имитация отвечает 429 (RetryAfter),
+если общий лимит Telegram превышен. Выводится время ожидания запросов каждого
+приоритета, количество ответов 429 и фактическая частота отправки.
+
+Запуск: python benchmarks/rate_limiter_benchmark.py [--bulk 300] [--interactive 30] [--rate 30]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.error import RetryAfter
+from rate_limiter import PriorityRateLimiter, INTERACTIVE, BULK, get_rate_limiter_stats
+
+class FakeTelegram:
+    """Отвечает 429, если за последнюю секунду было больше limit запросов."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.sent = deque()
+        self.rejected = 0
+        self.total = 0
+
+    async def send(self):
+        now = time.monotonic()
+        while self.sent and now - self.sent[0] >= 1:
+            self.sent.popleft()
+        if len(self.sent) >= self.limit:
+            self.rejected += 1
+            raise RetryAfter(1)
+        self.sent.append(now)
+        self.total += 1
+        return True
+
+async def request(limiter, fake, chat_id, priority, waits):
+    started = time.perf_counter()
+    await limiter.process_request(fake.send, (), {}, "sendMessage", {"chat_id": chat_id}, priority)
+    waits.append(time.perf_counter() - started)
+
+def describe(name, waits):
+    waits = sorted(waits)
+    print(
+        f"{name:<12} запросов {len(waits):4d}: ожидание среднее {sum(waits) / len(waits):6.3f} с, "
+        f"95% {waits[int(len(waits) * 0.95) - 1]:6.3f} с, максимум {waits[-1]:6.3f} с"
+    )
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bulk", type=int, default=300, help="Чатов в рассылке")
+    parser.add_argument("--interactive", type=int, default=30, help="Ответов пользователям во время рассылки")
+    parser.add_argument("--rate", type=float, default=30, help="Общий лимит ограничителя, запросов в секунду")
+    parser.add_argument("--telegram-limit", type=int, default=30, help="Лимит имитации Telegram, запросов в секунду")
+    args = parser.parse_args()
+
+    fake = FakeTelegram(args.telegram_limit)
+    limiter = PriorityRateLimiter(overall_rate=args.rate)
+    await limiter.initialize()
+
+    bulk_waits, interactive_waits = [], []
+    started = time.perf_counter()
+    bulk = [
+        asyncio.create_task(request(limiter, fake, 100000 + i, BULK, bulk_waits))
+        for i in range(args.bulk)
+    ]
+    # Пользователи пишут боту равномерно в течение первой половины рассылки
+    interval = args.bulk / args.rate / 2 / max(1, args.interactive)
+    interactive = []
+    for i in range(args.interactive):
+        await asyncio.sleep(interval)
+        interactive.append(asyncio.create_task(request(limiter, fake, 1 + i, INTERACTIVE, interactive_waits)))
+    await asyncio.gather(*bulk, *interactive)
+    elapsed = time.perf_counter() - started
+    await limiter.shutdown()
+
+    describe("interactive", interactive_waits)
+    describe("bulk", bulk_waits)
+    print(f"Отправлено {fake.total} за {elapsed:.1f} с ({fake.total / elapsed:.1f} в секунду), ответов 429: {fake.rejected}")
+    print(get_rate_limiter_stats())
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,231 @@
+"""
+Сравнение пропускной способности режимов polling и webhook на имитации Telegram.
+
+Скрипт поднимает локальный сервер, изображающий Bot API, и запускает бота
+(main.py) в отдельном процессе с TELEGRAM_API_URL, указывающим на этот сервер.
+Затем боту доставляется один и тот же набор обновлений:
+- polling: обновления отдаются в ответ на getUpdates;
+- webhook: обновления отправляются POST-запросами на адрес webhook бота
+  с секретом в заголовке, не более --connections запросов одновременно.
+
+Измеряется время от выдачи первого обновления до получения ответов бота
+на все обновления.
+
+По умолчанию используются синтетические обновления: команды /start и /about
+от разных пользователей. Записанные обновления можно передать через --updates
+(файл JSONL, по одному объекту Update на строку).
+
+Запуск: python benchmarks/webhook_benchmark.py [--updates N] [--modes polling webhook]
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+import tornado.web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = "123456:BENCHMARK"
+SECRET = "benchmark-secret"
+# Имя переменной окружения, из которой config.py читает токен
+TOKEN_ENV = "7467352806:AAHNd_kgcvuSDo5UkEFn53kNpJcRCke9DZo"
+# Методы Bot API, которыми бот отвечает пользователю
+REPLY_METHODS = {"sendMessage", "editMessageText", "sendPhoto", "editMessageMedia"}
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def synthetic_updates(count):
+    """
+    Команды /start и /about, каждая от нового пользователя: повторный /start
+    внутри начатого диалога бот не обрабатывает, и ответа на него не будет.
+    """
+    updates = []
+    for i in range(count):
+        user_id = 100000 + i
+        text = "/start" if i % 2 == 0 else "/about"
+        updates.append({
+            "update_id": i + 1,
+            "message": {
+                "message_id": i + 1,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "Тест"},
+                "text": text,
+                "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}],
+            },
+        })
+    return updates
+
+class FakeTelegram:
+    """Состояние имитации Bot API."""
+
+    def __init__(self):
+        self.pending = []
+        self.new_updates = asyncio.Event()
+        self.replies = 0
+        self.replied = asyncio.Event()
+        self.expected = 0
+        self.ready = asyncio.Event()
+        self.webhook_url = None
+        self.message_id = 0
+
+    def fake_message(self, chat_id):
+        self.message_id += 1
+        return {
+            "message_id": self.message_id, "date": int(time.time()),
+            "chat": {"id": int(chat_id or 1), "type": "private"},
+            "from": {"id": 123456, "is_bot": True, "first_name": "bot"}, "text": "ok",
+        }
+
+class BotApiHandler(tornado.web.RequestHandler):
+    def initialize(self, fake):
+        self.fake = fake
+
+    def argument(self, name, default=None):
+        value = self.get_body_argument(name, None)
+        if value is None and self.request.headers.get("Content-Type", "").startswith("application/json"):
+            value = json.loads(self.request.body or b"{}").get(name)
+        return default if value is None else value
+
+    async def post(self, token, method):
+        fake = self.fake
+        if method == "getMe":
+            result = {"id": 123456, "is_bot": True, "first_name": "bot", "username": "bench_bot"}
+        elif method == "getUpdates":
+            fake.ready.set()
+            offset = int(self.argument("offset", 0))
+            timeout = float(self.argument("timeout", 0))
+            fake.pending = [u for u in fake.pending if u["update_id"] >= offset]
+            if not fake.pending and timeout:
+                fake.new_updates.clear()
+                try:
+                    await asyncio.wait_for(fake.new_updates.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            limit = int(self.argument("limit", 100))
+            result = [u for u in fake.pending if u["update_id"] >= offset][:limit]
+        elif method == "setWebhook":
+            fake.webhook_url = self.argument("url")
+            result = True
+        elif method in REPLY_METHODS:
+            result = fake.fake_message(self.argument("chat_id"))
+            fake.replies += 1
+            if fake.replies >= fake.expected:
+                fake.replied.set()
+        elif method in ("deleteWebhook", "answerCallbackQuery", "deleteMessage", "setMyCommands"):
+            result = True
+        else:
+            result = fake.fake_message(self.argument("chat_id"))
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps({"ok": True, "result": result}))
+
+def start_bot(mode, api_port, webhook_port, db_path):
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        DATABASE_URL=f"sqlite:///{db_path}",
+        TELEGRAM_API_URL=f"http://127.0.0.1:{api_port}",
+        BOT_MODE=mode,
+        WEBHOOK_URL=f"http://127.0.0.1:{webhook_port}",
+        WEBHOOK_LISTEN="127.0.0.1",
+        WEBHOOK_PORT=str(webhook_port),
+        WEBHOOK_SECRET_TOKEN=SECRET,
+        # Измеряется пропускная способность бота, а не лимит Telegram
+        RATE_LIMIT_OVERALL="0",
+    )
+    env[TOKEN_ENV] = TOKEN
+    return subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "main.py")],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+async def wait_webhook_ready(webhook_port):
+    """Ждет, пока сервер webhook ответит на проверку работоспособности."""
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                response = await client.get(f"http://127.0.0.1:{webhook_port}/health")
+                if response.status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+
+async def deliver_webhook(fake, updates, connections):
+    """Отправляет обновления на адрес webhook, как это делает Telegram."""
+    semaphore = asyncio.Semaphore(connections)
+    limits = httpx.Limits(max_connections=connections)
+    async with httpx.AsyncClient(limits=limits) as client:
+        async def post(update):
+            async with semaphore:
+                response = await client.post(
+                    fake.webhook_url, json=update,
+                    headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}
+                )
+                response.raise_for_status()
+        await asyncio.gather(*(post(update) for update in updates))
+
+async def run_mode(mode, updates, connections):
+    fake = FakeTelegram()
+    fake.expected = len(updates)
+    api_port, webhook_port = free_port(), free_port()
+    server = tornado.web.Application([(r"/bot([^/]+)/(\w+)", BotApiHandler, {"fake": fake})]).listen(api_port)
+
+    # Каждый режим работает с чистой копией базы
+    db_path = os.path.join(tempfile.mkdtemp(), "catalog.db")
+    shutil.copy(os.path.join(ROOT, "data", "catalog.db"), db_path)
+    bot = start_bot(mode, api_port, webhook_port, db_path)
+    try:
+        if mode == "webhook":
+            await asyncio.wait_for(wait_webhook_ready(webhook_port), 60)
+        else:
+            await asyncio.wait_for(fake.ready.wait(), 60)
+
+        started = time.perf_counter()
+        if mode == "webhook":
+            await deliver_webhook(fake, updates, connections)
+        else:
+            fake.pending.extend(updates)
+            fake.new_updates.set()
+        await asyncio.wait_for(fake.replied.wait(), 300)
+        elapsed = time.perf_counter() - started
+        print(f"{mode:<8} обновлений {len(updates)}: {elapsed:6.2f} с, {len(updates) / elapsed:7.1f} обновлений/с")
+    finally:
+        bot.send_signal(signal.SIGINT)
+        try:
+            bot.wait(30)
+        except subprocess.TimeoutExpired:
+            bot.kill()
+        # Завершаем незаконченный long polling остановленного бота
+        fake.new_updates.set()
+        await asyncio.sleep(0)
+        server.stop()
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", default="1000", help="Количество синтетических обновлений или файл JSONL")
+    parser.add_argument("--modes", nargs="+", default=["polling", "webhook"], choices=["polling", "webhook"])
+    parser.add_argument("--connections", type=int, default=40, help="Одновременных запросов webhook")
+    args = parser.parse_args()
+
+    if args.updates.isdigit():
+        updates = synthetic_updates(int(args.updates))
+    else:
+        with open(args.updates, encoding="utf-8") as f:
+            updates = [json.loads(line) for line in f if line.strip()]
+
+    for mode in args.modes:
+        await run_mode(mode, updates, args.connections)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,204 @@
+"""
+Рассылки сообщений подписчикам (например, о поступлении новых товаров).
+
+Рассылка создается записью в таблице broadcasts (из программы управления
+каталогом или функцией create_broadcast) и выполняется ботом в фоне:
+- получатели - пользователи с оплаченной действующей подпиской - выбираются
+  порциями по индексу (subscription_status, id) в порядке id;
+- сообщения отправляются с приоритетом BULK: ограничитель запросов
+  пропускает ответы пользователям вперед рассылки;
+- фото загружается в Telegram один раз, остальным получателям отправляется
+  его file_id;
+- после каждой порции в рассылке сохраняются счетчики и id последнего
+  получателя, поэтому после перезапуска бота рассылка продолжается с места
+  остановки (получатели прерванной порции могут получить сообщение повторно).
+
+Пользователи, заблокировавшие бота, помечаются неактивными и в следующие
+рассылки не попадают, пока снова не начнут работу с ботом.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from telegram import Bot
+from telegram.error import Forbidden, TelegramError
+from database import session_scope, get_session
+from image_cache import send_photo_cached
+from models import Broadcast, BroadcastStatus, User, SubscriptionStatus
+from rate_limiter import BULK
+from config import BROADCAST_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# id рассылки -> задача, выполняющая ее в текущем процессе
+_running: Dict[int, asyncio.Task] = {}
+
+DELIVERED, FAILED, BLOCKED = "delivered", "failed", "blocked"
+
+def create_broadcast(db: Session, text: str, image_path: Optional[str] = None) -> Broadcast:
+    """Создает рассылку; бот начнет ее при следующей проверке."""
+    broadcast = Broadcast(text=text, image_path=image_path or None)
+    db.add(broadcast)
+    db.commit()
+    db.refresh(broadcast)
+    return broadcast
+
+def get_unfinished_broadcast_ids(db: Session) -> List[int]:
+    """Возвращает id новых и прерванных рассылок в порядке создания."""
+    rows = db.query(Broadcast.id).filter(
+        Broadcast.status.in_([BroadcastStatus.PENDING, BroadcastStatus.RUNNING])
+    ).order_by(Broadcast.id).all()
+    return [row.id for row in rows]
+
+def start_broadcast(db: Session, broadcast_id: int) -> Optional[Broadcast]:
+    """Отмечает рассылку выполняющейся. Возвращает None, если ее отменили или она завершена."""
+    broadcast = db.query(Broadcast).filter(Broadcast.id == broadcast_id).first()
+    if broadcast is None or broadcast.status not in (BroadcastStatus.PENDING, BroadcastStatus.RUNNING):
+        return None
+    if broadcast.status == BroadcastStatus.PENDING:
+        broadcast.status = BroadcastStatus.RUNNING
+        broadcast.started_at = datetime.utcnow()
+        db.commit()
+        db.refresh(broadcast)
+    return broadcast
+
+def get_recipients(db: Session, after_user_id: int, limit: int) -> List[Tuple[int, str]]:
+    """Следующая порция получателей: (id пользователя, telegram_id) с id больше after_user_id."""
+    return db.query(User.id, User.telegram_id).filter(
+        User.subscription_status == SubscriptionStatus.PAID,
+        User.id > after_user_id,
+        User.is_active != False,
+        or_(User.subscription_expiry.is_(None), User.subscription_expiry > datetime.utcnow()),
+    ).order_by(User.id).limit(limit).all()
+
+def save_progress(db: Session, broadcast_id: int, last_user_id: int, counts: Dict[str, int],
+                  blocked_user_ids: List[int], finished: bool) -> BroadcastStatus:
+    """
+    Сохраняет контрольную точку рассылки и помечает заблокировавших бота
+    пользователей. Возвращает статус рассылки (ее могли отменить).
+    """
+    broadcast = db.query(Broadcast).filter(Broadcast.id == broadcast_id).first()
+    broadcast.last_user_id = last_user_id
+    broadcast.delivered += counts[DELIVERED]
+    broadcast.failed += counts[FAILED]
+    broadcast.blocked += counts[BLOCKED]
+    if blocked_user_ids:
+        db.query(User).filter(User.id.in_(blocked_user_ids)).update({User.is_active: False}, synchronize_session=False)
+    if finished and broadcast.status == BroadcastStatus.RUNNING:
+        broadcast.status = BroadcastStatus.DONE
+        broadcast.finished_at = datetime.utcnow()
+    db.commit()
+    return broadcast.status
+
+async def _send(bot: Bot, chat_id: str, text: str, photo: Optional[str]) -> Tuple[str, Optional[str]]:
+    """
+    Отправляет сообщение рассылки одному получателю.
+    photo - путь к файлу (фото еще не загружено) или file_id.
+
+    Returns:
+        tuple: (результат, file_id отправленного фото)
+    """
+    try:
+        if photo is None:
+            await bot.send_message(chat_id, text, rate_limit_args=BULK)
+            return DELIVERED, None
+        if os.path.isfile(photo):
+            # Кэш file_id использует свою короткую сессию: загрузка фото
+            # выполняется один раз, дальше рассылка отправляет file_id без сессии
+            async with session_scope():
+                sent = await send_photo_cached(bot, chat_id, photo, caption=text, rate_limit_args=BULK)
+        else:
+            sent = await bot.send_photo(chat_id, photo=photo, caption=text, rate_limit_args=BULK)
+        return DELIVERED, sent.photo[-1].file_id
+    except Forbidden:
+        return BLOCKED, None
+    except TelegramError as e:
+        logger.debug("Рассылка: не удалось отправить сообщение в чат %s: %s", chat_id, e)
+        return FAILED, None
+
+async def run_broadcast(bot: Bot, broadcast_id: int):
+    """Выполняет рассылку с последней контрольной точки."""
+    async with session_scope():
+        broadcast = await get_session().run_sync(start_broadcast, broadcast_id)
+    if broadcast is None:
+        return
+
+    photo = broadcast.image_path
+    if photo and not os.path.isfile(photo):
+        logger.warning("Рассылка %d: изображение %s не найдено, отправляется только текст", broadcast_id, photo)
+        photo = None
+    last_user_id = broadcast.last_user_id
+    logger.info("Рассылка %d: отправка с получателя после id %d", broadcast_id, last_user_id)
+
+    while True:
+        # Сессия не остается открытой во время отправки: иначе соединение из пула
+        # и транзакция чтения SQLite удерживаются на все время отправки порции
+        async with session_scope():
+            recipients = await get_session().run_sync(get_recipients, last_user_id, BROADCAST_CHUNK_SIZE)
+
+        counts = {DELIVERED: 0, FAILED: 0, BLOCKED: 0}
+        blocked_user_ids = []
+        pending = list(recipients)
+        # Пока фото не загружено, получатели обрабатываются по одному:
+        # загрузка выполняется один раз, остальные получают file_id
+        while pending and photo is not None and os.path.isfile(photo):
+            user_id, telegram_id = pending.pop(0)
+            result, file_id = await _send(bot, telegram_id, broadcast.text, photo)
+            counts[result] += 1
+            if result == BLOCKED:
+                blocked_user_ids.append(user_id)
+            if file_id is not None:
+                photo = file_id
+        results = await asyncio.gather(*(
+            _send(bot, telegram_id, broadcast.text, photo) for _, telegram_id in pending
+        ))
+        for (user_id, _), (result, _) in zip(pending, results):
+            counts[result] += 1
+            if result == BLOCKED:
+                blocked_user_ids.append(user_id)
+
+        if recipients:
+            last_user_id = recipients[-1][0]
+        async with session_scope():
+            status = await get_session().run_sync(
+                save_progress, broadcast_id, last_user_id, counts, blocked_user_ids,
+                len(recipients) < BROADCAST_CHUNK_SIZE
+            )
+        if status != BroadcastStatus.RUNNING:
+            break
+
+    async with session_scope():
+        broadcast = await get_session().run_sync(
+            lambda db: db.query(Broadcast).filter(Broadcast.id == broadcast_id).first()
+        )
+    logger.info(
+        "Рассылка %d %s: доставлено %d, ошибок %d, заблокировали бота %d",
+        broadcast_id, "завершена" if status == BroadcastStatus.DONE else "отменена",
+        broadcast.delivered, broadcast.failed, broadcast.blocked
+    )
+
+async def dispatch_broadcasts(bot: Bot):
+    """Запускает в фоне новые и прерванные рассылки, которые еще не выполняются."""
+    async with session_scope():
+        broadcast_ids = await get_session().run_sync(get_unfinished_broadcast_ids)
+    for broadcast_id in broadcast_ids:
+        if broadcast_id in _running:
+            continue
+        task = asyncio.create_task(run_broadcast(bot, broadcast_id))
+        _running[broadcast_id] = task
+        task.add_done_callback(lambda done, broadcast_id=broadcast_id: _finished(broadcast_id, done))
+
+def _finished(broadcast_id: int, task: asyncio.Task):
+    _running.pop(broadcast_id, None)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Рассылка %d прервана ошибкой", broadcast_id, exc_info=task.exception())
+
+async def stop_broadcasts():
+    """Останавливает рассылки; они продолжатся после перезапуска с контрольной точки."""
+    tasks = list(_running.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,187 @@
+"""
+Компактные callback_data кнопок и маршрутизация нажатий.
+
+Telegram ограничивает callback_data 64 байтами. Кнопка кодирует номер экрана
+(View) и короткий список аргументов - целых чисел, чисел с плавающей точкой
+и строк из реестра VALUES - в байты, записанные в base64url:
+- первый байт - версия формата, второй - номер экрана;
+- каждый аргумент - varint, младшие два бита которого задают тип: целое
+  (zigzag), целое значение float, float (за ним 8 байт) или номер строки
+  в VALUES.
+
+Нажатия обрабатывает один CallbackRouter: он декодирует callback_data и находит
+обработчик экрана в словаре, поэтому стоимость разбора не зависит от количества
+экранов. Аргументы передаются обработчику в context.args, как аргументы команд.
+Кнопки, которые не удалось декодировать (сообщения прежних версий бота),
+обрабатывает отдельный обработчик.
+"""
+import base64
+import struct
+from enum import IntEnum
+from typing import Callable, Dict, Optional, Tuple
+from telegram import Update, InlineKeyboardButton
+from telegram.ext import BaseHandler
+
+# Версия формата callback_data
+FORMAT_VERSION = 1
+
+# Ограничение Telegram на длину callback_data
+MAX_CALLBACK_DATA = 64
+
+class View(IntEnum):
+    """Экраны, открываемые кнопками. Номера хранятся в отправленных сообщениях и не меняются."""
+    MAIN_MENU = 1
+    CATALOG = 2
+    SEARCH = 3
+    ABOUT = 4
+    PROFILE = 5
+    SUBSCRIPTION = 6
+    CATEGORY = 7
+    CATEGORY_PRODUCTS = 8
+    CATEGORY_SEARCH = 9
+    CATEGORY_PAGE = 10
+    CATALOG_PRODUCT = 11
+    QUICK_SEARCH_PRICE = 12
+    QUICK_SEARCH_MANUFACTURER = 13
+    QUICK_SEARCH_CITY = 14
+    QUICK_SEARCH_NAME = 15
+    QUICK_SEARCH_CODE = 16
+    SEARCH_CHOICE = 17
+    SEARCH_PAGE = 18
+    SEARCH_PRODUCT = 19
+    BACK_TO_RESULTS = 20
+    SUBSCRIBE = 21
+    PAYMENT = 22
+    PAYMENT_CONFIRMED = 23
+    CANCEL_SUBSCRIPTION = 24
+    CONFIRM_CANCEL = 25
+
+# Реестр строковых аргументов: в callback_data записывается номер строки.
+# Номера хранятся в отправленных сообщениях, поэтому новые строки
+# добавляются только в конец
+VALUES = (
+    "price", "manufacturer", "city",
+    "MONTH", "YEAR",
+    "card", "sbp",
+)
+
+_value_ids = {value: number for number, value in enumerate(VALUES)}
+
+# Тип аргумента - младшие два бита varint
+_INT, _WHOLE_FLOAT, _FLOAT, _STRING = range(4)
+
+_FLOAT_FORMAT = struct.Struct("<d")
+
+def _zigzag(value: int) -> int:
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+def _unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+def _write_varint(data: bytearray, value: int):
+    while value > 0x7F:
+        data.append(value & 0x7F | 0x80)
+        value >>= 7
+    data.append(value)
+
+def _read_varint(data: bytes, position: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, position
+        shift += 7
+
+def encode(view: View, *args) -> str:
+    """
+    Кодирует экран и аргументы в callback_data.
+
+    Raises:
+        ValueError: Если строки нет в VALUES или данные длиннее 64 байт
+    """
+    data = bytearray((FORMAT_VERSION, view))
+    for arg in args:
+        if isinstance(arg, str):
+            if arg not in _value_ids:
+                raise ValueError(f"Строка {arg!r} не зарегистрирована в callbacks.VALUES")
+            _write_varint(data, _value_ids[arg] << 2 | _STRING)
+        elif isinstance(arg, float):
+            if arg.is_integer():
+                _write_varint(data, _zigzag(int(arg)) << 2 | _WHOLE_FLOAT)
+            else:
+                _write_varint(data, _FLOAT)
+                data += _FLOAT_FORMAT.pack(arg)
+        else:
+            _write_varint(data, _zigzag(int(arg)) << 2 | _INT)
+    callback_data = base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+    if len(callback_data) > MAX_CALLBACK_DATA:
+        raise ValueError(f"callback_data длиннее {MAX_CALLBACK_DATA} байт: {view!r}{args}")
+    return callback_data
+
+def decode(callback_data: str) -> Optional[Tuple[int, tuple]]:
+    """Декодирует callback_data в (номер экрана, аргументы) или возвращает None, если формат неизвестен."""
+    try:
+        data = base64.urlsafe_b64decode(callback_data + "=" * (-len(callback_data) % 4))
+    except ValueError:
+        return None
+    if len(data) < 2 or data[0] != FORMAT_VERSION:
+        return None
+    args = []
+    position = 2
+    try:
+        while position < len(data):
+            value, position = _read_varint(data, position)
+            kind, value = value & 3, value >> 2
+            if kind == _INT:
+                args.append(_unzigzag(value))
+            elif kind == _WHOLE_FLOAT:
+                args.append(float(_unzigzag(value)))
+            elif kind == _FLOAT:
+                args.append(_FLOAT_FORMAT.unpack_from(data, position)[0])
+                position += _FLOAT_FORMAT.size
+            else:
+                args.append(VALUES[value])
+    except (IndexError, struct.error):
+        return None
+    return data[1], tuple(args)
+
+def callback_button(text: str, view: View, *args) -> InlineKeyboardButton:
+    """Кнопка, открывающая экран view с аргументами args."""
+    return InlineKeyboardButton(text, callback_data=encode(view, *args))
+
+class CallbackRouter(BaseHandler):
+    """
+    Обработчик всех нажатий кнопок: передает нажатие обработчику экрана
+    из routes, аргументы кнопки - в context.args.
+
+    Args:
+        routes: Экран -> обработчик
+        expired: Обработчик кнопок с неизвестным форматом или экраном
+    """
+
+    def __init__(self, routes: Dict[View, Callable], expired: Callable):
+        super().__init__(expired)
+        self.routes = {int(view): callback for view, callback in routes.items()}
+        self.expired = expired
+
+    def check_update(self, update: object) -> Optional[Tuple[Callable, tuple]]:
+        if not isinstance(update, Update) or update.callback_query is None:
+            return None
+        callback_data = update.callback_query.data
+        if not isinstance(callback_data, str):
+            return None
+        decoded = decode(callback_data)
+        if decoded is None:
+            return self.expired, ()
+        view, args = decoded
+        return self.routes.get(view, self.expired), args
+
+    def collect_additional_context(self, context, update, application, check_result):
+        context.args = list(check_result[1])
+
+    async def handle_update(self, update, application, check_result, context):
+        self.collect_additional_context(context, update, application, check_result)
+        # Возвращаемое значение - новое состояние ConversationHandler
+        return await check_result[0](update, context)
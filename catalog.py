@@ -1,5 +1,8 @@
+import os
 from sqlalchemy.orm import Session
-from models import Product, Category, City
+from database import DATABASE_DIR
+from image_ingest import resolve_image_path
+from models import Product, Category, City, Manufacturer, CatalogState
 from typing import List, Dict, Any, Optional
 
 def get_all_categories(db: Session) -> List[Category]:
@@ -30,28 +33,51 @@ def get_city_by_id(db: Session, city_id: int) -> Optional[City]:
     """Получает город по ID."""
     return db.query(City).filter(City.id == city_id).first()
 
-def get_products_by_city(db: Session, city: str) -> List[Product]:
+def get_manufacturer_by_id(db: Session, manufacturer_id: int) -> Optional[Manufacturer]:
+    """Получает производителя по ID."""
+    return db.query(Manufacturer).filter(Manufacturer.id == manufacturer_id).first()
+
+def get_products_by_city(db: Session, city_id: int) -> List[Product]:
     """Получает список товаров, производимых в указанном городе."""
-    return db.query(Product).filter(Product.city.ilike(f"%{city}%")).all()
+    return db.query(Product).filter(Product.city_id == city_id).all()
 
-def get_products_by_manufacturer(db: Session, manufacturer: str) -> List[Product]:
+def get_products_by_manufacturer(db: Session, manufacturer_id: int) -> List[Product]:
     """Получает список товаров указанного производителя."""
-    return db.query(Product).filter(Product.manufacturer.ilike(f"%{manufacturer}%")).all()
+    return db.query(Product).filter(Product.manufacturer_id == manufacturer_id).all()
 
 def get_all_manufacturers(db: Session) -> List[str]:
-    """Получает список всех производителей."""
-    products = db.query(Product.manufacturer).distinct().all()
-    return [p[0] for p in products if p[0]]
+    """Получает список производителей, у которых есть товары."""
+    has_products = db.query(Product.id).filter(Product.manufacturer_id == Manufacturer.id).exists()
+    return [m.name for m in db.query(Manufacturer).filter(has_products).order_by(Manufacturer.name).all()]
 
 def get_all_cities_from_products(db: Session) -> List[str]:
     """Получает список всех городов из товаров."""
-    products = db.query(Product.city).distinct().all()
-    return [p[0] for p in products if p[0]]
+    has_products = db.query(Product.id).filter(Product.city_id == City.id).exists()
+    return [c.name for c in db.query(City).filter(has_products).order_by(City.name).all()]
+
+def get_catalog_version(db: Session) -> int:
+    """
+    Получает версию каталога. Версия увеличивается при любом изменении товаров,
+    категорий, производителей и городов, в том числе из программы управления каталогом.
+    """
+    state = db.query(CatalogState.version).filter(CatalogState.id == 1).first()
+    return state[0] if state else 0
 
 def format_product_name_with_price(product: Product) -> str:
     """Форматирует название товара с ценой."""
     return f"{product.name} {int(product.price)}р."
 
+def get_product_photo_path(product: Product) -> Optional[str]:
+    """
+    Путь к изображению для отправки в Telegram: уменьшенная копия, если она
+    подготовлена (см. image_ingest.py) и файл есть рядом с базой, иначе исходный файл.
+    """
+    if product.photo_path:
+        photo_path = resolve_image_path(product.photo_path, DATABASE_DIR)
+        if os.path.isfile(photo_path):
+            return photo_path
+    return product.image_path
+
 def get_product_details(product: Product) -> Dict[str, Any]:
     """Получает детальную информацию о товаре."""
     details = {
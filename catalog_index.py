@@ -0,0 +1,288 @@
+"""
+Индекс каталога в памяти процесса.
+
+Каталог меняется редко, а поиск по цене, производителю, городу и атрибутам
+выполняется на каждое нажатие кнопки. Индекс загружает товары одним запросом,
+держит их отсортированными по цене и отвечает на эти запросы без обращения
+к SQLite.
+
+Позиция товара в отсортированном массиве - это номер бита. Каждый фильтр
+(категория, производитель, город, форма, механизм, наполнение, подъемный
+механизм, ящик) хранится как битовое множество в виде int, поэтому пересечение
+фильтров - это побитовое И, а ограничение по цене - маска младших битов,
+граница которой находится через bisect. Установленные биты перебираются по
+возрастанию, так что результат уже отсортирован по цене.
+
+Индекс неизменяем: при изменении версии каталога (catalog.get_catalog_version)
+новый индекс строится в отдельном потоке и подменяет текущий целиком.
+"""
+import asyncio
+import logging
+import time
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from typing import Dict, List, Optional
+from sqlalchemy import text
+from database import SessionLocal
+from catalog import get_catalog_version
+
+logger = logging.getLogger(__name__)
+
+# Облегченная запись товара. Для вывода результатов поиска обработчикам нужны
+# только id, название и цена, полные объекты Product загружаются по id.
+ProductRecord = namedtuple("ProductRecord", [
+    "id", "product_code", "category_id", "name", "price",
+    "manufacturer_id", "manufacturer", "city_id", "city",
+    "form", "mechanism", "filling", "lifting_mechanism", "has_box",
+])
+
+_LOAD_QUERY = text(
+    "SELECT p.id, p.product_code, p.category_id, p.name, p.price, "
+    "p.manufacturer_id, m.name, p.city_id, c.name, "
+    "p.form, p.mechanism, p.filling, p.lifting_mechanism, p.has_box "
+    "FROM products p "
+    "LEFT JOIN manufacturers m ON m.id = p.manufacturer_id "
+    "LEFT JOIN cities c ON c.id = p.city_id "
+    "ORDER BY p.price, p.id"
+)
+
+# Фильтры advanced_search, для которых нужен SQL (поиск подстроки в названии и коде)
+SQL_ONLY_FILTERS = ("name", "code")
+
+def _sort_key(record: ProductRecord) -> tuple:
+    """Ключ сортировки записей индекса и курсора страниц."""
+    return (record.price, record.id)
+
+def _to_bitset(positions: List[int], size: int) -> int:
+    """Собирает битовое множество из списка позиций."""
+    buffer = bytearray((size + 7) // 8)
+    for position in positions:
+        buffer[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(buffer, "little")
+
+def _group(records, key) -> Dict[object, int]:
+    """Строит отображение значение -> битовое множество позиций товаров."""
+    groups = {}
+    for position, record in enumerate(records):
+        value = key(record)
+        if value is not None and value != "":
+            groups.setdefault(value, []).append(position)
+    return {value: _to_bitset(positions, len(records)) for value, positions in groups.items()}
+
+def _lower(value):
+    return value.lower() if value else None
+
+class CatalogIndex:
+    """Неизменяемый снимок каталога с битовыми индексами по фильтрам поиска."""
+
+    def __init__(self, version: int, records: List[ProductRecord]):
+        self.version = version
+        self.records = records
+        self.prices = [record.price for record in records]
+        self.all = (1 << len(records)) - 1
+
+        self.by_category = _group(records, lambda r: r.category_id)
+        self.by_manufacturer_id = _group(records, lambda r: r.manufacturer_id)
+        self.by_city_id = _group(records, lambda r: r.city_id)
+        # Строковые атрибуты хранятся в нижнем регистре: фильтр по подстроке
+        # объединяет множества всех подходящих значений
+        self.by_manufacturer = _group(records, lambda r: _lower(r.manufacturer))
+        self.by_city = _group(records, lambda r: _lower(r.city))
+        self.by_form = _group(records, lambda r: _lower(r.form))
+        self.by_mechanism = _group(records, lambda r: _lower(r.mechanism))
+        self.by_filling = _group(records, lambda r: _lower(r.filling))
+        # NULL не совпадает ни с True, ни с False, как и в SQL
+        self.lifting_mechanism = _group(records, lambda r: r.lifting_mechanism)
+        self.has_box = _group(records, lambda r: r.has_box)
+
+        self.manufacturers = sorted(
+            {(r.manufacturer_id, r.manufacturer) for r in records if r.manufacturer_id is not None},
+            key=lambda item: item[1]
+        )
+        self.cities = sorted(
+            {(r.city_id, r.city) for r in records if r.city_id is not None},
+            key=lambda item: item[1]
+        )
+
+    @classmethod
+    def load(cls, db, version: int) -> "CatalogIndex":
+        """Загружает все товары из базы и строит индекс."""
+        records = [ProductRecord(*row) for row in db.execute(_LOAD_QUERY)]
+        for position, record in enumerate(records):
+            # SQLite возвращает логические поля как 0/1
+            if record.lifting_mechanism is not None or record.has_box is not None:
+                records[position] = record._replace(
+                    lifting_mechanism=None if record.lifting_mechanism is None else bool(record.lifting_mechanism),
+                    has_box=None if record.has_box is None else bool(record.has_box),
+                )
+        return cls(version, records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def _price_mask(self, max_price: Optional[float]) -> int:
+        """Маска товаров с ценой не выше max_price."""
+        if max_price is None:
+            return self.all
+        return (1 << bisect_right(self.prices, max_price)) - 1
+
+    @staticmethod
+    def _containing(groups: Dict[str, int], value: str) -> int:
+        """Объединение множеств значений, содержащих подстроку (аналог ilike)."""
+        value = value.lower()
+        bits = 0
+        for key, key_bits in groups.items():
+            if value in key:
+                bits |= key_bits
+        return bits
+
+    def _collect(self, bits: int) -> List[ProductRecord]:
+        """Возвращает записи по установленным битам в порядке возрастания цены."""
+        records = self.records
+        result = []
+        if not bits:
+            return result
+        # Двоичная запись в обратном порядке: символ i соответствует биту i
+        digits = bin(bits)[:1:-1]
+        position = digits.find("1")
+        while position != -1:
+            result.append(records[position])
+            position = digits.find("1", position + 1)
+        return result
+
+    # Методы повторяют сигнатуры search.py (без аргумента db)
+
+    def search_by_price(self, max_price: float = None) -> List[ProductRecord]:
+        """Поиск товаров по максимальной цене."""
+        if max_price is None:
+            return list(self.records)
+        return self.records[:bisect_right(self.prices, max_price)]
+
+    def search_by_manufacturer(self, manufacturer_id: int) -> List[ProductRecord]:
+        """Поиск товаров по ID производителя из справочника."""
+        return self._collect(self.by_manufacturer_id.get(manufacturer_id, 0))
+
+    def search_by_city(self, city_id: int) -> List[ProductRecord]:
+        """Поиск товаров по ID города из справочника."""
+        return self._collect(self.by_city_id.get(city_id, 0))
+
+    def supports(self, **kwargs) -> bool:
+        """Проверяет, может ли индекс выполнить advanced_search с этими фильтрами."""
+        return not any(kwargs.get(name) for name in SQL_ONLY_FILTERS)
+
+    def _filter_bits(self, **kwargs) -> int:
+        """Битовое множество товаров, подходящих под фильтры advanced_search."""
+        bits = self._price_mask(kwargs.get('max_price') or None)
+
+        if kwargs.get('category_id'):
+            bits &= self.by_category.get(kwargs['category_id'], 0)
+
+        if kwargs.get('manufacturer_id'):
+            bits &= self.by_manufacturer_id.get(kwargs['manufacturer_id'], 0)
+
+        if kwargs.get('city_id'):
+            bits &= self.by_city_id.get(kwargs['city_id'], 0)
+
+        for name, groups in (
+            ('manufacturer', self.by_manufacturer),
+            ('city', self.by_city),
+            ('form', self.by_form),
+            ('mechanism', self.by_mechanism),
+            ('filling', self.by_filling),
+        ):
+            if bits and kwargs.get(name):
+                bits &= self._containing(groups, kwargs[name])
+
+        if kwargs.get('lifting_mechanism') is not None:
+            bits &= self.lifting_mechanism.get(bool(kwargs['lifting_mechanism']), 0)
+
+        if kwargs.get('has_box') is not None:
+            bits &= self.has_box.get(bool(kwargs['has_box']), 0)
+
+        return bits
+
+    def advanced_search(self, **kwargs) -> List[ProductRecord]:
+        """
+        Расширенный поиск товаров по нескольким параметрам.
+        Фильтры по названию и коду не поддерживаются (см. supports).
+        """
+        return self._collect(self._filter_bits(**kwargs))
+
+    def search_page(self, filters: Dict[str, object], cursor: Optional[tuple] = None,
+                    backward: bool = False, limit: int = 10) -> List[ProductRecord]:
+        """Страница результатов в порядке (цена, id), как search.search_page."""
+        bits = self._filter_bits(**filters)
+        records = self.records
+        page = []
+        if backward:
+            if cursor is not None:
+                end = bisect_left(records, tuple(cursor), key=_sort_key)
+                bits &= (1 << end) - 1
+            # Старшие биты - самые дорогие товары до курсора
+            while bits and len(page) < limit:
+                position = bits.bit_length() - 1
+                page.append(records[position])
+                bits ^= 1 << position
+            page.reverse()
+            return page
+        start = bisect_right(records, tuple(cursor), key=_sort_key) if cursor is not None else 0
+        bits >>= start
+        while bits and len(page) < limit:
+            lowest = bits & -bits
+            page.append(records[start + lowest.bit_length() - 1])
+            bits ^= lowest
+        return page
+
+    def count_products(self, filters: Dict[str, object]) -> int:
+        """Количество товаров, подходящих под фильтры."""
+        return self._filter_bits(**filters).bit_count()
+
+    def get_all_manufacturers(self):
+        """Возвращает список производителей, у которых есть товары, в виде пар (id, название)."""
+        return self.manufacturers
+
+    def get_all_cities(self):
+        """Возвращает список городов, в которых есть товары, в виде пар (id, название)."""
+        return self.cities
+
+_current_index: Optional[CatalogIndex] = None
+_refresh_lock = asyncio.Lock()
+
+def get_catalog_index() -> Optional[CatalogIndex]:
+    """Возвращает текущий индекс каталога или None, если он еще не построен."""
+    return _current_index
+
+def _load_if_changed(current_version: Optional[int]) -> Optional[CatalogIndex]:
+    """Строит новый индекс, если версия каталога отличается от текущей."""
+    db = SessionLocal()
+    try:
+        # Версия читается до товаров: изменение, сделанное во время загрузки,
+        # увеличит версию, и индекс будет перестроен при следующей проверке
+        version = get_catalog_version(db)
+        if version == current_version:
+            return None
+        return CatalogIndex.load(db, version)
+    finally:
+        db.close()
+
+async def refresh_catalog_index() -> bool:
+    """
+    Перестраивает индекс, если каталог изменился. Загрузка выполняется
+    в отдельном потоке и не блокирует цикл событий.
+
+    Returns:
+        bool: True, если индекс был перестроен
+    """
+    global _current_index
+    async with _refresh_lock:
+        current_version = _current_index.version if _current_index is not None else None
+        started = time.perf_counter()
+        index = await asyncio.to_thread(_load_if_changed, current_version)
+        if index is None:
+            return False
+        _current_index = index
+    logger.info(
+        "Индекс каталога построен: версия %d, товаров %d, %.0f мс",
+        index.version, len(index), (time.perf_counter() - started) * 1000
+    )
+    return True
@@ -7,9 +7,110 @@ load_dotenv()
 # Токен бота Telegram
 BOT_TOKEN = os.getenv("7467352806:AAHNd_kgcvuSDo5UkEFn53kNpJcRCke9DZo")
 
+# Адрес Bot API (например, локального сервера telegram-bot-api); по умолчанию - api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+
+# Режим получения обновлений: "polling" (long polling) или "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+# Настройки режима webhook. WEBHOOK_URL - внешний адрес бота (https://...),
+# по которому Telegram доставляет обновления на WEBHOOK_PATH
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "80"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+# Секрет, который Telegram передает в заголовке каждого запроса; если не задан,
+# генерируется при запуске
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN", "")
+# Максимальное количество одновременных соединений Telegram с ботом (1-100)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+# Адрес проверки работоспособности на том же HTTP-сервере
+HEALTH_PATH = os.getenv("HEALTH_PATH", "/health")
+
+# Количество обновлений, обрабатываемых одновременно (обновления одного чата
+# всегда обрабатываются по очереди)
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "8"))
+# Наибольшее количество обновлений, принятых в обработку (ожидающих и обрабатываемых)
+MAX_PENDING_UPDATES = int(os.getenv("MAX_PENDING_UPDATES", "1024"))
+
 # Путь к базе данных
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:////data/catalog.db")
 
+# Та же база данных для асинхронного драйвера (aiosqlite)
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", DATABASE_URL.replace("sqlite:", "sqlite+aiosqlite:", 1))
+
+# Профиль хранения SQLite: PRAGMA, применяемые к каждому соединению.
+# WAL позволяет читателям не ждать записи из программы управления каталогом,
+# busy_timeout - ждать освобождения блокировки вместо ошибки "database is locked"
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", "10000")),  # мс
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-32000")),  # отрицательное значение - в КиБ
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(64 * 1024 * 1024))),  # байт
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+    "foreign_keys": os.getenv("SQLITE_FOREIGN_KEYS", "ON"),
+}
+
+# Ограничение исходящих запросов к Bot API: запросов в секунду для всего бота
+# (0 - без ограничения), в секунду в личный чат (и сколько подряд без задержки),
+# в минуту в группу; количество повторов после ответа 429 (RetryAfter)
+RATE_LIMIT_OVERALL = float(os.getenv("RATE_LIMIT_OVERALL", "30"))
+RATE_LIMIT_CHAT = float(os.getenv("RATE_LIMIT_CHAT", "1"))
+RATE_LIMIT_CHAT_BURST = float(os.getenv("RATE_LIMIT_CHAT_BURST", "3"))
+RATE_LIMIT_GROUP = float(os.getenv("RATE_LIMIT_GROUP", "20"))
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "3"))
+
+# Ограничение входящих обновлений от одного пользователя: обновлений в секунду
+# и запас на всплеск; для попыток ввода кода авторизации - отдельный лимит
+FLOOD_RATE = float(os.getenv("FLOOD_RATE", "2"))
+FLOOD_BURST = float(os.getenv("FLOOD_BURST", "10"))
+FLOOD_AUTH_RATE = float(os.getenv("FLOOD_AUTH_RATE", "0.1"))
+FLOOD_AUTH_BURST = float(os.getenv("FLOOD_AUTH_BURST", "5"))
+# Блокировка ввода кода после неверных попыток: количество неверных попыток
+# подряд до блокировки, начальная длительность (удваивается с каждой следующей
+# неверной попыткой) и наибольшая длительность (в секундах)
+FLOOD_AUTH_FREE_ATTEMPTS = int(os.getenv("FLOOD_AUTH_FREE_ATTEMPTS", "3"))
+FLOOD_AUTH_LOCKOUT = float(os.getenv("FLOOD_AUTH_LOCKOUT", "30"))
+FLOOD_AUTH_LOCKOUT_MAX = float(os.getenv("FLOOD_AUTH_LOCKOUT_MAX", "3600"))
+
+# Рассылки: интервал проверки новых рассылок (в секундах) и количество
+# получателей, после отправки которым сохраняется контрольная точка
+BROADCAST_POLL_INTERVAL = int(os.getenv("BROADCAST_POLL_INTERVAL", "30"))
+BROADCAST_CHUNK_SIZE = int(os.getenv("BROADCAST_CHUNK_SIZE", "50"))
+
+# Интервал перевода истекших подписок в статус EXPIRED (в секундах)
+SUBSCRIPTION_EXPIRY_INTERVAL = int(os.getenv("SUBSCRIPTION_EXPIRY_INTERVAL", "300"))
+
+# Напоминания о продлении подписки: за сколько дней до окончания и в какое
+# время (UTC, ЧЧ:ММ) они отправляются ежедневно
+SUBSCRIPTION_REMINDER_DAYS = tuple(
+    int(days) for days in os.getenv("SUBSCRIPTION_REMINDER_DAYS", "7,3,1").split(",")
+)
+SUBSCRIPTION_REMINDER_TIME = os.getenv("SUBSCRIPTION_REMINDER_TIME", "09:00")
+
+# Интервал записи накопленного времени обращений пользователей в базу (в секундах)
+ACTIVITY_FLUSH_INTERVAL = int(os.getenv("ACTIVITY_FLUSH_INTERVAL", "60"))
+
+# Интервал фоновой контрольной точки WAL и PRAGMA optimize (в секундах)
+SQLITE_MAINTENANCE_INTERVAL = int(os.getenv("SQLITE_MAINTENANCE_INTERVAL", "600"))
+
+# Интервал проверки версии каталога для перестроения индекса в памяти (в секундах)
+CATALOG_INDEX_REFRESH_INTERVAL = int(os.getenv("CATALOG_INDEX_REFRESH_INTERVAL", "60"))
+
+# Количество товаров на одной странице результатов
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "10"))
+
+# Максимальное количество экранов в кэше отрисовки
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "1000"))
+
+# Время жизни записи кэша авторизации (в секундах) и максимальное количество записей
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "300"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+
+# Интервал записи состояния диалогов и user_data в базу (в секундах)
+PERSISTENCE_UPDATE_INTERVAL = int(os.getenv("PERSISTENCE_UPDATE_INTERVAL", "30"))
+
 # Секретный ключ для хеширования
 SECRET_KEY = os.getenv("SECRET_KEY", "default_secret_key")
 
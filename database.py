@@ -1,8 +1,16 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+import logging
 import os
-from config import DATABASE_URL
+import time
+from config import DATABASE_URL, ASYNC_DATABASE_URL, SQLITE_PRAGMAS
+
+logger = logging.getLogger(__name__)
 
 # Создаем базовый класс для моделей
 Base = declarative_base()
@@ -10,9 +18,103 @@ Base = declarative_base()
 # Создаем движок SQLAlchemy
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 
+# Каталог файла базы: от него отсчитываются пути к подготовленным изображениям товаров
+DATABASE_DIR = os.path.dirname(os.path.abspath(engine.url.database or ""))
+
 # Создаем фабрику сессий
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Асинхронный движок (aiosqlite) для обработчиков бота; пул соединений
+# задан явно, иначе для SQLite используется NullPool и каждая сессия
+# открывает новое соединение со своим потоком
+async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=AsyncAdaptedQueuePool)
+
+# Фабрика асинхронных сессий; объекты не сбрасываются после commit,
+# чтобы обработчики могли читать атрибуты без повторных запросов
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# Сессия текущего обновления Telegram (см. session_scope)
+_current_session: ContextVar = ContextVar("current_session", default=None)
+
+# Статистика выдачи соединений из пула
+_pool_stats = {
+    "checkouts": 0,
+    "checked_out": 0,
+    "total_hold_time": 0.0,
+    "max_hold_time": 0.0,
+}
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    connection_record.info["checkout_time"] = time.perf_counter()
+    _pool_stats["checkouts"] += 1
+    _pool_stats["checked_out"] += 1
+
+def _on_checkin(dbapi_connection, connection_record):
+    started = connection_record.info.pop("checkout_time", None)
+    if started is None:
+        return
+    held = time.perf_counter() - started
+    _pool_stats["checked_out"] -= 1
+    _pool_stats["total_hold_time"] += held
+    _pool_stats["max_hold_time"] = max(_pool_stats["max_hold_time"], held)
+
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "checkout", _on_checkout)
+    event.listen(_engine, "checkin", _on_checkin)
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Применяет профиль хранения SQLite к новому соединению."""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+if DATABASE_URL.startswith("sqlite"):
+    for _engine in (engine, async_engine.sync_engine):
+        event.listen(_engine, "connect", _apply_sqlite_pragmas)
+
+def get_storage_settings():
+    """
+    Возвращает фактические значения PRAGMA профиля хранения.
+    Значения читаются из базы, поэтому показывают, что реально применилось
+    (например, journal_mode может остаться DELETE, если WAL недоступен).
+    """
+    settings = {}
+    with engine.connect() as connection:
+        for name in SQLITE_PRAGMAS:
+            settings[name] = connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+    return settings
+
+async def run_storage_maintenance():
+    """
+    Выполняет пассивную контрольную точку WAL и PRAGMA optimize.
+    Пассивная контрольная точка не ждет читателей и писателей.
+
+    Returns:
+        tuple: (занято, страниц в WAL, перенесено страниц)
+    """
+    async with async_engine.connect() as connection:
+        result = await connection.exec_driver_sql("PRAGMA wal_checkpoint(PASSIVE)")
+        checkpoint = tuple(result.one())
+        await connection.exec_driver_sql("PRAGMA optimize")
+    return checkpoint
+
+def get_pool_stats():
+    """
+    Возвращает статистику пула соединений: количество выдач,
+    число занятых соединений и время удержания соединения (в мс).
+    """
+    checkouts = _pool_stats["checkouts"]
+    released = checkouts - _pool_stats["checked_out"]
+    return {
+        "checkouts": checkouts,
+        "checked_out": _pool_stats["checked_out"],
+        "avg_hold_ms": _pool_stats["total_hold_time"] / released * 1000 if released else 0.0,
+        "max_hold_ms": _pool_stats["max_hold_time"] * 1000,
+    }
+
 def get_db():
     """
     Генератор для получения сессии базы данных.
@@ -24,13 +126,41 @@ def get_db():
     finally:
         db.close()
 
+@asynccontextmanager
+async def session_scope():
+    """
+    Привязывает к текущему обновлению одну асинхронную сессию базы данных.
+    Сессия создается при первом обращении через get_session()
+    и всегда закрывается при выходе из блока.
+    """
+    holder = [None]
+    token = _current_session.set(holder)
+    try:
+        yield
+    finally:
+        _current_session.reset(token)
+        if holder[0] is not None:
+            await holder[0].close()
+
+def get_session() -> AsyncSession:
+    """
+    Возвращает сессию текущего обновления.
+    Все вызовы в рамках одного обновления получают одну и ту же сессию.
+    """
+    holder = _current_session.get()
+    if holder is None:
+        raise RuntimeError("get_session() вызван вне session_scope()")
+    if holder[0] is None:
+        holder[0] = AsyncSessionLocal()
+    return holder[0]
+
 def init_db():
     """
     Инициализирует базу данных, создавая все таблицы.
     """
     from models import Base
     Base.metadata.create_all(bind=engine)
-    
+
 def check_db_exists():
     """
     Проверяет, существует ли файл базы данных.
@@ -0,0 +1,194 @@
+"""
+Ограничение входящих обновлений от одного пользователя.
+
+Обработчик группы -1 выполняется раньше остальных обработчиков и отклоняет
+обновления пользователя, который присылает их слишком часто, до любой работы
+с базой (сессия обновления создается только при первом обращении к ней):
+- общий лимит - корзина токенов на пользователя (FLOOD_RATE, FLOOD_BURST);
+- попытки ввода кода авторизации дополнительно расходуют отдельную, более
+  строгую корзину (FLOOD_AUTH_RATE, FLOOD_AUTH_BURST): каждая попытка -
+  запись в базу;
+- после FLOOD_AUTH_FREE_ATTEMPTS неверных кодов подряд ввод кода блокируется
+  на FLOOD_AUTH_LOCKOUT секунд, каждая следующая неверная попытка после
+  блокировки удваивает ее (до FLOOD_AUTH_LOCKOUT_MAX).
+
+Отклоненное нажатие кнопки получает answer() с пояснением - иначе у
+пользователя продолжает крутиться индикатор загрузки. На сообщения бот
+отвечает только при первом отклонении подряд, остальные отбрасываются молча,
+чтобы флуд не расходовал лимит исходящих запросов. Состояние хранится в
+памяти процесса.
+"""
+import logging
+import math
+import time
+from typing import Callable, Dict, List, Optional
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import ApplicationHandlerStop, ContextTypes, TypeHandler
+from config import (
+    FLOOD_RATE, FLOOD_BURST, FLOOD_AUTH_RATE, FLOOD_AUTH_BURST,
+    FLOOD_AUTH_FREE_ATTEMPTS, FLOOD_AUTH_LOCKOUT, FLOOD_AUTH_LOCKOUT_MAX
+)
+
+logger = logging.getLogger(__name__)
+
+# Состояния пользователей, которые можно удалить, проверяются при таком их количестве
+_PRUNE_THRESHOLD = 10000
+
+_stats = {"allowed": 0, "throttled": 0, "auth_throttled": 0, "locked_out": 0, "lockouts": 0}
+
+class TokenBucket:
+    """Корзина токенов без ожидания: обновление либо получает токен, либо отклоняется."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def is_idle(self) -> bool:
+        """Корзина полна: ее можно удалить без потери состояния."""
+        self._refill()
+        return self.tokens >= self.capacity
+
+    def take(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+def _duration_text(seconds: float) -> str:
+    if seconds < 60:
+        return f"{math.ceil(seconds)} с"
+    return f"{math.ceil(seconds / 60)} мин"
+
+class FloodGuard:
+    """Корзины токенов и блокировки ввода кода по id пользователя."""
+
+    def __init__(self):
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._auth_buckets: Dict[int, TokenBucket] = {}
+        # id пользователя -> [неверных кодов подряд, блокировка до, последняя неверная попытка]
+        self._failures: Dict[int, List[float]] = {}
+        # Пользователи, уже получившие уведомление об отклонении
+        self._warned = set()
+        self._prune_at = _PRUNE_THRESHOLD
+        self._is_auth_attempt: Optional[Callable[[Update], bool]] = None
+
+    def _prune(self):
+        now = time.monotonic()
+        for buckets in (self._buckets, self._auth_buckets):
+            for user_id in [key for key, bucket in buckets.items() if bucket.is_idle()]:
+                del buckets[user_id]
+        for user_id in [key for key, record in self._failures.items() if self._forgotten(record, now)]:
+            del self._failures[user_id]
+        self._warned &= self._buckets.keys() | self._auth_buckets.keys() | self._failures.keys()
+        # Следующая проверка - не раньше, чем корзин станет вдвое больше оставшихся
+        self._prune_at = max(_PRUNE_THRESHOLD, 2 * len(self._buckets))
+
+    def _take(self, auth: bool, user_id: int) -> bool:
+        """Берет токен из корзины пользователя: общей или для попыток ввода кода."""
+        buckets = self._auth_buckets if auth else self._buckets
+        bucket = buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) >= self._prune_at:
+                self._prune()
+            if auth:
+                bucket = TokenBucket(FLOOD_AUTH_RATE, FLOOD_AUTH_BURST)
+            else:
+                bucket = TokenBucket(FLOOD_RATE, FLOOD_BURST)
+            buckets[user_id] = bucket
+        return bucket.take()
+
+    @staticmethod
+    def _forgotten(record: List[float], now: float) -> bool:
+        """Неверные попытки забываются, если после них (и после блокировки) прошло FLOOD_AUTH_LOCKOUT_MAX."""
+        return now - max(record[1], record[2]) > FLOOD_AUTH_LOCKOUT_MAX
+
+    def lockout_remaining(self, user_id: int) -> float:
+        """Сколько секунд еще заблокирован ввод кода (0 - не заблокирован)."""
+        record = self._failures.get(user_id)
+        if record is None:
+            return 0.0
+        return max(0.0, record[1] - time.monotonic())
+
+    def auth_failed(self, user_id: int):
+        """Учитывает неверный код; после FLOOD_AUTH_FREE_ATTEMPTS подряд блокирует ввод кода."""
+        now = time.monotonic()
+        record = self._failures.get(user_id)
+        if record is None or self._forgotten(record, now):
+            record = self._failures[user_id] = [0, 0.0, now]
+        record[0] += 1
+        record[2] = now
+        excess = int(record[0]) - FLOOD_AUTH_FREE_ATTEMPTS
+        if excess >= 0:
+            # Показатель ограничен, чтобы степень двойки не переполнила float
+            lockout = min(FLOOD_AUTH_LOCKOUT * 2 ** min(excess, 32), FLOOD_AUTH_LOCKOUT_MAX)
+            record[1] = now + lockout
+            _stats["lockouts"] += 1
+            logger.info("Ввод кода заблокирован для пользователя %s на %.0f с", user_id, lockout)
+
+    def auth_succeeded(self, user_id: int):
+        """Сбрасывает счетчик неверных кодов после успешной авторизации."""
+        self._failures.pop(user_id, None)
+
+    async def _reject(self, update: Update, user_id: int, text: str):
+        first = user_id not in self._warned
+        self._warned.add(user_id)
+        try:
+            if update.callback_query:
+                await update.callback_query.answer(text)
+            elif first and update.effective_message:
+                await update.effective_message.reply_text(text)
+        except TelegramError as e:
+            logger.debug("Не удалось уведомить пользователя %s об ограничении: %s", user_id, e)
+        raise ApplicationHandlerStop
+
+    async def check(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Пропускает обновление к остальным обработчикам или отклоняет его."""
+        user = update.effective_user
+        if user is None:
+            return
+        if self._is_auth_attempt is not None and self._is_auth_attempt(update):
+            remaining = self.lockout_remaining(user.id)
+            if remaining > 0:
+                _stats["locked_out"] += 1
+                await self._reject(
+                    update, user.id,
+                    f"🔒 Слишком много неверных кодов. Повторите через {_duration_text(remaining)}."
+                )
+            if not self._take(True, user.id):
+                _stats["auth_throttled"] += 1
+                await self._reject(update, user.id, "⏳ Слишком много попыток ввода кода. Подождите немного.")
+        if not self._take(False, user.id):
+            _stats["throttled"] += 1
+            await self._reject(update, user.id, "⏳ Слишком много запросов. Подождите немного.")
+        self._warned.discard(user.id)
+        _stats["allowed"] += 1
+
+    def create_handler(self, is_auth_attempt: Callable[[Update], bool]) -> TypeHandler:
+        """
+        Создает обработчик для группы -1.
+
+        Args:
+            is_auth_attempt: Проверяет без обращения к базе, является ли обновление
+                попыткой ввода кода авторизации
+        """
+        self._is_auth_attempt = is_auth_attempt
+        return TypeHandler(Update, self.check)
+
+flood_guard = FloodGuard()
+
+def get_flood_guard_stats() -> dict:
+    """
+    Статистика ограничения входящих обновлений: пропущено, отклонено по общему
+    лимиту и по лимиту попыток ввода кода, отклонено из-за блокировки ввода
+    кода и количество блокировок.
+    """
+    return dict(_stats)
@@ -14,6 +14,7 @@ import sqlite3
 import datetime
 import shutil
 from pathlib import Path
+from image_ingest import ingest_images
 
 # Константы
 DB_PATH = "catalog.db"
@@ -35,7 +36,8 @@ def connect_to_database():
             sys.exit(1)
     
     try:
-        conn = sqlite3.connect(DB_PATH)
+        # Ждем освобождения базы, если в нее в этот момент пишет бот
+        conn = sqlite3.connect(DB_PATH, timeout=10)
         conn.row_factory = sqlite3.Row
         return conn
     except sqlite3.Error as e:
@@ -196,10 +198,13 @@ def display_menu():
     print("6. Поиск товаров")
     print("7. Статистика")
     print("8. Экспорт/Импорт данных")
+    print("9. Перестроить поисковый индекс")
+    print("10. Подготовить изображения для Telegram")
+    print("11. Создать рассылку подписчикам")
     print("0. Выход")
     print("="*50)
     
-    choice = input("Выберите действие (0-8): ")
+    choice = input("Выберите действие (0-11): ")
     return choice
 
 def view_catalog_menu():
@@ -622,6 +627,8 @@ def add_new_product(conn):
         ))
         conn.commit()
         print(f"\nТовар '{name}' успешно добавлен в каталог.")
+        if image_path:
+            prepare_images(conn, [cursor.lastrowid])
     except sqlite3.Error as e:
         conn.rollback()
         print(f"Ошибка при добавлении товара: {e}")
@@ -710,6 +717,8 @@ def edit_product(conn):
         ))
         conn.commit()
         print(f"\nТовар '{name}' успешно обновлен.")
+        if image_path:
+            prepare_images(conn, [product['id']])
     except sqlite3.Error as e:
         conn.rollback()
         print(f"Ошибка при обновлении товара: {e}")
@@ -1287,6 +1296,82 @@ def show_statistics(conn):
     print("="*50)
     input("\nНажмите Enter для возврата...")
 
+def rebuild_search_index(conn):
+    """Перестроение полнотекстового индекса товаров, используемого ботом для поиска"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'")
+    if not cursor.fetchone():
+        print("\nПоисковый индекс еще не создан. Он будет создан при следующем запуске бота.")
+        return
+    
+    try:
+        cursor.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+        conn.commit()
+        print("\nПоисковый индекс успешно перестроен.")
+    except sqlite3.Error as e:
+        print(f"\nОшибка при перестроении поискового индекса: {e}")
+
+def prepare_images(conn, product_ids=None):
+    """Подготовка уменьшенных копий изображений товаров, которые отправляет бот"""
+    try:
+        stats = ingest_images(DB_PATH, product_ids)
+    except RuntimeError as e:
+        print(f"\nИзображения не подготовлены: {e}")
+        return
+    
+    for product_id, error in stats["errors"]:
+        print(f"Товар {product_id}: не удалось обработать изображение: {error}")
+    if product_ids is None or stats["processed"] or stats["failed"] or stats["missing"]:
+        print(
+            f"\nИзображения: обработано {stats['processed']}, без изменений {stats['skipped']}, "
+            f"файл не найден {stats['missing']}, ошибок {stats['failed']}"
+        )
+
+def create_broadcast(conn):
+    """Создание рассылки подписчикам; бот отправит ее в фоне"""
+    print("\n" + "="*50)
+    print("РАССЫЛКА ПОДПИСЧИКАМ".center(50))
+    print("="*50)
+    
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'broadcasts'")
+    if not cursor.fetchone():
+        print("\nТаблица рассылок еще не создана. Она будет создана при следующем запуске бота.")
+        return
+    
+    cursor.execute("""
+        SELECT COUNT(*) FROM users
+        WHERE subscription_status = 'PAID' AND is_active != 0
+        AND (subscription_expiry IS NULL OR subscription_expiry > datetime('now'))
+    """)
+    recipients = cursor.fetchone()[0]
+    print(f"Подписчиков с действующей подпиской: {recipients}")
+    
+    text = input("Текст сообщения: ").strip()
+    if not text:
+        print("Текст сообщения не может быть пустым.")
+        return
+    image_path = input("Путь к изображению (Enter - без изображения): ").strip()
+    if image_path and not os.path.isfile(image_path):
+        print(f"Файл {image_path} не найден.")
+        return
+    
+    confirm = input(f"Отправить сообщение {recipients} подписчикам? (да/нет): ").strip().lower()
+    if confirm not in ("да", "д", "yes", "y"):
+        print("Рассылка отменена.")
+        return
+    
+    try:
+        cursor.execute(
+            "INSERT INTO broadcasts (text, image_path, status, last_user_id, delivered, failed, blocked, created_at) "
+            "VALUES (?, ?, 'PENDING', 0, 0, 0, 0, datetime('now'))",
+            (text, image_path or None)
+        )
+        conn.commit()
+        print(f"\nРассылка #{cursor.lastrowid} создана. Бот начнет отправку в течение минуты.")
+    except sqlite3.Error as e:
+        print(f"\nОшибка при создании рассылки: {e}")
+
 def export_import_data(conn):
     """Экспорт/импорт данных"""
     print("\n" + "="*50)
@@ -1541,6 +1626,12 @@ def main():
             show_statistics(conn)
         elif choice == "8":
             conn = export_import_data(conn)
+        elif choice == "9":
+            rebuild_search_index(conn)
+        elif choice == "10":
+            prepare_images(conn)
+        elif choice == "11":
+            create_broadcast(conn)
         elif choice == "0":
             break
         else:
@@ -1,20 +1,31 @@
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
-from sqlalchemy.orm import Session
-from database import get_db
-from auth import register_user, get_user, use_auth_code, has_active_subscription
+from database import get_session
+from repository import register_user, get_user, use_auth_code, has_active_subscription
 from models import SubscriptionStatus
+from callbacks import View, callback_button
+from handlers.states import AUTH_CODE
+from handlers.screens import edit_screen
+from flood_guard import flood_guard
 
-# Состояния для ConversationHandler
-AUTH_CODE = 1
+# Главное меню не зависит от каталога и строится один раз
+MAIN_MENU = (
+    "🏠 Главное меню\n\nВыберите раздел:",
+    InlineKeyboardMarkup([
+        [callback_button("🛋️ Каталог мебели", View.CATALOG)],
+        [callback_button("🔍 Поиск", View.SEARCH)],
+        [callback_button("ℹ️ О боте", View.ABOUT)],
+        [callback_button("👤 Мой профиль", View.PROFILE)]
+    ])
+)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начало работы с ботом и регистрация пользователя."""
     user = update.effective_user
-    db = next(get_db())
+    db = get_session()
     
     # Регистрируем пользователя или обновляем информацию
-    db_user, is_new = register_user(
+    db_user, is_new = await register_user(
         db=db,
         telegram_id=str(user.id),
         username=user.username,
@@ -23,7 +34,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     
     # Проверяем, есть ли у пользователя активная подписка
-    if has_active_subscription(db, str(user.id)):
+    if await has_active_subscription(db, str(user.id)):
         # Если есть активная подписка, переходим в главное меню
         await show_main_menu(update, context)
         return ConversationHandler.END
@@ -43,17 +54,20 @@ async def auth_code_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     code = update.message.text.strip()
     
-    db = next(get_db())
-    success, message = use_auth_code(db, str(user.id), code)
+    db = get_session()
+    success, message = await use_auth_code(db, str(user.id), code)
     
     if success:
         # Код верный, активирована подписка
+        flood_guard.auth_succeeded(user.id)
         await update.message.reply_text(message)
         # Переходим в главное меню
         await show_main_menu(update, context)
         return ConversationHandler.END
     else:
-        # Код неверный, просим ввести снова
+        # Код неверный, просим ввести снова; после нескольких неверных
+        # попыток ввод кода блокируется
+        flood_guard.auth_failed(user.id)
         await update.message.reply_text(
             f"{message}\n\nПожалуйста, попробуйте еще раз или обратитесь к администратору."
         )
@@ -61,24 +75,18 @@ async def auth_code_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает главное меню бота."""
-    keyboard = [
-        [InlineKeyboardButton("🛋️ Каталог мебели", callback_data="catalog")],
-        [InlineKeyboardButton("🔍 Поиск", callback_data="search")],
-        [InlineKeyboardButton("ℹ️ О боте", callback_data="about")],
-        [InlineKeyboardButton("👤 Мой профиль", callback_data="profile")]
-    ]
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    main_menu_message, reply_markup = MAIN_MENU
     
     if update.callback_query:
         await update.callback_query.answer()
-        await update.callback_query.message.edit_text(
-            "🏠 Главное меню\n\nВыберите раздел:",
+        await edit_screen(
+            update.callback_query.message,
+            main_menu_message,
             reply_markup=reply_markup
         )
     else:
         await update.message.reply_text(
-            "🏠 Главное меню\n\nВыберите раздел:",
+            main_menu_message,
             reply_markup=reply_markup
         )
     
@@ -90,9 +98,9 @@ async def check_auth(update: Update, context: ContextTypes.DEFAULT_TYPE):
     Возвращает True, если пользователь авторизован, иначе False.
     """
     user = update.effective_user
-    db = next(get_db())
+    db = get_session()
     
-    if has_active_subscription(db, str(user.id)):
+    if await has_active_subscription(db, str(user.id)):
         return True
     
     # Если пользователь не авторизован, отправляем сообщение
@@ -119,8 +127,8 @@ async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
         message = update.message
     
     user = update.effective_user
-    db = next(get_db())
-    db_user = get_user(db, str(user.id))
+    db = get_session()
+    db_user = await get_user(db, str(user.id))
     
     if not db_user:
         await message.reply_text("❌ Ошибка: пользователь не найден в базе данных.")
@@ -141,12 +149,12 @@ async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     
     keyboard = [
-        [InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_menu")]
+        [callback_button("🏠 Главное меню", View.MAIN_MENU)]
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     if update.callback_query:
-        await message.edit_text(profile_text, reply_markup=reply_markup, parse_mode="Markdown")
+        await edit_screen(message, profile_text, reply_markup=reply_markup, parse_mode="Markdown")
     else:
         await message.reply_text(profile_text, reply_markup=reply_markup, parse_mode="Markdown")
@@ -1,35 +1,27 @@
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
-from sqlalchemy.orm import Session
-from database import get_db
-from auth import get_user, has_active_subscription, check_auth
-from catalog import (
-    get_all_categories, get_category_by_id, get_products_by_category,
-    get_product_by_id, format_product_name_with_price, get_product_display_text
+from database import get_session
+from auth import check_auth
+from repository import (
+    get_all_categories, get_category_by_id, get_product_by_id, search_page, count_products
 )
+from render_cache import render_cache, current_catalog_version
+from config import PAGE_SIZE
+from catalog import format_product_name_with_price, get_product_display_text, get_product_photo_path
 from models import Product
+from callbacks import View, callback_button
+from handlers.states import CATEGORY_SELECTION, PRODUCT_SELECTION, PRODUCT_DETAIL, CATEGORY_ACTION
+from handlers.screens import edit_screen, edit_photo_screen
 
-# Состояния для ConversationHandler
-CATEGORY_SELECTION = 1
-PRODUCT_SELECTION = 2
-PRODUCT_DETAIL = 3
-CATEGORY_ACTION = 4
-
-async def show_catalog(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показывает каталог категорий мебели."""
-    # Проверяем авторизацию
-    if not await check_auth(update, context):
-        return ConversationHandler.END
+async def render_catalog():
+    """Возвращает экран списка категорий из кэша или строит его."""
+    render = render_cache.get("catalog", None)
+    if render is not None:
+        return render
     
-    if update.callback_query:
-        await update.callback_query.answer()
-        message = update.callback_query.message
-    else:
-        message = update.message
-    
-    # Получаем список категорий из базы данных
-    db = next(get_db())
-    categories = get_all_categories(db)
+    version = current_catalog_version()
+    db = get_session()
+    categories = await get_all_categories(db)
     
     catalog_message = (
         "🛋️ *Каталог мебели*\n\n"
@@ -40,14 +32,30 @@ async def show_catalog(update: Update, context: ContextTypes.DEFAULT_TYPE):
     keyboard = []
     for category in categories:
         emoji = get_category_emoji(category.name)
-        keyboard.append([InlineKeyboardButton(f"{emoji} {category.name}", callback_data=f"category_{category.id}")])
+        keyboard.append([callback_button(f"{emoji} {category.name}", View.CATEGORY, category.id)])
     
-    keyboard.append([InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_menu")])
+    keyboard.append([callback_button("🏠 Главное меню", View.MAIN_MENU)])
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    render = (catalog_message, InlineKeyboardMarkup(keyboard))
+    render_cache.put("catalog", None, render, version)
+    return render
+
+async def show_catalog(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показывает каталог категорий мебели."""
+    # Проверяем авторизацию
+    if not await check_auth(update, context):
+        return ConversationHandler.END
     
     if update.callback_query:
-        await message.edit_text(catalog_message, reply_markup=reply_markup, parse_mode="Markdown")
+        await update.callback_query.answer()
+        message = update.callback_query.message
+    else:
+        message = update.message
+    
+    catalog_message, reply_markup = await render_catalog()
+    
+    if update.callback_query:
+        await edit_screen(message, catalog_message, reply_markup=reply_markup, parse_mode="Markdown")
     else:
         await message.reply_text(catalog_message, reply_markup=reply_markup, parse_mode="Markdown")
     
@@ -58,18 +66,19 @@ async def show_category_action(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     await query.answer()
     
-    category_id = int(query.data.split("_")[1])
+    category_id = context.args[0]
     context.user_data["selected_category_id"] = category_id
     
     # Получаем информацию о категории
-    db = next(get_db())
-    category = get_category_by_id(db, category_id)
+    db = get_session()
+    category = await get_category_by_id(db, category_id)
     
     if not category:
-        await query.message.edit_text(
+        await edit_screen(
+            query.message,
             "❌ Категория не найдена.\n\n"
             "Пожалуйста, выберите другую категорию или вернитесь в главное меню.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад к категориям", callback_data="catalog")]])
+            reply_markup=InlineKeyboardMarkup([[callback_button("⬅️ Назад к категориям", View.CATALOG)]])
         )
         return CATEGORY_SELECTION
     
@@ -80,116 +89,184 @@ async def show_category_action(update: Update, context: ContextTypes.DEFAULT_TYP
     )
     
     keyboard = [
-        [InlineKeyboardButton("📋 Показать все товары", callback_data=f"show_all_{category_id}")],
-        [InlineKeyboardButton("🔍 Поиск в этой категории", callback_data=f"search_in_{category_id}")],
-        [InlineKeyboardButton("⬅️ Назад к категориям", callback_data="catalog")],
-        [InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_menu")]
+        [callback_button("📋 Показать все товары", View.CATEGORY_PRODUCTS, category_id)],
+        [callback_button("🔍 Поиск в этой категории", View.CATEGORY_SEARCH, category_id)],
+        [callback_button("⬅️ Назад к категориям", View.CATALOG)],
+        [callback_button("🏠 Главное меню", View.MAIN_MENU)]
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.message.edit_text(action_message, reply_markup=reply_markup, parse_mode="Markdown")
+    await edit_screen(query.message, action_message, reply_markup=reply_markup, parse_mode="Markdown")
     
     return CATEGORY_ACTION
 
-async def show_category_products(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показывает товары в выбранной категории."""
-    query = update.callback_query
-    await query.answer()
-    
-    action, category_id = query.data.split("_")[0], int(query.data.split("_")[2])
-    
-    # Получаем информацию о категории и товарах
-    db = next(get_db())
-    category = get_category_by_id(db, category_id)
-    
-    if not category:
-        await query.message.edit_text(
-            "❌ Категория не найдена.\n\n"
-            "Пожалуйста, выберите другую категорию или вернитесь в главное меню.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад к категориям", callback_data="catalog")]])
-        )
-        return CATEGORY_SELECTION
-    
-    # Получаем товары в этой категории
-    products = get_products_by_category(db, category_id)
+def build_category_page(category, products, page: int, total: int):
+    """Формирует текст и клавиатуру страницы товаров категории."""
+    pages = max(1, (total + PAGE_SIZE - 1) // PAGE_SIZE)
     
     emoji = get_category_emoji(category.name)
     products_message = (
         f"{emoji} *{category.name}*\n\n"
-        f"Найдено товаров: {len(products)}\n\n"
-        f"Выберите товар для просмотра подробной информации:"
+        f"Найдено товаров: {total}\n"
     )
+    if pages > 1:
+        products_message += f"Страница {page} из {pages}\n"
+    products_message += "\nВыберите товар для просмотра подробной информации:"
     
-    # Создаем кнопки для каждого товара, сортируем по цене
+    # Создаем кнопки для товаров страницы, уже отсортированных по цене
     keyboard = []
-    for product in sorted(products, key=lambda p: p.price):
-        keyboard.append([InlineKeyboardButton(
-            format_product_name_with_price(product), 
-            callback_data=f"product_{product.id}"
+    for product in products:
+        keyboard.append([callback_button(
+            format_product_name_with_price(product), View.CATALOG_PRODUCT, product.id
         )])
     
+    # Кнопки перелистывания несут курсор - цену и id товара на границе страницы
+    navigation = []
+    if products and page > 1:
+        first = products[0]
+        navigation.append(callback_button(
+            "◀️", View.CATEGORY_PAGE, category.id, page - 1, True, first.price, first.id
+        ))
+    if products and page < pages:
+        last = products[-1]
+        navigation.append(callback_button(
+            "▶️", View.CATEGORY_PAGE, category.id, page + 1, False, last.price, last.id
+        ))
+    if navigation:
+        keyboard.append(navigation)
+    
     # Добавляем кнопки навигации
-    keyboard.append([InlineKeyboardButton("⬅️ Назад к категории", callback_data=f"category_{category_id}")])
-    keyboard.append([InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_menu")])
+    keyboard.append([callback_button("⬅️ Назад к категории", View.CATEGORY, category.id)])
+    keyboard.append([callback_button("🏠 Главное меню", View.MAIN_MENU)])
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    return products_message, InlineKeyboardMarkup(keyboard)
+
+async def render_category_page(category_id: int, page: int = 1, cursor=None, backward: bool = False):
+    """
+    Возвращает экран страницы категории из кэша или строит его.
+    Возвращает None, если категория не найдена.
+    """
+    params = (category_id, page, cursor, backward)
+    render = render_cache.get("category_page", params)
+    if render is not None:
+        return render
+    
+    version = current_catalog_version()
+    db = get_session()
+    category = await get_category_by_id(db, category_id)
+    if not category:
+        return None
+    
+    search_filters = {"category_id": category_id}
+    total = await count_products(db, search_filters)
+    products = await search_page(db, search_filters, cursor, backward, PAGE_SIZE)
+    
+    render = build_category_page(category, products, page, total)
+    render_cache.put("category_page", params, render, version)
+    return render
+
+async def show_category_products(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показывает первую страницу товаров выбранной категории."""
+    query = update.callback_query
+    await query.answer()
     
-    await query.message.edit_text(products_message, reply_markup=reply_markup, parse_mode="Markdown")
+    category_id = context.args[0]
+    
+    return await show_category_page_render(query, await render_category_page(category_id))
+
+async def show_category_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показывает следующую или предыдущую страницу товаров категории."""
+    query = update.callback_query
+    await query.answer()
+    
+    category_id, page, backward, price, product_id = context.args
+    render = await render_category_page(category_id, page, (price, product_id), bool(backward))
+    
+    return await show_category_page_render(query, render)
+
+async def show_category_page_render(query, render):
+    """Выводит страницу категории или сообщение о том, что категория не найдена."""
+    if render is None:
+        await edit_screen(
+            query.message,
+            "❌ Категория не найдена.\n\n"
+            "Пожалуйста, выберите другую категорию или вернитесь в главное меню.",
+            reply_markup=InlineKeyboardMarkup([[callback_button("⬅️ Назад к категориям", View.CATALOG)]])
+        )
+        return CATEGORY_SELECTION
+    
+    products_message, reply_markup = render
+    await edit_screen(query.message, products_message, keep_photo=True, reply_markup=reply_markup, parse_mode="Markdown")
     
     return PRODUCT_SELECTION
 
+async def render_product_card(product_id: int):
+    """
+    Возвращает карточку товара из кэша или строит ее: текст, путь к фото
+    и клавиатуру для просмотра из каталога. Возвращает None, если товар не найден.
+    """
+    render = render_cache.get("product_card", product_id)
+    if render is not None:
+        return render
+    
+    version = current_catalog_version()
+    db = get_session()
+    product = await get_product_by_id(db, product_id)
+    if not product:
+        return None
+    
+    keyboard = [
+        [callback_button("⬅️ Назад к товарам", View.CATEGORY_PRODUCTS, product.category_id)],
+        [callback_button("🏠 Главное меню", View.MAIN_MENU)]
+    ]
+    
+    render = (get_product_display_text(product), get_product_photo_path(product), InlineKeyboardMarkup(keyboard))
+    render_cache.put("product_card", product_id, render, version)
+    return render
+
 async def show_product_details(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает подробную информацию о выбранном товаре."""
     query = update.callback_query
     await query.answer()
     
-    product_id = int(query.data.split("_")[1])
+    product_id = context.args[0]
     
-    # Получаем информацию о товаре
-    db = next(get_db())
-    product = get_product_by_id(db, product_id)
+    card = await render_product_card(product_id)
     
-    if not product:
-        await query.message.edit_text(
+    if card is None:
+        await edit_screen(
+            query.message,
             "❌ Товар не найден.\n\n"
             "Пожалуйста, выберите другой товар или вернитесь в каталог.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад к каталогу", callback_data="catalog")]])
+            reply_markup=InlineKeyboardMarkup([[callback_button("⬅️ Назад к каталогу", View.CATALOG)]])
         )
         return PRODUCT_SELECTION
     
-    # Формируем текст с информацией о товаре
-    product_text = get_product_display_text(product)
-    
-    # Создаем кнопки навигации
-    keyboard = [
-        [InlineKeyboardButton("⬅️ Назад к товарам", callback_data=f"show_all_{product.category_id}")],
-        [InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_menu")]
-    ]
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    product_text, photo_path, reply_markup = card
     
     # Если есть изображение, отправляем его
-    if product.image_path:
+    if photo_path:
         try:
-            with open(product.image_path, 'rb') as photo:
-                await query.message.reply_photo(
-                    photo=photo,
-                    caption=product_text,
-                    reply_markup=reply_markup,
-                    parse_mode="Markdown"
-                )
-            await query.message.delete()
+            await edit_photo_screen(
+                query.message,
+                photo_path,
+                caption=product_text,
+                reply_markup=reply_markup,
+                parse_mode="Markdown"
+            )
         except Exception as e:
             # Если не удалось отправить изображение, отправляем только текст
-            await query.message.edit_text(
+            await edit_screen(
+                query.message,
                 product_text + "\n\n(Изображение недоступно)",
                 reply_markup=reply_markup,
                 parse_mode="Markdown"
             )
     else:
         # Если изображения нет, отправляем только текст
-        await query.message.edit_text(
+        await edit_screen(
+            query.message,
             product_text,
             reply_markup=reply_markup,
             parse_mode="Markdown"
@@ -0,0 +1,74 @@
+"""
+Вывод экранов в сообщении, кнопку которого нажал пользователь.
+
+Навигация заменяет содержимое одного сообщения, а не отправляет новые:
+- текстовое сообщение редактируется (edit_text);
+- карточка товара с фото в сообщении с фото заменяет фото и подпись
+  (edit_media), списки товаров в таком сообщении выводятся в подписи
+  (edit_caption): переход между списком и карточкой - один запрос;
+- если тип сообщения не подходит (фото в текстовом сообщении, текстовый
+  экран в сообщении с фото), сообщение заменяется новым: отправка и удаление.
+"""
+from telegram import Message
+from telegram.error import BadRequest
+from image_cache import reply_photo_cached, edit_photo_cached
+
+# Ограничение Telegram на длину подписи к фото
+CAPTION_LIMIT = 1024
+
+_stats = {"edited": 0, "replaced": 0}
+
+def _not_modified(error: BadRequest) -> bool:
+    """Пользователь нажал кнопку экрана, который уже показан."""
+    return "not modified" in error.message
+
+async def _replace(message: Message, sent: Message) -> Message:
+    await message.delete()
+    _stats["replaced"] += 1
+    return sent
+
+async def edit_screen(message: Message, text: str, keep_photo: bool = False, **kwargs) -> Message:
+    """
+    Показывает текстовый экран. Дополнительные аргументы (reply_markup,
+    parse_mode) передаются в edit_text/edit_caption/reply_text.
+
+    Args:
+        keep_photo: Экран списка товаров: в сообщении с фото выводится в подписи,
+            чтобы следующая карточка открылась заменой фото
+    """
+    try:
+        if not message.photo:
+            sent = await message.edit_text(text, **kwargs)
+        elif keep_photo and len(text) <= CAPTION_LIMIT:
+            sent = await message.edit_caption(text, **kwargs)
+        else:
+            return await _replace(message, await message.reply_text(text, **kwargs))
+    except BadRequest as e:
+        if not _not_modified(e):
+            raise
+        return message
+    _stats["edited"] += 1
+    return sent
+
+async def edit_photo_screen(message: Message, image_path: str, caption: str, **kwargs) -> Message:
+    """
+    Показывает экран с фото (карточку товара). Дополнительные аргументы
+    (reply_markup, parse_mode) передаются в edit_media/reply_photo.
+
+    Raises:
+        OSError: Если файл изображения недоступен
+    """
+    if not message.photo:
+        return await _replace(message, await reply_photo_cached(message, image_path, caption=caption, **kwargs))
+    try:
+        sent = await edit_photo_cached(message, image_path, caption=caption, **kwargs)
+    except BadRequest as e:
+        if not _not_modified(e):
+            raise
+        return message
+    _stats["edited"] += 1
+    return sent
+
+def get_screen_stats() -> dict:
+    """Статистика вывода экранов: изменено на месте и заменено новым сообщением."""
+    return dict(_stats)
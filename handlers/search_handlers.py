@@ -1,22 +1,98 @@
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
-from sqlalchemy.orm import Session
-from database import get_db
-from auth import get_user, has_active_subscription, check_auth
-from search import (
-    search_by_price, search_by_manufacturer, search_by_city,
-    search_by_name, search_by_code, advanced_search,
-    get_all_manufacturers, get_all_cities
+from database import get_session
+from auth import check_auth
+from repository import (
+    search_page, count_products, get_all_manufacturers,
+    get_all_cities_from_products, get_manufacturer_by_id, get_city_by_id
 )
-from catalog import get_product_by_id, format_product_name_with_price, get_product_display_text
+from render_cache import render_cache, current_catalog_version
+from config import PAGE_SIZE
+from catalog import format_product_name_with_price
+from handlers.catalog_handlers import render_product_card
 from models import Product
+from callbacks import View, callback_button
+from handlers.states import SEARCH_TYPE, QUICK_SEARCH, QUICK_SEARCH_VALUE, SEARCH_RESULTS, PRODUCT_DETAIL
+from handlers.screens import edit_screen, edit_photo_screen
 
-# Состояния для ConversationHandler
-SEARCH_TYPE = 1
-QUICK_SEARCH = 2
-QUICK_SEARCH_VALUE = 3
-SEARCH_RESULTS = 4
-PRODUCT_DETAIL = 5
+# Заголовки результатов для каждого типа поиска
+SEARCH_TITLES = {
+    "price": "по цене",
+    "manufacturer": "по производителю",
+    "city": "по городу",
+    "name": "по названию",
+    "code": "по коду",
+}
+
+# Экраны, не зависящие от каталога, строятся один раз
+SEARCH_MENU = (
+    "🔍 *Поиск мебели*\n\n"
+    "Выберите тип поиска:",
+    InlineKeyboardMarkup([
+        [callback_button("💰 По цене", View.QUICK_SEARCH_PRICE)],
+        [callback_button("🏭 По производителю", View.QUICK_SEARCH_MANUFACTURER)],
+        [callback_button("🏙️ По городу", View.QUICK_SEARCH_CITY)],
+        [callback_button("📝 По названию", View.QUICK_SEARCH_NAME)],
+        [callback_button("🔢 По коду товара", View.QUICK_SEARCH_CODE)],
+        [callback_button("🏠 Главное меню", View.MAIN_MENU)]
+    ])
+)
+
+PRICE_MENU = (
+    "💰 *Поиск по цене*\n\n"
+    "Выберите максимальную цену:",
+    # Кнопки с различными ценовыми диапазонами
+    InlineKeyboardMarkup([
+        [callback_button("До 5 000₽", View.SEARCH_CHOICE, "price", 5000)],
+        [callback_button("До 10 000₽", View.SEARCH_CHOICE, "price", 10000)],
+        [callback_button("До 20 000₽", View.SEARCH_CHOICE, "price", 20000)],
+        [callback_button("До 30 000₽", View.SEARCH_CHOICE, "price", 30000)],
+        [callback_button("До 50 000₽", View.SEARCH_CHOICE, "price", 50000)],
+        [callback_button("Любая цена", View.SEARCH_CHOICE, "price", 0)],
+        [callback_button("⬅️ Назад к поиску", View.SEARCH)],
+        [callback_button("🏠 Главное меню", View.MAIN_MENU)]
+    ])
+)
+
+# Кнопки карточки товара, открытой из результатов поиска
+PRODUCT_MARKUP = InlineKeyboardMarkup([
+    [callback_button("⬅️ Назад к результатам", View.BACK_TO_RESULTS)],
+    [callback_button("🔍 Новый поиск", View.SEARCH)],
+    [callback_button("🏠 Главное меню", View.MAIN_MENU)]
+])
+
+def build_choice_menu(title: str, items, search_type: str):
+    """Формирует экран выбора значения для быстрого поиска: по кнопке на каждую пару (id, название)."""
+    keyboard = []
+    for item_id, name in items:
+        keyboard.append([callback_button(name, View.SEARCH_CHOICE, search_type, item_id)])
+    
+    keyboard.append([callback_button("⬅️ Назад к поиску", View.SEARCH)])
+    keyboard.append([callback_button("🏠 Главное меню", View.MAIN_MENU)])
+    
+    return title, InlineKeyboardMarkup(keyboard)
+
+async def render_manufacturer_menu():
+    """Возвращает экран выбора производителя из кэша или строит его."""
+    render = render_cache.get("manufacturers", None)
+    if render is None:
+        version = current_catalog_version()
+        manufacturers = await get_all_manufacturers(get_session())
+        render = build_choice_menu(
+            "🏭 *Поиск по производителю*\n\nВыберите производителя:", manufacturers, "manufacturer"
+        )
+        render_cache.put("manufacturers", None, render, version)
+    return render
+
+async def render_city_menu():
+    """Возвращает экран выбора города из кэша или строит его."""
+    render = render_cache.get("cities", None)
+    if render is None:
+        version = current_catalog_version()
+        cities = await get_all_cities_from_products(get_session())
+        render = build_choice_menu("🏙️ *Поиск по городу*\n\nВыберите город:", cities, "city")
+        render_cache.put("cities", None, render, version)
+    return render
 
 async def show_search_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает меню поиска."""
@@ -30,24 +106,10 @@ async def show_search_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         message = update.message
     
-    search_message = (
-        "🔍 *Поиск мебели*\n\n"
-        "Выберите тип поиска:"
-    )
-    
-    keyboard = [
-        [InlineKeyboardButton("💰 По цене", callback_data="quick_search_price")],
-        [InlineKeyboardButton("🏭 По производителю", callback_data="quick_search_manufacturer")],
-        [InlineKeyboardButton("🏙️ По городу", callback_data="quick_search_city")],
-        [InlineKeyboardButton("📝 По названию", callback_data="quick_search_name")],
-        [InlineKeyboardButton("🔢 По коду товара", callback_data="quick_search_code")],
-        [InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_menu")]
-    ]
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    search_message, reply_markup = SEARCH_MENU
     
     if update.callback_query:
-        await message.edit_text(search_message, reply_markup=reply_markup, parse_mode="Markdown")
+        await edit_screen(message, search_message, reply_markup=reply_markup, parse_mode="Markdown")
     else:
         await message.reply_text(search_message, reply_markup=reply_markup, parse_mode="Markdown")
     
@@ -60,26 +122,9 @@ async def quick_search_price(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     context.user_data["search_type"] = "price"
     
-    price_message = (
-        "💰 *Поиск по цене*\n\n"
-        "Выберите максимальную цену:"
-    )
-    
-    # Создаем кнопки с различными ценовыми диапазонами
-    keyboard = [
-        [InlineKeyboardButton("До 5 000₽", callback_data="price_5000")],
-        [InlineKeyboardButton("До 10 000₽", callback_data="price_10000")],
-        [InlineKeyboardButton("До 20 000₽", callback_data="price_20000")],
-        [InlineKeyboardButton("До 30 000₽", callback_data="price_30000")],
-        [InlineKeyboardButton("До 50 000₽", callback_data="price_50000")],
-        [InlineKeyboardButton("Любая цена", callback_data="price_any")],
-        [InlineKeyboardButton("⬅️ Назад к поиску", callback_data="search")],
-        [InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_menu")]
-    ]
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    price_message, reply_markup = PRICE_MENU
     
-    await query.message.edit_text(price_message, reply_markup=reply_markup, parse_mode="Markdown")
+    await edit_screen(query.message, price_message, reply_markup=reply_markup, parse_mode="Markdown")
     
     return QUICK_SEARCH
 
@@ -90,26 +135,9 @@ async def quick_search_manufacturer(update: Update, context: ContextTypes.DEFAUL
     
     context.user_data["search_type"] = "manufacturer"
     
-    # Получаем список производителей
-    db = next(get_db())
-    manufacturers = get_all_manufacturers(db)
-    
-    manufacturer_message = (
-        "🏭 *Поиск по производителю*\n\n"
-        "Выберите производителя:"
-    )
-    
-    # Создаем кнопки для каждого производителя
-    keyboard = []
-    for manufacturer in manufacturers:
-        keyboard.append([InlineKeyboardButton(manufacturer, callback_data=f"manufacturer_{manufacturer}")])
-    
-    keyboard.append([InlineKeyboardButton("⬅️ Назад к поиску", callback_data="search")])
-    keyboard.append([InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_menu")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    manufacturer_message, reply_markup = await render_manufacturer_menu()
     
-    await query.message.edit_text(manufacturer_message, reply_markup=reply_markup, parse_mode="Markdown")
+    await edit_screen(query.message, manufacturer_message, reply_markup=reply_markup, parse_mode="Markdown")
     
     return QUICK_SEARCH
 
@@ -120,26 +148,9 @@ async def quick_search_city(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     context.user_data["search_type"] = "city"
     
-    # Получаем список городов
-    db = next(get_db())
-    cities = get_all_cities(db)
+    city_message, reply_markup = await render_city_menu()
     
-    city_message = (
-        "🏙️ *Поиск по городу*\n\n"
-        "Выберите город:"
-    )
-    
-    # Создаем кнопки для каждого города
-    keyboard = []
-    for city in cities:
-        keyboard.append([InlineKeyboardButton(city, callback_data=f"city_{city}")])
-    
-    keyboard.append([InlineKeyboardButton("⬅️ Назад к поиску", callback_data="search")])
-    keyboard.append([InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_menu")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await query.message.edit_text(city_message, reply_markup=reply_markup, parse_mode="Markdown")
+    await edit_screen(query.message, city_message, reply_markup=reply_markup, parse_mode="Markdown")
     
     return QUICK_SEARCH
 
@@ -155,9 +166,10 @@ async def quick_search_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Введите название или часть названия товара:"
     )
     
-    await query.message.edit_text(
+    await edit_screen(
+        query.message,
         name_message,
-        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад к поиску", callback_data="search")]]),
+        reply_markup=InlineKeyboardMarkup([[callback_button("⬅️ Назад к поиску", View.SEARCH)]]),
         parse_mode="Markdown"
     )
     
@@ -175,9 +187,10 @@ async def quick_search_code(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Введите код товара или его часть:"
     )
     
-    await query.message.edit_text(
+    await edit_screen(
+        query.message,
         code_message,
-        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад к поиску", callback_data="search")]]),
+        reply_markup=InlineKeyboardMarkup([[callback_button("⬅️ Назад к поиску", View.SEARCH)]]),
         parse_mode="Markdown"
     )
     
@@ -191,22 +204,19 @@ async def process_search_value(update: Update, context: ContextTypes.DEFAULT_TYP
     # Сохраняем значение поиска
     context.user_data["search_value"] = search_value
     
-    # Выполняем поиск
-    db = next(get_db())
-    
     if search_type == "name":
-        products = search_by_name(db, search_value)
+        search_filters = {"name": search_value}
     elif search_type == "code":
-        products = search_by_code(db, search_value)
+        search_filters = {"code": search_value}
     else:
         await update.message.reply_text(
             "❌ Ошибка: неизвестный тип поиска.\n\nПожалуйста, вернитесь в меню поиска.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔍 Поиск", callback_data="search")]])
+            reply_markup=InlineKeyboardMarkup([[callback_button("🔍 Поиск", View.SEARCH)]])
         )
         return SEARCH_TYPE
     
-    # Отображаем результаты поиска
-    await show_search_results(update, context, products)
+    # Отображаем первую страницу результатов поиска
+    await show_search_results(update, context, search_filters)
     
     return SEARCH_RESULTS
 
@@ -215,166 +225,182 @@ async def process_search_callback(update: Update, context: ContextTypes.DEFAULT_
     query = update.callback_query
     await query.answer()
     
-    search_type = context.user_data.get("search_type")
-    callback_data = query.data
+    # Тип поиска передается кнопкой: меню могло быть открыто до выбора другого типа
+    search_type, value = context.args
+    context.user_data["search_type"] = search_type
     
-    # Выполняем поиск
-    db = next(get_db())
+    db = get_session()
     
     if search_type == "price":
-        if callback_data == "price_any":
-            max_price = None
+        if not value:
+            context.user_data["search_value"] = "любая"
+            search_filters = {}
         else:
-            max_price = float(callback_data.split("_")[1])
-        products = search_by_price(db, max_price)
+            context.user_data["search_value"] = f"до {value}₽"
+            search_filters = {"max_price": float(value)}
     elif search_type == "manufacturer":
-        manufacturer = callback_data.split("_", 1)[1]
-        products = search_by_manufacturer(db, manufacturer)
+        manufacturer_id = value
+        manufacturer = await get_manufacturer_by_id(db, manufacturer_id)
+        context.user_data["search_value"] = manufacturer.name if manufacturer else ""
+        search_filters = {"manufacturer_id": manufacturer_id}
     elif search_type == "city":
-        city = callback_data.split("_", 1)[1]
-        products = search_by_city(db, city)
+        city_id = value
+        city = await get_city_by_id(db, city_id)
+        context.user_data["search_value"] = city.name if city else ""
+        search_filters = {"city_id": city_id}
     else:
-        await query.message.edit_text(
+        await edit_screen(
+            query.message,
             "❌ Ошибка: неизвестный тип поиска.\n\nПожалуйста, вернитесь в меню поиска.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔍 Поиск", callback_data="search")]])
+            reply_markup=InlineKeyboardMarkup([[callback_button("🔍 Поиск", View.SEARCH)]])
         )
         return SEARCH_TYPE
     
-    # Отображаем результаты поиска
-    await show_search_results_callback(update, context, products)
+    # Отображаем первую страницу результатов поиска
+    await show_search_results(update, context, search_filters)
     
     return SEARCH_RESULTS
 
-async def show_search_results(update: Update, context: ContextTypes.DEFAULT_TYPE, products):
-    """Показывает результаты поиска."""
+def build_search_page(context: ContextTypes.DEFAULT_TYPE, products, page: int):
+    """Формирует текст и клавиатуру страницы результатов поиска."""
     search_type = context.user_data.get("search_type")
     search_value = context.user_data.get("search_value", "")
+    total = context.user_data.get("search_total", 0)
+    pages = max(1, (total + PAGE_SIZE - 1) // PAGE_SIZE)
     
     # Формируем сообщение с результатами поиска
-    if search_type == "name":
-        search_message = f"🔍 *Результаты поиска по названию:* {search_value}\n\n"
-    elif search_type == "code":
-        search_message = f"🔍 *Результаты поиска по коду:* {search_value}\n\n"
+    if search_type in SEARCH_TITLES:
+        search_message = f"🔍 *Результаты поиска {SEARCH_TITLES[search_type]}:* {search_value}\n\n"
     else:
         search_message = "🔍 *Результаты поиска*\n\n"
     
-    search_message += f"Найдено товаров: {len(products)}\n\n"
+    search_message += f"Найдено товаров: {total}\n"
+    if pages > 1:
+        search_message += f"Страница {page} из {pages}\n"
+    search_message += "\n"
     
     if not products:
         search_message += "К сожалению, ничего не найдено. Попробуйте изменить параметры поиска."
     else:
         search_message += "Выберите товар для просмотра подробной информации:"
     
-    # Создаем кнопки для каждого товара, сортируем по цене
+    # Создаем кнопки для товаров страницы в порядке, заданном поиском
     keyboard = []
-    for product in sorted(products, key=lambda p: p.price):
-        keyboard.append([InlineKeyboardButton(
-            format_product_name_with_price(product), 
-            callback_data=f"product_{product.id}"
+    for product in products:
+        keyboard.append([callback_button(
+            format_product_name_with_price(product), View.SEARCH_PRODUCT, product.id
         )])
     
-    keyboard.append([InlineKeyboardButton("🔍 Новый поиск", callback_data="search")])
-    keyboard.append([InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_menu")])
+    # Кнопки перелистывания несут курсор - цену и id товара на границе страницы
+    navigation = []
+    if products and page > 1:
+        first = products[0]
+        navigation.append(callback_button(
+            "◀️", View.SEARCH_PAGE, page - 1, True, first.price, first.id
+        ))
+    if products and page < pages:
+        last = products[-1]
+        navigation.append(callback_button(
+            "▶️", View.SEARCH_PAGE, page + 1, False, last.price, last.id
+        ))
+    if navigation:
+        keyboard.append(navigation)
+    
+    keyboard.append([callback_button("🔍 Новый поиск", View.SEARCH)])
+    keyboard.append([callback_button("🏠 Главное меню", View.MAIN_MENU)])
+    
+    return search_message, InlineKeyboardMarkup(keyboard)
+
+async def show_search_results(update: Update, context: ContextTypes.DEFAULT_TYPE, search_filters):
+    """Выполняет поиск и показывает первую страницу результатов."""
+    db = get_session()
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # Общее количество считается один раз, перелистывание загружает только страницу
+    context.user_data["search_filters"] = search_filters
+    context.user_data["search_total"] = await count_products(db, search_filters)
+    products = await search_page(db, search_filters, limit=PAGE_SIZE)
     
-    await update.message.reply_text(search_message, reply_markup=reply_markup, parse_mode="Markdown")
-
-async def show_search_results_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, products):
-    """Показывает результаты поиска через callback."""
-    query = update.callback_query
-    search_type = context.user_data.get("search_type")
+    search_message, reply_markup = build_search_page(context, products, 1)
     
-    # Формируем сообщение с результатами поиска
-    if search_type == "price":
-        if query.data == "price_any":
-            search_message = "🔍 *Результаты поиска по цене:* любая\n\n"
-        else:
-            max_price = query.data.split("_")[1]
-            search_message = f"🔍 *Результаты поиска по цене:* до {max_price}₽\n\n"
-    elif search_type == "manufacturer":
-        manufacturer = query.data.split("_", 1)[1]
-        search_message = f"🔍 *Результаты поиска по производителю:* {manufacturer}\n\n"
-    elif search_type == "city":
-        city = query.data.split("_", 1)[1]
-        search_message = f"🔍 *Результаты поиска по городу:* {city}\n\n"
+    if update.callback_query:
+        await edit_screen(
+            update.callback_query.message, search_message, keep_photo=True,
+            reply_markup=reply_markup, parse_mode="Markdown"
+        )
     else:
-        search_message = "🔍 *Результаты поиска*\n\n"
+        await update.message.reply_text(search_message, reply_markup=reply_markup, parse_mode="Markdown")
+
+async def show_search_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показывает следующую или предыдущую страницу результатов поиска."""
+    query = update.callback_query
+    await query.answer()
     
-    search_message += f"Найдено товаров: {len(products)}\n\n"
+    search_filters = context.user_data.get("search_filters")
+    if search_filters is None:
+        await edit_screen(
+            query.message,
+            "❌ Результаты поиска устарели.\n\nПожалуйста, выполните поиск заново.",
+            reply_markup=InlineKeyboardMarkup([[callback_button("🔍 Поиск", View.SEARCH)]])
+        )
+        return SEARCH_TYPE
     
-    if not products:
-        search_message += "К сожалению, ничего не найдено. Попробуйте изменить параметры поиска."
-    else:
-        search_message += "Выберите товар для просмотра подробной информации:"
+    page, backward, price, product_id = context.args
     
-    # Создаем кнопки для каждого товара, сортируем по цене
-    keyboard = []
-    for product in sorted(products, key=lambda p: p.price):
-        keyboard.append([InlineKeyboardButton(
-            format_product_name_with_price(product), 
-            callback_data=f"product_{product.id}"
-        )])
+    db = get_session()
+    products = await search_page(
+        db, search_filters, (price, product_id),
+        backward=bool(backward), limit=PAGE_SIZE
+    )
     
-    keyboard.append([InlineKeyboardButton("🔍 Новый поиск", callback_data="search")])
-    keyboard.append([InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_menu")])
+    search_message, reply_markup = build_search_page(context, products, page)
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    await edit_screen(query.message, search_message, keep_photo=True, reply_markup=reply_markup, parse_mode="Markdown")
     
-    await query.message.edit_text(search_message, reply_markup=reply_markup, parse_mode="Markdown")
+    return SEARCH_RESULTS
 
 async def show_product_details(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает подробную информацию о выбранном товаре."""
     query = update.callback_query
     await query.answer()
     
-    product_id = int(query.data.split("_")[1])
+    product_id = context.args[0]
     
-    # Получаем информацию о товаре
-    db = next(get_db())
-    product = get_product_by_id(db, product_id)
+    card = await render_product_card(product_id)
     
-    if not product:
-        await query.message.edit_text(
+    if card is None:
+        await edit_screen(
+            query.message,
             "❌ Товар не найден.\n\n"
             "Пожалуйста, выберите другой товар или вернитесь к поиску.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔍 Поиск", callback_data="search")]])
+            reply_markup=InlineKeyboardMarkup([[callback_button("🔍 Поиск", View.SEARCH)]])
         )
         return SEARCH_RESULTS
     
-    # Формируем текст с информацией о товаре
-    product_text = get_product_display_text(product)
-    
-    # Создаем кнопки навигации
-    keyboard = [
-        [InlineKeyboardButton("⬅️ Назад к результатам", callback_data="back_to_results")],
-        [InlineKeyboardButton("🔍 Новый поиск", callback_data="search")],
-        [InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_menu")]
-    ]
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    product_text, photo_path, _ = card
+    reply_markup = PRODUCT_MARKUP
     
     # Если есть изображение, отправляем его
-    if product.image_path:
+    if photo_path:
         try:
-            with open(product.image_path, 'rb') as photo:
-                await query.message.reply_photo(
-                    photo=photo,
-                    caption=product_text,
-                    reply_markup=reply_markup,
-                    parse_mode="Markdown"
-                )
-            await query.message.delete()
+            await edit_photo_screen(
+                query.message,
+                photo_path,
+                caption=product_text,
+                reply_markup=reply_markup,
+                parse_mode="Markdown"
+            )
         except Exception as e:
             # Если не удалось отправить изображение, отправляем только текст
-            await query.message.edit_text(
+            await edit_screen(
+                query.message,
                 product_text + "\n\n(Изображение недоступно)",
                 reply_markup=reply_markup,
                 parse_mode="Markdown"
             )
     else:
         # Если изображения нет, отправляем только текст
-        await query.message.edit_text(
+        await edit_screen(
+            query.message,
             product_text,
             reply_markup=reply_markup,
             parse_mode="Markdown"
@@ -0,0 +1,23 @@
+"""
+Состояния ConversationHandler.
+
+Общие для всех обработчиков: состояние, которое возвращает обработчик,
+сохраняется в ConversationHandler и в bot_state, поэтому номера не меняются.
+Нажатия кнопок обрабатываются в любом состоянии (callbacks.CallbackRouter);
+состояние определяет только, как будет обработан введенный текст.
+"""
+
+AUTH_CODE = 1
+MAIN_MENU = 2
+CATEGORY_SELECTION = 3
+PRODUCT_SELECTION = 4
+PRODUCT_DETAIL = 5
+SEARCH_TYPE = 6
+QUICK_SEARCH = 7
+QUICK_SEARCH_VALUE = 8
+SEARCH_RESULTS = 9
+SUBSCRIPTION_MENU = 10
+SUBSCRIPTION_PERIOD = 11
+SUBSCRIPTION_PAYMENT = 12
+SUBSCRIPTION_CONFIRMATION = 13
+CATEGORY_ACTION = 14
@@ -1,24 +1,21 @@
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+import uuid
+from telegram import Update, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
-from sqlalchemy.orm import Session
-from database import get_db
-from auth import get_user, has_active_subscription
-from subscription import get_subscription_info, extend_subscription, cancel_subscription
+from database import get_session
+from repository import get_user, get_subscription_info, extend_subscription, cancel_subscription
 from models import SubscriptionStatus
-
-# Состояния для ConversationHandler
-SUBSCRIPTION_MENU = 1
-SUBSCRIPTION_PERIOD = 2
-SUBSCRIPTION_PAYMENT = 3
-SUBSCRIPTION_CONFIRMATION = 4
+from callbacks import View, callback_button
+from handlers.screens import edit_screen
+from handlers.states import SUBSCRIPTION_MENU, SUBSCRIPTION_PERIOD, SUBSCRIPTION_PAYMENT, SUBSCRIPTION_CONFIRMATION
 
 async def show_subscription_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает меню управления подпиской."""
     user = update.effective_user
-    db = next(get_db())
+    db = get_session()
     
     # Получаем информацию о подписке
-    subscription_info = get_subscription_info(db, get_user(db, str(user.id)).id)
+    db_user = await get_user(db, str(user.id))
+    subscription_info = await get_subscription_info(db, db_user.id)
     
     if subscription_info["status"] == "active":
         # У пользователя есть активная подписка
@@ -31,10 +28,10 @@ async def show_subscription_menu(update: Update, context: ContextTypes.DEFAULT_T
         )
         
         keyboard = [
-            [InlineKeyboardButton("📅 Продлить на месяц", callback_data="subscribe_MONTH")],
-            [InlineKeyboardButton("📆 Продлить на год", callback_data="subscribe_YEAR")],
-            [InlineKeyboardButton("❌ Отменить подписку", callback_data="cancel_subscription")],
-            [InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_menu")]
+            [callback_button("📅 Продлить на месяц", View.SUBSCRIBE, "MONTH")],
+            [callback_button("📆 Продлить на год", View.SUBSCRIBE, "YEAR")],
+            [callback_button("❌ Отменить подписку", View.CANCEL_SUBSCRIPTION)],
+            [callback_button("🏠 Главное меню", View.MAIN_MENU)]
         ]
     else:
         # У пользователя нет активной подписки
@@ -45,16 +42,17 @@ async def show_subscription_menu(update: Update, context: ContextTypes.DEFAULT_T
         )
         
         keyboard = [
-            [InlineKeyboardButton("📅 Подписка на месяц - 500₽", callback_data="subscribe_MONTH")],
-            [InlineKeyboardButton("📆 Подписка на год - 5000₽", callback_data="subscribe_YEAR")],
-            [InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_menu")]
+            [callback_button("📅 Подписка на месяц - 500₽", View.SUBSCRIBE, "MONTH")],
+            [callback_button("📆 Подписка на год - 5000₽", View.SUBSCRIBE, "YEAR")],
+            [callback_button("🏠 Главное меню", View.MAIN_MENU)]
         ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     if update.callback_query:
         await update.callback_query.answer()
-        await update.callback_query.message.edit_text(
+        await edit_screen(
+            update.callback_query.message,
             subscription_text,
             reply_markup=reply_markup,
             parse_mode="Markdown"
@@ -73,7 +71,7 @@ async def select_subscription_period(update: Update, context: ContextTypes.DEFAU
     query = update.callback_query
     await query.answer()
     
-    subscription_type = query.data.split("_")[1]
+    subscription_type = context.args[0]
     context.user_data["subscription_type"] = subscription_type
     
     # Определяем стоимость и период
@@ -85,9 +83,10 @@ async def select_subscription_period(update: Update, context: ContextTypes.DEFAU
         period = "1 год"
     else:
         # Этот случай не должен произойти, но на всякий случай
-        await query.message.edit_text(
+        await edit_screen(
+            query.message,
             "❌ Ошибка: неизвестный тип подписки.\n\nПожалуйста, вернитесь в меню подписки.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Назад", callback_data="subscription")]])
+            reply_markup=InlineKeyboardMarkup([[callback_button("🔙 Назад", View.SUBSCRIPTION)]])
         )
         return SUBSCRIPTION_MENU
     
@@ -99,15 +98,16 @@ async def select_subscription_period(update: Update, context: ContextTypes.DEFAU
     )
     
     keyboard = [
-        [InlineKeyboardButton("💳 Банковская карта", callback_data="payment_card")],
-        [InlineKeyboardButton("🏦 СБП", callback_data="payment_sbp")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="subscription")],
-        [InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_menu")]
+        [callback_button("💳 Банковская карта", View.PAYMENT, "card")],
+        [callback_button("🏦 СБП", View.PAYMENT, "sbp")],
+        [callback_button("🔙 Назад", View.SUBSCRIPTION)],
+        [callback_button("🏠 Главное меню", View.MAIN_MENU)]
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.message.edit_text(
+    await edit_screen(
+        query.message,
         payment_text,
         reply_markup=reply_markup,
         parse_mode="Markdown"
@@ -120,11 +120,14 @@ async def process_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    payment_method = query.data.split("_")[1]
+    payment_method = context.args[0]
     context.user_data["payment_method"] = payment_method
     
     # В реальном боте здесь была бы интеграция с платежной системой
-    # Для демонстрации просто показываем сообщение об успешной оплате
+    # Для демонстрации просто показываем сообщение об успешной оплате.
+    # Идентификатор платежа (в реальном боте - от платежной системы) не дает
+    # повторному нажатию "Подтвердить" продлить подписку второй раз
+    context.user_data["payment_id"] = uuid.uuid4().hex
     
     payment_text = (
         f"✅ *Оплата успешно выполнена!*\n\n"
@@ -132,13 +135,14 @@ async def process_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     
     keyboard = [
-        [InlineKeyboardButton("✅ Подтвердить активацию", callback_data="payment_confirmed")],
-        [InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_menu")]
+        [callback_button("✅ Подтвердить активацию", View.PAYMENT_CONFIRMED)],
+        [callback_button("🏠 Главное меню", View.MAIN_MENU)]
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.message.edit_text(
+    await edit_screen(
+        query.message,
         payment_text,
         reply_markup=reply_markup,
         parse_mode="Markdown"
@@ -152,11 +156,12 @@ async def confirm_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user = update.effective_user
-    db = next(get_db())
-    db_user = get_user(db, str(user.id))
+    db = get_session()
+    db_user = await get_user(db, str(user.id))
     
     if not db_user:
-        await query.message.edit_text(
+        await edit_screen(
+            query.message,
             "❌ Ошибка: пользователь не найден в базе данных.\n\nПожалуйста, начните с команды /start."
         )
         return ConversationHandler.END
@@ -164,7 +169,9 @@ async def confirm_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     subscription_type = context.user_data.get("subscription_type", "MONTH")
     
     # Активируем или продлеваем подписку
-    subscription = extend_subscription(db, db_user.id, subscription_type, payment_id="manual_payment")
+    subscription = await extend_subscription(
+        db, db_user.id, subscription_type, payment_id=context.user_data.get("payment_id")
+    )
     
     if subscription:
         confirmation_text = (
@@ -175,21 +182,23 @@ async def confirm_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         
         keyboard = [
-            [InlineKeyboardButton("🛋️ Перейти в каталог", callback_data="catalog")],
-            [InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_menu")]
+            [callback_button("🛋️ Перейти в каталог", View.CATALOG)],
+            [callback_button("🏠 Главное меню", View.MAIN_MENU)]
         ]
         
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await query.message.edit_text(
+        await edit_screen(
+            query.message,
             confirmation_text,
             reply_markup=reply_markup,
             parse_mode="Markdown"
         )
     else:
-        await query.message.edit_text(
+        await edit_screen(
+            query.message,
             "❌ Ошибка при активации подписки.\n\nПожалуйста, попробуйте еще раз или обратитесь к администратору.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_menu")]])
+            reply_markup=InlineKeyboardMarkup([[callback_button("🏠 Главное меню", View.MAIN_MENU)]])
         )
     
     return SUBSCRIPTION_CONFIRMATION
@@ -200,11 +209,12 @@ async def cancel_subscription_handler(update: Update, context: ContextTypes.DEFA
     await query.answer()
     
     user = update.effective_user
-    db = next(get_db())
-    db_user = get_user(db, str(user.id))
+    db = get_session()
+    db_user = await get_user(db, str(user.id))
     
     if not db_user:
-        await query.message.edit_text(
+        await edit_screen(
+            query.message,
             "❌ Ошибка: пользователь не найден в базе данных.\n\nПожалуйста, начните с команды /start."
         )
         return ConversationHandler.END
@@ -217,13 +227,14 @@ async def cancel_subscription_handler(update: Update, context: ContextTypes.DEFA
     )
     
     keyboard = [
-        [InlineKeyboardButton("✅ Да, отменить", callback_data="confirm_cancel")],
-        [InlineKeyboardButton("❌ Нет, вернуться", callback_data="subscription")]
+        [callback_button("✅ Да, отменить", View.CONFIRM_CANCEL)],
+        [callback_button("❌ Нет, вернуться", View.SUBSCRIPTION)]
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.message.edit_text(
+    await edit_screen(
+        query.message,
         confirmation_text,
         reply_markup=reply_markup,
         parse_mode="Markdown"
@@ -237,29 +248,32 @@ async def confirm_cancel_subscription(update: Update, context: ContextTypes.DEFA
     await query.answer()
     
     user = update.effective_user
-    db = next(get_db())
-    db_user = get_user(db, str(user.id))
+    db = get_session()
+    db_user = await get_user(db, str(user.id))
     
     if not db_user:
-        await query.message.edit_text(
+        await edit_screen(
+            query.message,
             "❌ Ошибка: пользователь не найден в базе данных.\n\nПожалуйста, начните с команды /start."
         )
         return ConversationHandler.END
     
     # Отменяем подписку
-    success = cancel_subscription(db, db_user.id)
+    success = await cancel_subscription(db, db_user.id)
     
     if success:
-        await query.message.edit_text(
+        await edit_screen(
+            query.message,
             "✅ Ваша подписка успешно отменена.\n\n"
             "Вы можете оформить новую подписку в любое время через меню подписки.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_menu")]])
+            reply_markup=InlineKeyboardMarkup([[callback_button("🏠 Главное меню", View.MAIN_MENU)]])
         )
     else:
-        await query.message.edit_text(
+        await edit_screen(
+            query.message,
             "❌ Ошибка при отмене подписки.\n\n"
             "Возможно, у вас нет активной подписки или произошла ошибка базы данных.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_menu")]])
+            reply_markup=InlineKeyboardMarkup([[callback_button("🏠 Главное меню", View.MAIN_MENU)]])
         )
     
     return ConversationHandler.END
@@ -0,0 +1,137 @@
+"""
+Кэш file_id изображений товаров.
+
+Telegram хранит каждый загруженный файл и возвращает его file_id, по которому
+фото можно отправить повторно без передачи содержимого. Таблица image_cache
+связывает путь к изображению и хеш его содержимого с полученным file_id:
+первая отправка загружает файл, последующие передают только file_id. Если
+файл изменился (хеш не совпадает), он загружается заново и запись обновляется.
+Так же отправляются фото при замене содержимого сообщения (edit_photo_cached).
+"""
+import asyncio
+import functools
+import hashlib
+import logging
+import os
+from typing import Optional, Tuple
+from sqlalchemy.orm import Session
+from telegram import Bot, Message, InputMediaPhoto
+from telegram.error import BadRequest
+from database import get_session
+from models import ImageCache
+
+logger = logging.getLogger(__name__)
+
+# Путь -> (размер, время изменения, хеш): файл перечитывается, только если изменились
+# размер или время изменения
+_signatures = {}
+
+_stats = {"hits": 0, "misses": 0, "bytes_uploaded": 0, "bytes_saved": 0}
+
+def file_signature(image_path: str) -> Tuple[str, int]:
+    """
+    Возвращает хеш содержимого и размер файла.
+
+    Raises:
+        OSError: Если файл недоступен
+    """
+    stat = os.stat(image_path)
+    cached = _signatures.get(image_path)
+    if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+        return cached[2], stat.st_size
+    digest = hashlib.sha256()
+    with open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    content_hash = digest.hexdigest()
+    _signatures[image_path] = (stat.st_size, stat.st_mtime_ns, content_hash)
+    return content_hash, stat.st_size
+
+def read_file(image_path: str) -> bytes:
+    """Читает файл целиком."""
+    with open(image_path, 'rb') as f:
+        return f.read()
+
+def get_cached_file_id(db: Session, image_path: str, content_hash: str) -> Optional[str]:
+    """Получает file_id изображения, если содержимое файла не изменилось."""
+    entry = db.query(ImageCache).filter(ImageCache.image_path == image_path).first()
+    if entry is None or entry.content_hash != content_hash:
+        return None
+    return entry.file_id
+
+def save_file_id(db: Session, image_path: str, content_hash: str, file_id: str, file_size: int):
+    """Сохраняет file_id загруженного изображения."""
+    db.merge(ImageCache(image_path=image_path, content_hash=content_hash, file_id=file_id, file_size=file_size))
+    db.commit()
+
+def forget_file_id(db: Session, image_path: str):
+    """Удаляет file_id, который Telegram перестал принимать."""
+    db.query(ImageCache).filter(ImageCache.image_path == image_path).delete()
+    db.commit()
+
+async def _send_photo_cached(send, image_path: str, **kwargs) -> Message:
+    """Отправляет фото функцией send(photo=..., **kwargs), используя сохраненный file_id."""
+    # Хеширование и чтение файла выполняются в отдельном потоке
+    content_hash, file_size = await asyncio.to_thread(file_signature, image_path)
+    db = get_session()
+
+    file_id = await db.run_sync(get_cached_file_id, image_path, content_hash)
+    if file_id is not None:
+        try:
+            sent = await send(photo=file_id, **kwargs)
+            _stats["hits"] += 1
+            _stats["bytes_saved"] += file_size
+            return sent
+        except BadRequest as e:
+            # Сообщение уже показывает это фото: file_id действителен
+            if "not modified" in e.message:
+                raise
+            logger.warning("Telegram не принял сохраненный file_id для %s: %s", image_path, e)
+            await db.run_sync(forget_file_id, image_path)
+
+    content = await asyncio.to_thread(read_file, image_path)
+    sent = await send(photo=content, **kwargs)
+    _stats["misses"] += 1
+    _stats["bytes_uploaded"] += len(content)
+    # Telegram возвращает несколько размеров фото, последний - исходный
+    await db.run_sync(save_file_id, image_path, content_hash, sent.photo[-1].file_id, file_size)
+    return sent
+
+async def reply_photo_cached(message: Message, image_path: str, **kwargs) -> Message:
+    """
+    Отправляет фото в ответ на сообщение, используя сохраненный file_id.
+    Дополнительные аргументы передаются в Message.reply_photo.
+
+    Raises:
+        OSError: Если файл изображения недоступен
+    """
+    return await _send_photo_cached(message.reply_photo, image_path, **kwargs)
+
+async def send_photo_cached(bot: Bot, chat_id, image_path: str, **kwargs) -> Message:
+    """
+    Отправляет фото в чат, используя сохраненный file_id.
+    Дополнительные аргументы передаются в Bot.send_photo.
+
+    Raises:
+        OSError: Если файл изображения недоступен
+    """
+    return await _send_photo_cached(functools.partial(bot.send_photo, chat_id), image_path, **kwargs)
+
+async def edit_photo_cached(message: Message, image_path: str, caption: Optional[str] = None,
+                            parse_mode: Optional[str] = None, reply_markup=None) -> Message:
+    """
+    Заменяет фото и подпись сообщения с фото, используя сохраненный file_id.
+
+    Raises:
+        OSError: Если файл изображения недоступен
+    """
+    async def edit(photo):
+        return await message.edit_media(
+            InputMediaPhoto(photo, caption=caption, parse_mode=parse_mode), reply_markup=reply_markup
+        )
+    return await _send_photo_cached(edit, image_path)
+
+def get_image_cache_stats() -> dict:
+    """Статистика кэша: попадания, загрузки и сэкономленный объем."""
+    total = _stats["hits"] + _stats["misses"]
+    return dict(_stats, hit_rate=_stats["hits"] / total if total else 0.0)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Подготовка изображений товаров для отправки в Telegram.
+
+Исходный файл, указанный в image_path, может быть многомегабайтной фотографией
+с камеры. Для каждого товара строятся производные изображения:
+- photo: JPEG не больше 1280 пикселей по большей стороне (его отправляет бот);
+- thumbnail: JPEG-миниатюра 320 пикселей;
+- webp: WebP не больше 1280 пикселей.
+
+Файлы именуются по хешу содержимого и хранятся в каталоге images рядом с базой.
+В товар записываются пути относительно каталога базы, поэтому базу вместе с
+каталогом images можно перенести на сервер бота. Обработка выполняется в пуле
+процессов. Повторный запуск пропускает товары, исходный файл которых не
+изменился.
+
+Модуль работает напрямую через sqlite3, поэтому используется и ботом,
+и программой управления каталогом. Требуется Pillow.
+
+Запуск: python image_ingest.py [путь_к_базе] [--force] [--workers N] [--product ID ...]
+"""
+import argparse
+import hashlib
+import io
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Optional
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# Производные изображения: имя -> (столбец товара, наибольшая сторона, формат, параметры сохранения)
+DERIVATIVES = {
+    "photo": ("photo_path", 1280, "JPEG", {"quality": 85, "optimize": True, "progressive": True}),
+    "thumbnail": ("thumbnail_path", 320, "JPEG", {"quality": 80, "optimize": True, "progressive": True}),
+    "webp": ("webp_path", 1280, "WEBP", {"quality": 80, "method": 4}),
+}
+
+EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp"}
+
+# Каталог производных изображений относительно каталога базы
+IMAGES_DIR = "images"
+
+def resolve_image_path(path: str, db_dir: str) -> str:
+    """
+    Путь к производному изображению по значению из базы. Относительные пути
+    отсчитываются от каталога базы; абсолютные (записанные прежними версиями)
+    возвращаются без изменений.
+    """
+    return os.path.join(db_dir, path)
+
+def file_hash(path: str) -> str:
+    """Хеш содержимого файла."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _store(content: bytes, extension: str, db_dir: str) -> str:
+    """Сохраняет файл под именем, равным хешу содержимого, и возвращает путь относительно каталога базы."""
+    name = hashlib.sha256(content).hexdigest()
+    relative_path = os.path.join(IMAGES_DIR, name[:2], f"{name}.{extension}")
+    path = os.path.join(db_dir, relative_path)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Запись через временный файл: бот не увидит недописанное изображение
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+    return relative_path
+
+def build_derivatives(source_path: str, db_dir: str) -> Dict[str, str]:
+    """
+    Строит производные изображения одного файла (выполняется в процессе пула).
+
+    Returns:
+        dict: Столбец товара -> путь к производному изображению относительно каталога базы
+    """
+    with Image.open(source_path) as original:
+        # Учитываем поворот из EXIF, JPEG не поддерживает прозрачность
+        image = ImageOps.exif_transpose(original).convert("RGB")
+    paths = {}
+    for column, max_side, image_format, options in DERIVATIVES.values():
+        derivative = image.copy()
+        derivative.thumbnail((max_side, max_side), Image.LANCZOS)
+        buffer = io.BytesIO()
+        derivative.save(buffer, image_format, **options)
+        paths[column] = _store(buffer.getvalue(), EXTENSIONS[image_format], db_dir)
+    return paths
+
+def _process(task):
+    """Задача пула: (id товара, исходный файл, хеш, каталог базы) -> результат обработки."""
+    product_id, source_path, source_hash, db_dir = task
+    try:
+        return product_id, source_hash, build_derivatives(source_path, db_dir), None
+    except Exception as e:
+        return product_id, source_hash, None, str(e)
+
+def has_ingest_columns(conn: sqlite3.Connection) -> bool:
+    """Проверяет, что в таблице products есть столбцы производных изображений."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(products)")}
+    return {"image_hash"} | {column for column, *_ in DERIVATIVES.values()} <= columns
+
+def ingest_images(db_path: str, product_ids: Optional[Iterable[int]] = None,
+                  force: bool = False, workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Строит производные изображения для товаров и записывает пути в базу.
+
+    Args:
+        db_path: Путь к файлу базы данных
+        product_ids: Обработать только эти товары (по умолчанию - все)
+        force: Обработать товары заново, даже если исходный файл не изменился
+        workers: Количество процессов (по умолчанию - по числу процессоров)
+
+    Returns:
+        dict: Количество обработанных, пропущенных, отсутствующих файлов и ошибок,
+            а также errors - список (id товара, текст ошибки)
+    """
+    if Image is None:
+        raise RuntimeError("Для обработки изображений требуется Pillow (pip install Pillow)")
+
+    db_dir = os.path.dirname(os.path.abspath(db_path))
+    stats = {"processed": 0, "skipped": 0, "missing": 0, "failed": 0, "errors": []}
+    conn = sqlite3.connect(db_path, timeout=10)
+    try:
+        if not has_ingest_columns(conn):
+            raise RuntimeError("В базе нет столбцов для производных изображений. Запустите бота, чтобы применить миграции.")
+
+        query = "SELECT id, image_path, image_hash, photo_path FROM products WHERE image_path IS NOT NULL AND image_path != ''"
+        params = []
+        if product_ids is not None:
+            product_ids = list(product_ids)
+            query += f" AND id IN ({', '.join('?' * len(product_ids))})"
+            params = product_ids
+
+        tasks = []
+        for product_id, image_path, image_hash, photo_path in conn.execute(query, params).fetchall():
+            if not os.path.isfile(image_path):
+                stats["missing"] += 1
+                continue
+            source_hash = file_hash(image_path)
+            # Абсолютные пути прежних версий переписываются на относительные
+            if (not force and source_hash == image_hash and photo_path and not os.path.isabs(photo_path)
+                    and os.path.isfile(resolve_image_path(photo_path, db_dir))):
+                stats["skipped"] += 1
+                continue
+            tasks.append((product_id, image_path, source_hash, db_dir))
+
+        if tasks:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for product_id, source_hash, paths, error in pool.map(_process, tasks):
+                    if error is not None:
+                        stats["errors"].append((product_id, error))
+                        stats["failed"] += 1
+                        continue
+                    columns = ", ".join(f"{column} = ?" for column in paths)
+                    conn.execute(
+                        f"UPDATE products SET {columns}, image_hash = ? WHERE id = ?",
+                        (*paths.values(), source_hash, product_id)
+                    )
+                    conn.commit()
+                    stats["processed"] += 1
+    finally:
+        conn.close()
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Подготовка изображений товаров для Telegram")
+    parser.add_argument("db_path", nargs="?", default="catalog.db", help="Путь к файлу базы данных")
+    parser.add_argument("--force", action="store_true", help="Обработать все изображения заново")
+    parser.add_argument("--workers", type=int, default=None, help="Количество процессов")
+    parser.add_argument("--product", type=int, nargs="*", help="ID товаров для обработки")
+    args = parser.parse_args()
+
+    stats = ingest_images(args.db_path, args.product, args.force, args.workers)
+    for product_id, error in stats["errors"]:
+        print(f"Товар {product_id}: не удалось обработать изображение: {error}")
+    print(
+        f"Обработано: {stats['processed']}, без изменений: {stats['skipped']}, "
+        f"файл не найден: {stats['missing']}, ошибок: {stats['failed']}"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,52 @@
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, InlineKeyboardMarkup
 from telegram.ext import (
-    Application, CommandHandler, MessageHandler, CallbackQueryHandler,
+    Application, CommandHandler, MessageHandler,
     ConversationHandler, filters, ContextTypes
 )
 import logging
 import os
+from datetime import time, timezone
 from dotenv import load_dotenv
 from database import init_db, check_db_exists
-from config import BOT_TOKEN
+from migrations import run_migrations, check_query_plans
+from persistence import SQLitePersistence
+from rate_limiter import PriorityRateLimiter
+from flood_guard import flood_guard
+from callbacks import View, CallbackRouter, callback_button
+from application import (
+    BotApplication, post_init, post_stop, post_shutdown, log_storage_settings,
+    storage_maintenance, catalog_index_refresh, broadcast_check, subscription_expiry,
+    subscription_reminders, activity_flush
+)
+from config import (
+    BOT_TOKEN, BOT_MODE, TELEGRAM_API_URL, MAX_PENDING_UPDATES,
+    SQLITE_MAINTENANCE_INTERVAL, CATALOG_INDEX_REFRESH_INTERVAL, PERSISTENCE_UPDATE_INTERVAL,
+    RATE_LIMIT_OVERALL, RATE_LIMIT_CHAT, RATE_LIMIT_CHAT_BURST, RATE_LIMIT_GROUP, RATE_LIMIT_MAX_RETRIES,
+    BROADCAST_POLL_INTERVAL, SUBSCRIPTION_EXPIRY_INTERVAL, ACTIVITY_FLUSH_INTERVAL, SUBSCRIPTION_REMINDER_TIME
+)
 from handlers.auth_handlers import (
-    start, auth_code_handler, show_main_menu, profile
+    start, auth_code_handler, show_main_menu, profile, MAIN_MENU as MAIN_MENU_RENDER
 )
 from handlers.catalog_handlers import (
-    show_catalog, show_category_action, show_category_products, 
+    show_catalog, show_category_action, show_category_products, show_category_page,
     show_product_details as catalog_product_details
 )
 from handlers.search_handlers import (
     show_search_menu, quick_search_price, quick_search_manufacturer,
     quick_search_city, quick_search_name, quick_search_code,
     process_search_value, process_search_callback, show_product_details,
-    back_to_results
+    back_to_results, show_search_page
 )
 from handlers.subscription_handlers import (
     show_subscription_menu, select_subscription_period, process_payment,
     confirm_payment, cancel_subscription_handler, confirm_cancel_subscription
 )
+from handlers.screens import edit_screen
+from handlers.states import (
+    AUTH_CODE, MAIN_MENU, CATEGORY_SELECTION, PRODUCT_SELECTION, PRODUCT_DETAIL,
+    SEARCH_TYPE, QUICK_SEARCH, QUICK_SEARCH_VALUE, SEARCH_RESULTS, SUBSCRIPTION_MENU,
+    SUBSCRIPTION_PERIOD, SUBSCRIPTION_PAYMENT, SUBSCRIPTION_CONFIRMATION, CATEGORY_ACTION
+)
 
 # Настройка логирования
 logging.basicConfig(
@@ -33,22 +55,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Состояния для ConversationHandler
-AUTH_CODE = 1
-MAIN_MENU = 2
-CATEGORY_SELECTION = 3
-PRODUCT_SELECTION = 4
-PRODUCT_DETAIL = 5
-SEARCH_TYPE = 6
-QUICK_SEARCH = 7
-QUICK_SEARCH_VALUE = 8
-SEARCH_RESULTS = 9
-SUBSCRIPTION_MENU = 10
-SUBSCRIPTION_PERIOD = 11
-SUBSCRIPTION_PAYMENT = 12
-SUBSCRIPTION_CONFIRMATION = 13
-CATEGORY_ACTION = 14
-
 async def about(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает информацию о боте."""
     if update.callback_query:
@@ -76,48 +82,51 @@ async def about(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     
     keyboard = [
-        [InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_menu")]
+        [callback_button("🏠 Главное меню", View.MAIN_MENU)]
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     if update.callback_query:
-        await message.edit_text(about_text, reply_markup=reply_markup, parse_mode="Markdown")
+        await edit_screen(message, about_text, reply_markup=reply_markup, parse_mode="Markdown")
     else:
         await message.reply_text(about_text, reply_markup=reply_markup, parse_mode="Markdown")
 
-async def button(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обрабатывает нажатия на кнопки."""
-    query = update.callback_query
-    await query.answer()
-    
-    if query.data == "back_to_menu":
-        await show_main_menu(update, context)
-        return MAIN_MENU
-    elif query.data == "catalog":
-        await show_catalog(update, context)
-        return CATEGORY_SELECTION
-    elif query.data == "search":
-        await show_search_menu(update, context)
-        return SEARCH_TYPE
-    elif query.data == "about":
-        await about(update, context)
-        return MAIN_MENU
-    elif query.data == "profile":
-        await profile(update, context)
-        return MAIN_MENU
-    elif query.data == "subscription":
-        await show_subscription_menu(update, context)
-        return SUBSCRIPTION_MENU
-    elif query.data == "cancel_subscription":
-        await cancel_subscription_handler(update, context)
-        return SUBSCRIPTION_MENU
-    elif query.data == "confirm_cancel":
-        await confirm_cancel_subscription(update, context)
-        return MAIN_MENU
-    elif query.data == "back_to_results":
-        await show_search_menu(update, context)
-        return SEARCH_TYPE
+async def expired_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает кнопки сообщений прежних версий бота, которые нельзя декодировать."""
+    await update.callback_query.answer("Кнопка устарела")
+    main_menu_message, reply_markup = MAIN_MENU_RENDER
+    await update.callback_query.message.reply_text(main_menu_message, reply_markup=reply_markup)
+
+# Экран -> обработчик нажатия кнопки
+CALLBACK_ROUTES = {
+    View.MAIN_MENU: show_main_menu,
+    View.CATALOG: show_catalog,
+    View.SEARCH: show_search_menu,
+    View.ABOUT: about,
+    View.PROFILE: profile,
+    View.SUBSCRIPTION: show_subscription_menu,
+    View.CATEGORY: show_category_action,
+    View.CATEGORY_PRODUCTS: show_category_products,
+    # Поиск с ограничением по категории не реализован: открывается общее меню поиска
+    View.CATEGORY_SEARCH: show_search_menu,
+    View.CATEGORY_PAGE: show_category_page,
+    View.CATALOG_PRODUCT: catalog_product_details,
+    View.QUICK_SEARCH_PRICE: quick_search_price,
+    View.QUICK_SEARCH_MANUFACTURER: quick_search_manufacturer,
+    View.QUICK_SEARCH_CITY: quick_search_city,
+    View.QUICK_SEARCH_NAME: quick_search_name,
+    View.QUICK_SEARCH_CODE: quick_search_code,
+    View.SEARCH_CHOICE: process_search_callback,
+    View.SEARCH_PAGE: show_search_page,
+    View.SEARCH_PRODUCT: show_product_details,
+    View.BACK_TO_RESULTS: back_to_results,
+    View.SUBSCRIBE: select_subscription_period,
+    View.PAYMENT: process_payment,
+    View.PAYMENT_CONFIRMED: confirm_payment,
+    View.CANCEL_SUBSCRIPTION: cancel_subscription_handler,
+    View.CONFIRM_CANCEL: confirm_cancel_subscription,
+}
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отменяет текущую операцию и возвращает в главное меню."""
@@ -137,97 +146,125 @@ def main():
         init_db()
         logger.info("База данных инициализирована.")
     
+    # Применяем миграции схемы (индексы и т.п.) к существующей базе
+    applied = run_migrations()
+    if applied:
+        logger.info("Применены миграции: %s", ", ".join(map(str, applied)))
+    for query_name, scans in check_query_plans().items():
+        logger.warning("Запрос '%s' выполняет полный просмотр таблицы: %s", query_name, "; ".join(scans))
+    
+    log_storage_settings()
+    
     # Создаем приложение
-    application = Application.builder().token(BOT_TOKEN).build()
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .application_class(BotApplication)
+        # Обновления принимаются параллельно; порядок внутри чата и число
+        # одновременно работающих обработчиков ограничивает BotApplication
+        .concurrent_updates(MAX_PENDING_UPDATES)
+        # Состояние диалогов и user_data переживают перезапуск бота
+        .persistence(SQLitePersistence(PERSISTENCE_UPDATE_INTERVAL))
+        # Исходящие запросы не превышают лимиты Telegram; ответы пользователям
+        # обслуживаются раньше рассылок
+        .rate_limiter(PriorityRateLimiter(
+            RATE_LIMIT_OVERALL, RATE_LIMIT_CHAT, RATE_LIMIT_CHAT_BURST,
+            RATE_LIMIT_GROUP, RATE_LIMIT_MAX_RETRIES
+        ))
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+    )
+    if TELEGRAM_API_URL:
+        api_url = TELEGRAM_API_URL.rstrip("/")
+        builder = builder.base_url(f"{api_url}/bot").base_file_url(f"{api_url}/file/bot")
+    application = builder.build()
+    
+    # Команды работают в любом состоянии диалога и начинают его заново
+    commands = [
+        CommandHandler("start", start),
+        CommandHandler("catalog", show_catalog),
+        CommandHandler("search", show_search_menu),
+        CommandHandler("subscription", show_subscription_menu),
+        CommandHandler("profile", profile),
+        CommandHandler("about", about),
+    ]
+    
+    # Все нажатия кнопок обрабатывает один маршрутизатор: экран определяется
+    # callback_data, а не состоянием диалога
+    router = CallbackRouter(CALLBACK_ROUTES, expired_button)
     
-    # Создание ConversationHandler для основного меню
+    # Создание ConversationHandler для основного меню; состояния нужны только
+    # для ввода текста: кода авторизации и значения поиска
     main_conv_handler = ConversationHandler(
-        entry_points=[CommandHandler("start", start)],
+        entry_points=commands + [router],
+        name="main",
+        persistent=True,
         states={
             AUTH_CODE: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, auth_code_handler)
             ],
-            MAIN_MENU: [
-                CallbackQueryHandler(show_catalog, pattern="^catalog$"),
-                CallbackQueryHandler(show_search_menu, pattern="^search$"),
-                CallbackQueryHandler(about, pattern="^about$"),
-                CallbackQueryHandler(profile, pattern="^profile$"),
-                CallbackQueryHandler(show_subscription_menu, pattern="^subscription$"),
-                CallbackQueryHandler(button)
-            ],
-            CATEGORY_SELECTION: [
-                CallbackQueryHandler(show_category_action, pattern=r"^category_\d+$"),
-                CallbackQueryHandler(button)
-            ],
-            CATEGORY_ACTION: [
-                CallbackQueryHandler(show_category_products, pattern=r"^show_all_\d+$"),
-                CallbackQueryHandler(button)
-            ],
-            PRODUCT_SELECTION: [
-                CallbackQueryHandler(catalog_product_details, pattern=r"^product_\d+$"),
-                CallbackQueryHandler(button)
-            ],
-            PRODUCT_DETAIL: [
-                CallbackQueryHandler(button)
-            ],
-            SEARCH_TYPE: [
-                CallbackQueryHandler(quick_search_price, pattern="^quick_search_price$"),
-                CallbackQueryHandler(quick_search_manufacturer, pattern="^quick_search_manufacturer$"),
-                CallbackQueryHandler(quick_search_city, pattern="^quick_search_city$"),
-                CallbackQueryHandler(quick_search_name, pattern="^quick_search_name$"),
-                CallbackQueryHandler(quick_search_code, pattern="^quick_search_code$"),
-                CallbackQueryHandler(button)
-            ],
-            QUICK_SEARCH: [
-                CallbackQueryHandler(process_search_callback, pattern=r"^price_\d+$"),
-                CallbackQueryHandler(process_search_callback, pattern="^price_any$"),
-                CallbackQueryHandler(process_search_callback, pattern=r"^manufacturer_"),
-                CallbackQueryHandler(process_search_callback, pattern=r"^city_"),
-                CallbackQueryHandler(button)
-            ],
             QUICK_SEARCH_VALUE: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, process_search_value)
             ],
-            SEARCH_RESULTS: [
-                CallbackQueryHandler(show_product_details, pattern=r"^product_\d+$"),
-                CallbackQueryHandler(button)
-            ],
-            SUBSCRIPTION_MENU: [
-                CallbackQueryHandler(select_subscription_period, pattern=r"^subscribe_\w+$"),
-                CallbackQueryHandler(cancel_subscription_handler, pattern="^cancel_subscription$"),
-                CallbackQueryHandler(button)
-            ],
-            SUBSCRIPTION_PERIOD: [
-                CallbackQueryHandler(process_payment, pattern=r"^payment_\w+$"),
-                CallbackQueryHandler(button)
-            ],
-            SUBSCRIPTION_PAYMENT: [
-                CallbackQueryHandler(confirm_payment, pattern="^payment_confirmed$"),
-                CallbackQueryHandler(button)
-            ],
-            SUBSCRIPTION_CONFIRMATION: [
-                CallbackQueryHandler(button)
-            ]
+            # Остальные состояния не ждут текста: кнопки и команды обрабатываются в fallbacks
+            **{state: [] for state in (
+                MAIN_MENU, CATEGORY_SELECTION, CATEGORY_ACTION, PRODUCT_SELECTION, PRODUCT_DETAIL,
+                SEARCH_TYPE, QUICK_SEARCH, SEARCH_RESULTS, SUBSCRIPTION_MENU, SUBSCRIPTION_PERIOD,
+                SUBSCRIPTION_PAYMENT, SUBSCRIPTION_CONFIRMATION
+            )},
         },
-        fallbacks=[CommandHandler("cancel", cancel)]
+        fallbacks=commands + [CommandHandler("cancel", cancel), router]
     )
     
-    # Добавляем обработчики команд
-    # Добавляем обработчики команд 2
-
+    def is_auth_attempt(update: Update) -> bool:
+        """Обновление будет обработано как ввод кода авторизации (по состоянию диалога в памяти)."""
+        match = main_conv_handler.check_update(update)
+        return match is not None and match[2].callback is auth_code_handler
+    
+    # Ограничение частоты обновлений от пользователя проверяется раньше всех
+    # обработчиков и до обращений к базе
+    application.add_handler(flood_guard.create_handler(is_auth_attempt), group=-1)
     application.add_handler(main_conv_handler)
-    application.add_handler(CommandHandler("catalog", show_catalog))
-    application.add_handler(CommandHandler("search", show_search_menu))
-    application.add_handler(CommandHandler("subscription", show_subscription_menu))
-    application.add_handler(CommandHandler("profile", profile))
-    application.add_handler(CommandHandler("about", about))
     
-    # Добавление обработчика для callback_query, которые не обрабатываются ConversationHandler
-    application.add_handler(CallbackQueryHandler(button))
+    # Фоновое обслуживание SQLite: контрольная точка WAL и PRAGMA optimize
+    application.job_queue.run_repeating(
+        storage_maintenance, interval=SQLITE_MAINTENANCE_INTERVAL, first=SQLITE_MAINTENANCE_INTERVAL
+    )
+    
+    # Перестроение индекса каталога в памяти при изменении каталога
+    application.job_queue.run_repeating(
+        catalog_index_refresh, interval=CATALOG_INDEX_REFRESH_INTERVAL, first=CATALOG_INDEX_REFRESH_INTERVAL
+    )
+    
+    # Запуск рассылок, созданных программой управления каталогом
+    application.job_queue.run_repeating(
+        broadcast_check, interval=BROADCAST_POLL_INTERVAL, first=BROADCAST_POLL_INTERVAL
+    )
+    
+    # Перевод истекших подписок в статус EXPIRED
+    application.job_queue.run_repeating(
+        subscription_expiry, interval=SUBSCRIPTION_EXPIRY_INTERVAL, first=SUBSCRIPTION_EXPIRY_INTERVAL
+    )
+    
+    # Ежедневные напоминания о продлении подписки
+    application.job_queue.run_daily(
+        subscription_reminders, time=time.fromisoformat(SUBSCRIPTION_REMINDER_TIME).replace(tzinfo=timezone.utc)
+    )
+    
+    # Пакетная запись времени последнего обращения пользователей
+    application.job_queue.run_repeating(
+        activity_flush, interval=ACTIVITY_FLUSH_INTERVAL, first=ACTIVITY_FLUSH_INTERVAL
+    )
     
     # Запуск бота
     logger.info("Бот запущен")
-    application.run_polling()
+    if BOT_MODE == "webhook":
+        # Импорт здесь: режиму polling не нужен HTTP-сервер
+        from webhook import run_webhook
+        run_webhook(application)
+    else:
+        application.run_polling()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,245 @@
+"""
+Версионные миграции схемы базы данных.
+
+Base.metadata.create_all создает только отсутствующие таблицы и не изменяет
+существующие базы, поэтому изменения схемы (индексы, новые столбцы, перенос
+данных) описываются здесь. Номер примененной миграции хранится в
+PRAGMA user_version самой базы, так что копия базы, сделанная программой
+управления каталогом, переносит и свою версию схемы.
+
+Каждая миграция - это номер, описание и список шагов: SQL-строк или функций,
+принимающих соединение. Шаги должны быть идемпотентными, чтобы миграцию можно
+было безопасно применить к базе, уже созданной по текущим моделям.
+"""
+import logging
+from sqlalchemy.exc import OperationalError
+from database import engine
+
+logger = logging.getLogger(__name__)
+
+def _add_column(table, column, ddl):
+    """Шаг миграции: добавляет столбец, если его еще нет."""
+    def step(connection):
+        columns = [row[1] for row in connection.exec_driver_sql(f"PRAGMA table_info({table})")]
+        if column not in columns:
+            connection.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+    return step
+
+# Тело триггеров, связывающих строковые manufacturer и city товара со справочниками.
+# Программа управления каталогом пишет в products напрямую, поэтому ссылки
+# поддерживаются на стороне базы, а не в коде бота.
+_LOOKUP_TRIGGER_BODY = """
+    INSERT INTO manufacturers (name) SELECT NEW.manufacturer
+        WHERE NEW.manufacturer IS NOT NULL AND NEW.manufacturer != ''
+        AND NOT EXISTS (SELECT 1 FROM manufacturers WHERE name = NEW.manufacturer);
+    INSERT INTO cities (name) SELECT NEW.city
+        WHERE NEW.city IS NOT NULL AND NEW.city != ''
+        AND NOT EXISTS (SELECT 1 FROM cities WHERE name = NEW.city);
+    UPDATE products SET
+        manufacturer_id = (SELECT id FROM manufacturers WHERE name = NEW.manufacturer),
+        city_id = (SELECT MIN(id) FROM cities WHERE name = NEW.city)
+    WHERE id = NEW.id;
+"""
+
+def _create_search_index(connection):
+    """
+    Шаг миграции: полнотекстовый индекс FTS5 по названию, описанию и коду товара.
+    Триграммный токенизатор ищет по подстроке и без учета регистра, в том числе
+    для кириллицы. Если SQLite собран без FTS5 или триграмм, поиск продолжит
+    работать через LIKE.
+    """
+    try:
+        connection.exec_driver_sql(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+            "name, description, product_code, content='products', content_rowid='id', tokenize='trigram')"
+        )
+    except OperationalError as e:
+        logger.warning("Полнотекстовый индекс недоступен: %s. Поиск будет выполняться через LIKE.", e)
+        return
+    connection.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN "
+        "INSERT INTO products_fts (rowid, name, description, product_code) "
+        "VALUES (NEW.id, NEW.name, NEW.description, NEW.product_code); END"
+    )
+    connection.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN "
+        "INSERT INTO products_fts (products_fts, rowid, name, description, product_code) "
+        "VALUES ('delete', OLD.id, OLD.name, OLD.description, OLD.product_code); END"
+    )
+    connection.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF name, description, product_code "
+        "ON products BEGIN "
+        "INSERT INTO products_fts (products_fts, rowid, name, description, product_code) "
+        "VALUES ('delete', OLD.id, OLD.name, OLD.description, OLD.product_code); "
+        "INSERT INTO products_fts (rowid, name, description, product_code) "
+        "VALUES (NEW.id, NEW.name, NEW.description, NEW.product_code); END"
+    )
+    connection.exec_driver_sql("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+
+# Таблицы, изменение которых меняет версию каталога (см. catalog.get_catalog_version)
+CATALOG_TABLES = ("products", "categories", "manufacturers", "cities")
+
+def _create_catalog_version_triggers(connection):
+    """Шаг миграции: счетчик изменений каталога, увеличиваемый триггерами."""
+    for table in CATALOG_TABLES:
+        for operation in ("INSERT", "UPDATE", "DELETE"):
+            connection.exec_driver_sql(
+                f"CREATE TRIGGER IF NOT EXISTS catalog_version_{table}_{operation.lower()} "
+                f"AFTER {operation} ON {table} BEGIN "
+                "UPDATE catalog_state SET version = version + 1 WHERE id = 1; END"
+            )
+
+MIGRATIONS = [
+    (1, "Индексы для выборок по категории, цене, производителю, городу и подпискам", [
+        "CREATE INDEX IF NOT EXISTS ix_products_category_price ON products (category_id, price)",
+        "CREATE INDEX IF NOT EXISTS ix_products_price ON products (price)",
+        "CREATE INDEX IF NOT EXISTS ix_products_manufacturer ON products (manufacturer)",
+        "CREATE INDEX IF NOT EXISTS ix_products_city ON products (city)",
+        "CREATE INDEX IF NOT EXISTS ix_subscriptions_user_end ON subscriptions (user_id, end_date DESC)",
+    ]),
+    (2, "Справочник производителей и ссылки товаров на производителя и город", [
+        "CREATE TABLE IF NOT EXISTS manufacturers ("
+        "id INTEGER NOT NULL PRIMARY KEY, name VARCHAR NOT NULL UNIQUE)",
+        _add_column("products", "manufacturer_id", "INTEGER REFERENCES manufacturers (id)"),
+        _add_column("products", "city_id", "INTEGER REFERENCES cities (id)"),
+        "CREATE INDEX IF NOT EXISTS ix_cities_name ON cities (name)",
+        # Перенос существующих строковых значений в справочники
+        "INSERT INTO manufacturers (name) SELECT DISTINCT manufacturer FROM products "
+        "WHERE manufacturer IS NOT NULL AND manufacturer != '' "
+        "AND manufacturer NOT IN (SELECT name FROM manufacturers)",
+        "INSERT INTO cities (name) SELECT DISTINCT city FROM products "
+        "WHERE city IS NOT NULL AND city != '' AND city NOT IN (SELECT name FROM cities)",
+        "UPDATE products SET "
+        "manufacturer_id = (SELECT id FROM manufacturers WHERE name = products.manufacturer), "
+        "city_id = (SELECT MIN(id) FROM cities WHERE name = products.city)",
+        "CREATE INDEX IF NOT EXISTS ix_products_manufacturer_price ON products (manufacturer_id, price)",
+        "CREATE INDEX IF NOT EXISTS ix_products_city_price ON products (city_id, price)",
+        f"CREATE TRIGGER IF NOT EXISTS products_lookup_insert AFTER INSERT ON products BEGIN {_LOOKUP_TRIGGER_BODY} END",
+        f"CREATE TRIGGER IF NOT EXISTS products_lookup_update AFTER UPDATE OF manufacturer, city ON products "
+        f"BEGIN {_LOOKUP_TRIGGER_BODY} END",
+    ]),
+    (3, "Полнотекстовый индекс товаров", [
+        _create_search_index,
+    ]),
+    (4, "Версия каталога для обновления кэшей", [
+        "CREATE TABLE IF NOT EXISTS catalog_state ("
+        "id INTEGER NOT NULL PRIMARY KEY, version INTEGER NOT NULL)",
+        "INSERT OR IGNORE INTO catalog_state (id, version) VALUES (1, 1)",
+        _create_catalog_version_triggers,
+    ]),
+    (5, "Кэш file_id изображений Telegram", [
+        "CREATE TABLE IF NOT EXISTS image_cache ("
+        "image_path VARCHAR NOT NULL PRIMARY KEY, content_hash VARCHAR NOT NULL, "
+        "file_id VARCHAR NOT NULL, file_size INTEGER, updated_at DATETIME)",
+    ]),
+    (6, "Производные изображения товаров", [
+        _add_column("products", "photo_path", "VARCHAR"),
+        _add_column("products", "thumbnail_path", "VARCHAR"),
+        _add_column("products", "webp_path", "VARCHAR"),
+        _add_column("products", "image_hash", "VARCHAR"),
+    ]),
+    (7, "Состояние диалогов и данных пользователей между перезапусками", [
+        "CREATE TABLE IF NOT EXISTS bot_state ("
+        "kind VARCHAR NOT NULL, key VARCHAR NOT NULL, data BLOB NOT NULL, updated_at DATETIME, "
+        "PRIMARY KEY (kind, key))",
+    ]),
+    (8, "Рассылки подписчикам", [
+        "CREATE TABLE IF NOT EXISTS broadcasts ("
+        "id INTEGER NOT NULL PRIMARY KEY, text TEXT NOT NULL, image_path VARCHAR, "
+        "status VARCHAR(9) NOT NULL DEFAULT 'PENDING', last_user_id INTEGER NOT NULL DEFAULT 0, "
+        "delivered INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0, "
+        "blocked INTEGER NOT NULL DEFAULT 0, created_at DATETIME, started_at DATETIME, finished_at DATETIME)",
+        # Получатели рассылки выбираются по статусу подписки порциями в порядке id
+        "CREATE INDEX IF NOT EXISTS ix_users_subscription_status_id ON users (subscription_status, id)",
+    ]),
+    (9, "Индексы для перевода истекших подписок в статус EXPIRED", [
+        # Статус в индексе ограничивает просмотр действующими подписками, а не
+        # всеми, когда-либо истекшими
+        "CREATE INDEX IF NOT EXISTS ix_users_subscription_status_expiry "
+        "ON users (subscription_status, subscription_expiry)",
+        "CREATE INDEX IF NOT EXISTS ix_subscriptions_status_end ON subscriptions (status, end_date)",
+    ]),
+    (10, "Напоминания о продлении подписки", [
+        "CREATE TABLE IF NOT EXISTS subscription_reminders ("
+        "user_id INTEGER NOT NULL REFERENCES users (id), expiry DATETIME NOT NULL, "
+        "days INTEGER NOT NULL, sent_at DATETIME, PRIMARY KEY (user_id, expiry, days))",
+    ]),
+    (11, "Поиск подписки по платежу при повторном подтверждении оплаты", [
+        "CREATE INDEX IF NOT EXISTS ix_subscriptions_payment_id ON subscriptions (payment_id)",
+    ]),
+]
+
+# Запросы, которые выполняются на каждое нажатие и не должны просматривать всю таблицу
+HOT_QUERIES = {
+    "товары категории": "SELECT * FROM products WHERE category_id = 1 ORDER BY price",
+    "поиск по цене": "SELECT * FROM products WHERE price <= 10000 ORDER BY price",
+    "поиск по производителю": "SELECT * FROM products WHERE manufacturer_id = 1 ORDER BY price",
+    "поиск по городу": "SELECT * FROM products WHERE city_id = 1 ORDER BY price",
+    "пользователь по telegram_id": "SELECT * FROM users WHERE telegram_id = '1'",
+    "получатели рассылки": (
+        "SELECT id, telegram_id FROM users WHERE subscription_status = 'PAID' AND id > 0 "
+        "ORDER BY id LIMIT 100"
+    ),
+    "истекшие подписки пользователей": (
+        "SELECT telegram_id FROM users WHERE subscription_expiry < '2000-01-01' "
+        "AND subscription_status IN ('PAID', 'TRIAL')"
+    ),
+    "истекшие записи подписок": (
+        "SELECT id FROM subscriptions WHERE end_date < '2000-01-01' AND status IN ('PAID', 'TRIAL')"
+    ),
+    "получатели напоминаний о продлении": (
+        "SELECT id, telegram_id, subscription_expiry FROM users WHERE subscription_status = 'PAID' "
+        "AND subscription_expiry <= '2000-01-08' AND (subscription_expiry, id) > ('2000-01-01', 0) "
+        "ORDER BY subscription_expiry, id LIMIT 100"
+    ),
+    "подписка по платежу": "SELECT * FROM subscriptions WHERE payment_id = 'p'",
+    "последняя дата окончания подписки": (
+        "SELECT MAX(end_date) FROM subscriptions WHERE user_id = 1 AND status IN ('PAID', 'TRIAL')"
+    ),
+    "текущая подписка": (
+        "SELECT * FROM subscriptions WHERE user_id = 1 AND end_date > '2000-01-01' "
+        "ORDER BY end_date DESC LIMIT 1"
+    ),
+}
+
+def get_schema_version(connection):
+    """Возвращает номер последней примененной миграции."""
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+def run_migrations():
+    """
+    Применяет к базе все миграции, номер которых больше текущей версии схемы.
+
+    Returns:
+        list: Номера примененных миграций
+    """
+    applied = []
+    for number, description, steps in MIGRATIONS:
+        with engine.begin() as connection:
+            if number <= get_schema_version(connection):
+                continue
+            logger.info("Применяется миграция %d: %s", number, description)
+            for step in steps:
+                if callable(step):
+                    step(connection)
+                else:
+                    connection.exec_driver_sql(step)
+            connection.exec_driver_sql(f"PRAGMA user_version = {number}")
+        applied.append(number)
+    return applied
+
+def check_query_plans():
+    """
+    Проверяет через EXPLAIN QUERY PLAN, что горячие запросы используют индексы.
+
+    Returns:
+        dict: Название запроса -> строки плана с полным просмотром таблицы
+    """
+    problems = {}
+    with engine.connect() as connection:
+        for name, sql in HOT_QUERIES.items():
+            plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+            scans = [row[-1] for row in plan if row[-1].startswith("SCAN ")]
+            if scans:
+                problems[name] = scans
+    return problems
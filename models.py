@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Enum, Float, Text, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Enum, Float, Text, ForeignKey, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 import datetime
@@ -12,6 +12,12 @@ class SubscriptionStatus(enum.Enum):
     TRIAL = "trial"
     EXPIRED = "expired"
 
+class BroadcastStatus(enum.Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    CANCELLED = "cancelled"
+
 class User(Base):
     __tablename__ = 'users'
     
@@ -28,6 +34,11 @@ class User(Base):
     subscription_expiry = Column(DateTime)
     is_active = Column(Boolean, default=True)
     
+    __table_args__ = (
+        Index("ix_users_subscription_status_id", "subscription_status", "id"),
+        Index("ix_users_subscription_status_expiry", "subscription_status", "subscription_expiry"),
+    )
+    
     def __repr__(self):
         return f"<User(id={self.id}, telegram_id='{self.telegram_id}', subscription_status={self.subscription_status})>"
 
@@ -56,6 +67,9 @@ class Product(Base):
     manufacturer = Column(String)  # Производитель
     size = Column(String)  # Размер
     city = Column(String)  # Город
+    # Ссылки на справочники; заполняются триггерами по manufacturer и city (см. migrations.py)
+    manufacturer_id = Column(Integer, ForeignKey('manufacturers.id'))
+    city_id = Column(Integer, ForeignKey('cities.id'))
     # Специфичные атрибуты для разных типов мебели
     form = Column(String)  # Форма (для диванов)
     mechanism = Column(String)  # Механизм разложения (для диванов)
@@ -63,12 +77,27 @@ class Product(Base):
     lifting_mechanism = Column(Boolean)  # Наличие подъемного механизма (для кроватей)
     has_box = Column(Boolean)  # Наличие ящика (для пуфов)
     image_path = Column(String)
+    # Производные изображения для Telegram (см. image_ingest.py) и хеш исходного файла
+    photo_path = Column(String)
+    thumbnail_path = Column(String)
+    webp_path = Column(String)
+    image_hash = Column(String)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
     
     # Отношения
     category = relationship("Category", back_populates="products")
     
+    # Индексы (для существующих баз создаются миграциями, см. migrations.py)
+    __table_args__ = (
+        Index("ix_products_category_price", "category_id", "price"),
+        Index("ix_products_price", "price"),
+        Index("ix_products_manufacturer", "manufacturer"),
+        Index("ix_products_city", "city"),
+        Index("ix_products_manufacturer_price", "manufacturer_id", "price"),
+        Index("ix_products_city_price", "city_id", "price"),
+    )
+    
     def __repr__(self):
         return f"<Product(id={self.id}, code='{self.product_code}', name='{self.name}')>"
 
@@ -79,9 +108,45 @@ class City(Base):
     name = Column(String, nullable=False)
     region = Column(String)
     
+    __table_args__ = (
+        Index("ix_cities_name", "name"),
+    )
+    
     def __repr__(self):
         return f"<City(id={self.id}, name='{self.name}')>"
 
+class Manufacturer(Base):
+    __tablename__ = 'manufacturers'
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, nullable=False)
+    
+    def __repr__(self):
+        return f"<Manufacturer(id={self.id}, name='{self.name}')>"
+
+class CatalogState(Base):
+    __tablename__ = 'catalog_state'
+    
+    # Единственная строка (id = 1); version увеличивается триггерами при любом изменении каталога
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=1)
+    
+    def __repr__(self):
+        return f"<CatalogState(version={self.version})>"
+
+class ImageCache(Base):
+    __tablename__ = 'image_cache'
+    
+    # file_id, который Telegram вернул после загрузки файла; действителен, пока не изменилось содержимое
+    image_path = Column(String, primary_key=True)
+    content_hash = Column(String, nullable=False)
+    file_id = Column(String, nullable=False)
+    file_size = Column(Integer)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<ImageCache(path='{self.image_path}', file_id='{self.file_id}')>"
+
 class Admin(Base):
     __tablename__ = 'admins'
     
@@ -106,6 +171,12 @@ class Subscription(Base):
     payment_amount = Column(Float)
     payment_date = Column(DateTime)
     
+    __table_args__ = (
+        Index("ix_subscriptions_user_end", "user_id", end_date.desc()),
+        Index("ix_subscriptions_status_end", "status", "end_date"),
+        Index("ix_subscriptions_payment_id", "payment_id"),
+    )
+    
     def __repr__(self):
         return f"<Subscription(id={self.id}, user_id={self.user_id}, status={self.status})>"
 
@@ -114,3 +185,48 @@ def create_tables(db_url):
     engine = create_engine(db_url)
     Base.metadata.create_all(engine)
     return engine
+
+class BotState(Base):
+    __tablename__ = 'bot_state'
+    
+    # Состояние бота между перезапусками: kind - user_data, chat_data или conversation:<имя диалога>,
+    # key - id пользователя/чата или ключ диалога, data - значение в формате pickle
+    kind = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<BotState(kind='{self.kind}', key='{self.key}')>"
+
+class Broadcast(Base):
+    __tablename__ = 'broadcasts'
+    
+    id = Column(Integer, primary_key=True)
+    text = Column(Text, nullable=False)
+    image_path = Column(String)
+    status = Column(Enum(BroadcastStatus), default=BroadcastStatus.PENDING, nullable=False)
+    # Контрольная точка: получатели с id не больше last_user_id уже обработаны
+    last_user_id = Column(Integer, default=0, nullable=False)
+    delivered = Column(Integer, default=0, nullable=False)
+    failed = Column(Integer, default=0, nullable=False)
+    blocked = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    
+    def __repr__(self):
+        return f"<Broadcast(id={self.id}, status={self.status}, delivered={self.delivered})>"
+
+class SubscriptionReminder(Base):
+    """Отправленное напоминание о продлении: одно на пользователя, срок окончания и порог."""
+    __tablename__ = 'subscription_reminders'
+    
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    # Срок окончания, о котором напомнили: после продления напоминания отправляются снова
+    expiry = Column(DateTime, primary_key=True)
+    days = Column(Integer, primary_key=True)
+    sent_at = Column(DateTime, default=datetime.datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<SubscriptionReminder(user_id={self.user_id}, expiry={self.expiry}, days={self.days})>"
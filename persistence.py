@@ -0,0 +1,176 @@
+"""
+Хранение состояния диалогов, user_data и chat_data в таблице bot_state.
+
+Без него каждый перезапуск бота возвращает всех пользователей к началу:
+теряются состояние ConversationHandler и выбранные параметры поиска.
+
+- Данные пользователя и чата читаются из базы при первом обновлении от него
+  (refresh_user_data/refresh_chat_data), а не при запуске бота.
+- Изменения накапливаются в памяти и записываются одной транзакцией
+  при периодическом вызове Application.update_persistence и при остановке бота.
+- Состояния диалогов загружаются при запуске: в таблице хранятся только
+  незавершенные диалоги.
+"""
+import json
+import logging
+import pickle
+from datetime import datetime
+from sqlalchemy import select, delete, bindparam
+from sqlalchemy.dialects.sqlite import insert
+from telegram.ext import BasePersistence, PersistenceInput
+from database import async_engine
+from models import BotState
+
+logger = logging.getLogger(__name__)
+
+_table = BotState.__table__
+
+_stats = {"loads": 0, "writes": 0, "deletes": 0, "batches": 0, "failed_batches": 0}
+
+def _conversation_kind(name: str) -> str:
+    return f"conversation:{name}"
+
+class SQLitePersistence(BasePersistence):
+    """Хранилище python-telegram-bot в базе каталога с отложенной пакетной записью."""
+
+    def __init__(self, update_interval: float = 60):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        # id, данные которых уже прочитаны из базы
+        self._loaded = {"user_data": set(), "chat_data": set()}
+        # (kind, key) -> новое значение; None - запись нужно удалить
+        self._pending = {}
+        # (kind, key) записей, которые есть в таблице
+        self._stored = set()
+
+    async def _load(self, kind: str, key: str):
+        async with async_engine.connect() as connection:
+            data = await connection.scalar(
+                select(_table.c.data).where(_table.c.kind == kind, _table.c.key == key)
+            )
+        _stats["loads"] += 1
+        return pickle.loads(data) if data is not None else None
+
+    async def _refresh(self, kind: str, entity_id: int, data: dict):
+        if entity_id in self._loaded[kind]:
+            return
+        stored = await self._load(kind, str(entity_id))
+        if stored is not None:
+            self._stored.add((kind, str(entity_id)))
+        # Значения, записанные в текущем процессе, новее сохраненных
+        for name, value in (stored or {}).items():
+            data.setdefault(name, value)
+        self._loaded[kind].add(entity_id)
+
+    def _schedule(self, kind: str, key: str, value):
+        entry = (kind, key)
+        # Пустые данные, которых нет и в таблице, записывать не нужно
+        if value is None and entry not in self._stored and entry not in self._pending:
+            return
+        self._pending[entry] = value
+
+    async def get_user_data(self):
+        # Данные пользователей загружаются по одному в refresh_user_data
+        return {}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str):
+        kind = _conversation_kind(name)
+        async with async_engine.connect() as connection:
+            rows = (await connection.execute(
+                select(_table.c.key, _table.c.data).where(_table.c.kind == kind)
+            )).all()
+        self._stored.update((kind, key) for key, _ in rows)
+        return {tuple(json.loads(key)): pickle.loads(data) for key, data in rows}
+
+    async def update_conversation(self, name: str, key, new_state):
+        self._schedule(_conversation_kind(name), json.dumps(list(key)), new_state)
+
+    async def update_user_data(self, user_id: int, data: dict):
+        self._schedule("user_data", str(user_id), data or None)
+
+    async def update_chat_data(self, chat_id: int, data: dict):
+        self._schedule("chat_data", str(chat_id), data or None)
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_user_data(self, user_id: int):
+        self._loaded["user_data"].discard(user_id)
+        self._schedule("user_data", str(user_id), None)
+
+    async def drop_chat_data(self, chat_id: int):
+        self._loaded["chat_data"].discard(chat_id)
+        self._schedule("chat_data", str(chat_id), None)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict):
+        await self._refresh("user_data", user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict):
+        await self._refresh("chat_data", chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def write_pending(self):
+        """Записывает накопленные изменения одной транзакцией."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        now = datetime.utcnow()
+        rows = [
+            {"kind": kind, "key": key, "data": pickle.dumps(value), "updated_at": now}
+            for (kind, key), value in pending.items() if value is not None
+        ]
+        removed = [{"kind_": kind, "key_": key} for (kind, key), value in pending.items() if value is None]
+        try:
+            async with async_engine.begin() as connection:
+                if rows:
+                    statement = insert(_table)
+                    await connection.execute(
+                        statement.on_conflict_do_update(
+                            index_elements=[_table.c.kind, _table.c.key],
+                            set_={"data": statement.excluded.data, "updated_at": statement.excluded.updated_at},
+                        ),
+                        rows,
+                    )
+                if removed:
+                    await connection.execute(
+                        delete(_table).where(_table.c.kind == bindparam("kind_"), _table.c.key == bindparam("key_")),
+                        removed,
+                    )
+        except Exception:
+            # Изменения остаются в очереди до следующей записи, если их не заменили более новые
+            for entry, value in pending.items():
+                self._pending.setdefault(entry, value)
+            _stats["failed_batches"] += 1
+            logger.exception("Не удалось сохранить состояние бота (%d записей)", len(pending))
+            return
+        for entry, value in pending.items():
+            if value is None:
+                self._stored.discard(entry)
+            else:
+                self._stored.add(entry)
+        _stats["batches"] += 1
+        _stats["writes"] += len(rows)
+        _stats["deletes"] += len(removed)
+
+    async def flush(self):
+        await self.write_pending()
+
+def get_persistence_stats() -> dict:
+    """Статистика хранилища: загрузки, записи и количество транзакций."""
+    return dict(_stats)
@@ -0,0 +1,216 @@
+"""
+Ограничение частоты исходящих запросов к Bot API.
+
+Telegram допускает около 30 сообщений в секунду от бота в целом, около одного
+сообщения в секунду в личный чат и 20 сообщений в минуту в группу; при
+превышении запрос завершается ошибкой 429 (RetryAfter). Ограничитель
+задерживает запросы, адресованные чатам, так, чтобы не выходить за эти пределы:
+- общий лимит и лимит каждого чата реализованы корзинами токенов;
+- ожидающие запросы обслуживаются по приоритету: ответы пользователям
+  (INTERACTIVE) всегда проходят раньше массовых отправок (BULK - рассылки,
+  напоминания), приоритет передается в rate_limit_args методов бота;
+- при RetryAfter отправка приостанавливается на указанное время, после чего
+  запрос повторяется.
+
+Запросы без chat_id (answerCallbackQuery, getMe и т.п.) не задерживаются.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Callable, Coroutine, Dict, Optional
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты запросов: меньшее значение обслуживается раньше
+INTERACTIVE = 0
+BULK = 1
+
+LANES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+# Корзины чатов, которые можно удалить (полные и без ожидающих), проверяются при таком их количестве
+_PRUNE_THRESHOLD = 10000
+
+_stats = {
+    lane: {"requests": 0, "throttled": 0, "wait_time": 0.0, "max_wait_time": 0.0}
+    for lane in LANES.values()
+}
+_stats["retry_after"] = {"count": 0, "wait_time": 0.0, "failed": 0}
+
+_sequence = itertools.count()
+
+class PriorityBucket:
+    """Корзина токенов, выдающая токены ожидающим в порядке приоритета."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.waiters = []
+        self.timer = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def is_idle(self) -> bool:
+        """Корзина полна и никто не ждет: ее можно удалить без потери состояния."""
+        self._refill()
+        return not self.waiters and self.tokens >= self.capacity
+
+    async def acquire(self, priority: int):
+        """Ждет токен; запросы с меньшим priority получают токены первыми."""
+        self._refill()
+        if not self.waiters and self.tokens >= 1 and time.monotonic() >= self.blocked_until:
+            self.tokens -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(_sequence), future))
+        self._schedule()
+        await future
+
+    def pause(self, seconds: float):
+        """Приостанавливает выдачу токенов (после RetryAfter)."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self._schedule()
+
+    def _schedule(self):
+        if self.timer is not None or not self.waiters:
+            return
+        self._refill()
+        now = time.monotonic()
+        delay = max((1 - self.tokens) / self.rate, self.blocked_until - now, 0)
+        self.timer = asyncio.get_running_loop().call_later(delay, self._release)
+
+    def _release(self):
+        self.timer = None
+        self._refill()
+        if time.monotonic() >= self.blocked_until:
+            while self.waiters and self.tokens >= 1:
+                _, _, future = heapq.heappop(self.waiters)
+                # Запрос отменен, пока ждал
+                if future.done():
+                    continue
+                self.tokens -= 1
+                future.set_result(None)
+        self._schedule()
+
+class PriorityRateLimiter(BaseRateLimiter[int]):
+    """
+    Ограничитель частоты запросов с общим лимитом, лимитами чатов и приоритетами.
+
+    Args:
+        overall_rate: Запросов в секунду для всего бота (0 - без ограничения)
+        chat_rate: Запросов в секунду в один личный чат
+        chat_burst: Сколько запросов в личный чат можно отправить подряд без задержки
+        group_rate: Запросов в минуту в одну группу
+        max_retries: Сколько раз повторять запрос после RetryAfter
+    """
+
+    def __init__(self, overall_rate: float = 30, chat_rate: float = 1, chat_burst: float = 3,
+                 group_rate: float = 20, max_retries: int = 3):
+        self.overall_rate = overall_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._overall = None
+        self._chats = {}
+        self._prune_at = _PRUNE_THRESHOLD
+
+    async def initialize(self) -> None:
+        # Общий лимит без запаса на всплеск: при запасе в N запросов за первую
+        # секунду ушло бы N + overall_rate запросов, и Telegram ответил бы 429
+        self._overall = PriorityBucket(self.overall_rate, 1) if self.overall_rate else None
+        self._chats = {}
+
+    async def shutdown(self) -> None:
+        self._chats = {}
+
+    def _chat_bucket(self, chat_id) -> PriorityBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self._prune_at:
+                self._chats = {key: value for key, value in self._chats.items() if not value.is_idle()}
+                # Следующая проверка - не раньше, чем корзин станет вдвое больше оставшихся
+                self._prune_at = max(_PRUNE_THRESHOLD, 2 * len(self._chats))
+            # Группы и каналы имеют отрицательный id или @username
+            if str(chat_id)[:1] in ("-", "@"):
+                bucket = PriorityBucket(self.group_rate / 60, self.group_rate)
+            else:
+                bucket = PriorityBucket(self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def _acquire(self, chat_id, priority: int) -> float:
+        """Ждет разрешения на запрос в чат и возвращает время ожидания."""
+        started = time.perf_counter()
+        await self._chat_bucket(chat_id).acquire(priority)
+        if self._overall is not None:
+            await self._overall.acquire(priority)
+        return time.perf_counter() - started
+
+    def _pause(self, chat_id, seconds: float):
+        """Приостанавливает запросы после RetryAfter."""
+        if self._overall is not None:
+            self._overall.pause(seconds)
+        if chat_id is not None:
+            self._chat_bucket(chat_id).pause(seconds)
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ):
+        chat_id = data.get("chat_id")
+        priority = INTERACTIVE if rate_limit_args is None else rate_limit_args
+        lane = _stats[LANES.get(priority, "bulk")]
+        lane["requests"] += 1
+
+        attempt = 0
+        waited = 0.0
+        try:
+            while True:
+                if chat_id is not None:
+                    waited += await self._acquire(chat_id, priority)
+                try:
+                    return await callback(*args, **kwargs)
+                except RetryAfter as e:
+                    retry_stats = _stats["retry_after"]
+                    if attempt >= self.max_retries:
+                        retry_stats["failed"] += 1
+                        raise
+                    attempt += 1
+                    retry_stats["count"] += 1
+                    retry_stats["wait_time"] += e.retry_after
+                    logger.warning(
+                        "Превышен лимит запросов (%s, чат %s): пауза %s с, попытка %d",
+                        endpoint, chat_id, e.retry_after, attempt
+                    )
+                    self._pause(chat_id, e.retry_after)
+                    if chat_id is None:
+                        await asyncio.sleep(e.retry_after)
+        finally:
+            # Время планирования без фактического ожидания не считается задержкой
+            if waited > 0.001:
+                lane["throttled"] += 1
+                lane["wait_time"] += waited
+                lane["max_wait_time"] = max(lane["max_wait_time"], waited)
+
+def get_rate_limiter_stats() -> dict:
+    """Статистика ограничителя: запросы, задержанные запросы и время ожидания по приоритетам."""
+    return {name: dict(values) for name, values in _stats.items()}
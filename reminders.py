@@ -0,0 +1,193 @@
+"""
+Напоминания о продлении подписки.
+
+Ежедневная задача находит пользователей, чья оплаченная подписка заканчивается
+в ближайшие SUBSCRIPTION_REMINDER_DAYS дней, и отправляет им напоминание с
+кнопкой перехода в меню подписки:
+- пользователи выбираются порциями одним диапазонным запросом по индексу
+  (subscription_status, subscription_expiry) в порядке срока окончания, поэтому
+  в памяти находится только одна порция;
+- сообщения отправляются с приоритетом BULK: ограничитель запросов пропускает
+  ответы пользователям вперед напоминаний;
+- напоминание записывается в subscription_reminders до отправки, поэтому
+  после перезапуска бота оно не отправляется повторно. Запись удаляется, если
+  отправить не удалось или бот остановлен до отправки: напоминание будет
+  отправлено при следующем запуске задачи.
+
+Для каждого срока окончания отправляется одно напоминание на порог: за 7, 3 и
+1 день по умолчанию. После продления срок окончания меняется, и напоминания
+о новом сроке отправляются заново.
+"""
+import asyncio
+import logging
+import math
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from sqlalchemy import insert, tuple_
+from sqlalchemy.orm import Session
+from telegram import Bot, InlineKeyboardMarkup
+from telegram.error import Forbidden, TelegramError
+from database import session_scope, get_session
+from models import User, SubscriptionStatus, SubscriptionReminder
+from callbacks import View, callback_button
+from broadcast import DELIVERED, FAILED, BLOCKED
+from rate_limiter import BULK
+from config import SUBSCRIPTION_REMINDER_DAYS, BROADCAST_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Напоминание: (id пользователя, telegram_id, срок окончания, порог в днях)
+Reminder = Tuple[int, str, datetime, int]
+
+# Задача, отправляющая напоминания в текущем процессе
+_running: Optional[asyncio.Task] = None
+
+def reminder_days(expiry: datetime, now: datetime) -> Optional[int]:
+    """Наименьший порог, не меньший числа оставшихся дней, или None, если до окончания дальше всех порогов."""
+    days_left = math.ceil((expiry - now).total_seconds() / 86400)
+    for days in sorted(SUBSCRIPTION_REMINDER_DAYS):
+        if days_left <= days:
+            return days
+    return None
+
+def claim_reminders(db: Session, now: datetime, after: Optional[Tuple[datetime, int]],
+                    limit: int) -> Tuple[List[Reminder], Optional[Tuple[datetime, int]]]:
+    """
+    Выбирает следующую порцию пользователей с подпиской, заканчивающейся до
+    наибольшего порога, и записывает напоминания, которые им еще не отправлялись.
+
+    Args:
+        after: (срок окончания, id пользователя) последнего пользователя предыдущей порции
+
+    Returns:
+        tuple: (записанные напоминания, позиция для следующей порции или None, если порций больше нет)
+    """
+    query = db.query(User.id, User.telegram_id, User.subscription_expiry).filter(
+        User.subscription_status == SubscriptionStatus.PAID,
+        User.subscription_expiry <= now + timedelta(days=max(SUBSCRIPTION_REMINDER_DAYS)),
+        User.is_active != False,
+    )
+    # Нижняя граница диапазона - одно условие: при двух SQLite начинает
+    # просмотр индекса с первого из них, и каждая порция читает все предыдущие
+    if after is None:
+        query = query.filter(User.subscription_expiry > now)
+    else:
+        query = query.filter(tuple_(User.subscription_expiry, User.id) > tuple_(*after))
+    users = query.order_by(User.subscription_expiry, User.id).limit(limit).all()
+    if not users:
+        return [], None
+
+    sent = set(db.query(
+        SubscriptionReminder.user_id, SubscriptionReminder.expiry, SubscriptionReminder.days
+    ).filter(SubscriptionReminder.user_id.in_([user.id for user in users])))
+    reminders = []
+    for user_id, telegram_id, expiry in users:
+        days = reminder_days(expiry, now)
+        if days is not None and (user_id, expiry, days) not in sent:
+            reminders.append((user_id, telegram_id, expiry, days))
+    if reminders:
+        db.execute(insert(SubscriptionReminder), [
+            {"user_id": user_id, "expiry": expiry, "days": days, "sent_at": now}
+            for user_id, _, expiry, days in reminders
+        ])
+    db.commit()
+
+    last = users[-1]
+    cursor = (last.subscription_expiry, last.id) if len(users) == limit else None
+    return reminders, cursor
+
+def release_reminders(db: Session, unsent: List[Reminder], blocked_user_ids: List[int]):
+    """
+    Удаляет записи неотправленных напоминаний, чтобы отправить их в следующий
+    раз, и помечает заблокировавших бота пользователей.
+    """
+    for user_id, _, expiry, days in unsent:
+        db.query(SubscriptionReminder).filter(
+            SubscriptionReminder.user_id == user_id,
+            SubscriptionReminder.expiry == expiry,
+            SubscriptionReminder.days == days,
+        ).delete(synchronize_session=False)
+    if blocked_user_ids:
+        db.query(User).filter(User.id.in_(blocked_user_ids)).update({User.is_active: False}, synchronize_session=False)
+    db.commit()
+
+def _days_text(days: int) -> str:
+    if days % 10 == 1 and days % 100 != 11:
+        return f"{days} день"
+    if 2 <= days % 10 <= 4 and not 12 <= days % 100 <= 14:
+        return f"{days} дня"
+    return f"{days} дней"
+
+async def _send(bot: Bot, reminder: Reminder) -> str:
+    """Отправляет напоминание одному пользователю и возвращает результат."""
+    _, telegram_id, expiry, days = reminder
+    text = (
+        f"⏰ *Подписка заканчивается*\n\n"
+        f"Ваша подписка действует до {expiry.strftime('%d.%m.%Y')} - осталось не больше {_days_text(days)}.\n"
+        f"Продлите ее, чтобы сохранить доступ к каталогу."
+    )
+    reply_markup = InlineKeyboardMarkup([[callback_button("👑 Продлить", View.SUBSCRIPTION)]])
+    try:
+        await bot.send_message(
+            telegram_id, text, reply_markup=reply_markup, parse_mode="Markdown", rate_limit_args=BULK
+        )
+        return DELIVERED
+    except Forbidden:
+        return BLOCKED
+    except TelegramError as e:
+        logger.debug("Напоминания: не удалось отправить сообщение в чат %s: %s", telegram_id, e)
+        return FAILED
+
+async def run_reminders(bot: Bot):
+    """Отправляет напоминания всем пользователям, которым они положены сейчас."""
+    now = datetime.utcnow()
+    counts = {DELIVERED: 0, FAILED: 0, BLOCKED: 0}
+    cursor = None
+    while True:
+        async with session_scope():
+            reminders, cursor = await get_session().run_sync(claim_reminders, now, cursor, BROADCAST_CHUNK_SIZE)
+
+        results = {}
+
+        async def send(reminder: Reminder):
+            results[reminder] = await _send(bot, reminder)
+
+        try:
+            await asyncio.gather(*(send(reminder) for reminder in reminders))
+        finally:
+            # При остановке бота неотправленные напоминания тоже освобождаются
+            unsent = [reminder for reminder in reminders if results.get(reminder, FAILED) == FAILED]
+            blocked_user_ids = [reminder[0] for reminder in reminders if results.get(reminder) == BLOCKED]
+            if unsent or blocked_user_ids:
+                async with session_scope():
+                    await get_session().run_sync(release_reminders, unsent, blocked_user_ids)
+        for result in results.values():
+            counts[result] += 1
+
+        if cursor is None:
+            break
+
+    logger.info(
+        "Напоминания о продлении: доставлено %d, ошибок %d, заблокировали бота %d",
+        counts[DELIVERED], counts[FAILED], counts[BLOCKED]
+    )
+
+def dispatch_reminders(bot: Bot):
+    """Запускает отправку напоминаний в фоне, если она еще не выполняется."""
+    global _running
+    if _running is not None:
+        return
+    _running = asyncio.create_task(run_reminders(bot))
+    _running.add_done_callback(_finished)
+
+def _finished(task: asyncio.Task):
+    global _running
+    _running = None
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Отправка напоминаний прервана ошибкой", exc_info=task.exception())
+
+async def stop_reminders():
+    """Останавливает отправку напоминаний; неотправленные будут отправлены при следующем запуске."""
+    if _running is not None:
+        _running.cancel()
+        await asyncio.gather(_running, return_exceptions=True)
@@ -0,0 +1,78 @@
+"""
+Кэш готовых экранов бота: текст сообщения и клавиатура, для карточки
+товара - также путь к фото.
+
+Ключ записи - (экран, параметры, версия каталога). Версия берется из индекса
+каталога в памяти, поэтому проверка кэша не обращается к базе. При изменении
+каталога версия меняется, и все записи прежней версии удаляются; после
+перестроения индекса кэш заново заполняется частыми экранами
+(application.warm_render_cache).
+
+Экраны, не зависящие от каталога (главное меню, меню поиска), в кэше
+не хранятся: они строятся один раз при импорте обработчиков.
+"""
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+from config import RENDER_CACHE_SIZE
+from catalog_index import get_catalog_index
+
+# (текст, клавиатура) или (текст, путь к фото, клавиатура)
+Render = Tuple
+
+def current_catalog_version() -> Optional[int]:
+    """Версия каталога, по которой построен индекс, или None, если индекса еще нет."""
+    index = get_catalog_index()
+    return index.version if index is not None else None
+
+class RenderCache:
+    """LRU-кэш отрисованных экранов для текущей версии каталога."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.version = None
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, view: str, params: Hashable) -> Optional[Render]:
+        """Возвращает экран из кэша или None."""
+        version = current_catalog_version()
+        if version is None:
+            return None
+        if version != self.version:
+            self.entries.clear()
+            self.version = version
+        render = self.entries.get((view, params))
+        if render is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end((view, params))
+        self.hits += 1
+        return render
+
+    def put(self, view: str, params: Hashable, render: Render, version: Optional[int]):
+        """
+        Сохраняет экран. version - версия каталога, прочитанная до загрузки
+        данных: если каталог успел измениться, экран не сохраняется.
+        """
+        if version is None or version != current_catalog_version():
+            return
+        if version != self.version:
+            self.entries.clear()
+            self.version = version
+        self.entries[(view, params)] = render
+        self.entries.move_to_end((view, params))
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Статистика попаданий в кэш."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+render_cache = RenderCache(RENDER_CACHE_SIZE)
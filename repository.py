@@ -0,0 +1,169 @@
+"""
+Асинхронный слой доступа к данным для обработчиков бота.
+
+Функции повторяют сигнатуры синхронных функций из catalog.py, search.py,
+auth.py и subscription.py, но принимают AsyncSession и выполняют запросы
+через aiosqlite, не блокируя цикл событий.
+
+Поиск по цене, производителю, городу и атрибутам обслуживается индексом
+каталога в памяти (catalog_index.py), если он построен; в этом случае
+возвращаются облегченные записи ProductRecord вместо объектов Product.
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+import auth
+import catalog
+import search
+import subscription
+from auth_cache import auth_cache
+from catalog_index import get_catalog_index
+from models import Product, Category, City, Manufacturer
+
+def _with_category(db, fetch, *args):
+    """Загружает товар и сразу подгружает его категорию."""
+    product = fetch(db, *args)
+    if product is not None:
+        product.category
+    return product
+
+# Каталог
+
+async def get_all_categories(db: AsyncSession) -> List[Category]:
+    """Получает список всех категорий."""
+    return await db.run_sync(catalog.get_all_categories)
+
+async def get_category_by_id(db: AsyncSession, category_id: int) -> Optional[Category]:
+    """Получает категорию по ID."""
+    return await db.run_sync(catalog.get_category_by_id, category_id)
+
+async def get_products_by_category(db: AsyncSession, category_id: int) -> List[Product]:
+    """Получает список товаров в указанной категории."""
+    return await db.run_sync(catalog.get_products_by_category, category_id)
+
+async def get_product_by_id(db: AsyncSession, product_id: int) -> Optional[Product]:
+    """Получает товар по ID вместе с категорией."""
+    return await db.run_sync(_with_category, catalog.get_product_by_id, product_id)
+
+async def get_product_by_code(db: AsyncSession, product_code: str) -> Optional[Product]:
+    """Получает товар по коду вместе с категорией."""
+    return await db.run_sync(_with_category, catalog.get_product_by_code, product_code)
+
+async def get_all_cities(db: AsyncSession) -> List[City]:
+    """Получает список всех городов."""
+    return await db.run_sync(catalog.get_all_cities)
+
+async def get_city_by_id(db: AsyncSession, city_id: int) -> Optional[City]:
+    """Получает город по ID."""
+    return await db.run_sync(catalog.get_city_by_id, city_id)
+
+async def get_manufacturer_by_id(db: AsyncSession, manufacturer_id: int) -> Optional[Manufacturer]:
+    """Получает производителя по ID."""
+    return await db.run_sync(catalog.get_manufacturer_by_id, manufacturer_id)
+
+# Поиск
+
+async def search_by_price(db: AsyncSession, max_price: float = None):
+    """Поиск товаров по максимальной цене."""
+    index = get_catalog_index()
+    if index is not None:
+        return index.search_by_price(max_price)
+    return await db.run_sync(search.search_by_price, max_price)
+
+async def search_by_manufacturer(db: AsyncSession, manufacturer_id: int):
+    """Поиск товаров по ID производителя."""
+    index = get_catalog_index()
+    if index is not None:
+        return index.search_by_manufacturer(manufacturer_id)
+    return await db.run_sync(search.search_by_manufacturer, manufacturer_id)
+
+async def search_by_city(db: AsyncSession, city_id: int):
+    """Поиск товаров по ID города."""
+    index = get_catalog_index()
+    if index is not None:
+        return index.search_by_city(city_id)
+    return await db.run_sync(search.search_by_city, city_id)
+
+async def search_by_name(db: AsyncSession, name: str):
+    """Поиск товаров по названию."""
+    return await db.run_sync(search.search_by_name, name)
+
+async def search_by_code(db: AsyncSession, code: str):
+    """Поиск товара по коду."""
+    return await db.run_sync(search.search_by_code, code)
+
+async def advanced_search(db: AsyncSession, **kwargs):
+    """Расширенный поиск товаров по нескольким параметрам."""
+    index = get_catalog_index()
+    if index is not None and index.supports(**kwargs):
+        return index.advanced_search(**kwargs)
+    return await db.run_sync(lambda session: search.advanced_search(session, **kwargs))
+
+async def search_page(db: AsyncSession, filters, cursor=None, backward=False, limit=10):
+    """Страница результатов поиска в порядке (цена, id) относительно курсора."""
+    index = get_catalog_index()
+    if index is not None and index.supports(**filters):
+        return index.search_page(filters, cursor, backward, limit)
+    return await db.run_sync(search.search_page, filters, cursor, backward, limit)
+
+async def count_products(db: AsyncSession, filters):
+    """Количество товаров, подходящих под фильтры поиска."""
+    index = get_catalog_index()
+    if index is not None and index.supports(**filters):
+        return index.count_products(filters)
+    return await db.run_sync(search.count_products, filters)
+
+async def get_all_manufacturers(db: AsyncSession):
+    """Возвращает список производителей в виде пар (id, название)."""
+    index = get_catalog_index()
+    if index is not None:
+        return index.get_all_manufacturers()
+    return await db.run_sync(search.get_all_manufacturers)
+
+async def get_all_cities_from_products(db: AsyncSession):
+    """Возвращает список городов с товарами в виде пар (id, название)."""
+    index = get_catalog_index()
+    if index is not None:
+        return index.get_all_cities()
+    return await db.run_sync(search.get_all_cities)
+
+# Пользователи
+
+async def register_user(db: AsyncSession, telegram_id, username=None, first_name=None, last_name=None, phone_number=None, email=None):
+    """Регистрирует нового пользователя или обновляет существующего."""
+    return await db.run_sync(
+        auth.register_user, telegram_id, username, first_name, last_name, phone_number, email
+    )
+
+async def get_user(db: AsyncSession, telegram_id):
+    """Получает пользователя по telegram_id."""
+    return await db.run_sync(auth.get_user, telegram_id)
+
+async def use_auth_code(db: AsyncSession, telegram_id, code):
+    """Использует код авторизации для активации подписки."""
+    return await db.run_sync(auth.use_auth_code, telegram_id, code)
+
+async def has_active_subscription(db: AsyncSession, telegram_id):
+    """Проверяет, есть ли у пользователя активная подписка."""
+    # Пока запись кэша действительна, база не используется
+    active = auth_cache.is_active(telegram_id)
+    if active is not None:
+        return active
+    return await db.run_sync(auth.has_active_subscription, telegram_id)
+
+# Подписки
+
+async def get_subscription_info(db: AsyncSession, user_id):
+    """Получает информацию о подписке пользователя."""
+    return await db.run_sync(subscription.get_subscription_info, user_id)
+
+async def extend_subscription(db: AsyncSession, user_id, subscription_type, payment_id=None):
+    """Продлевает существующую подписку пользователя."""
+    return await db.run_sync(subscription.extend_subscription, user_id, subscription_type, payment_id)
+
+async def cancel_subscription(db: AsyncSession, user_id):
+    """Отменяет подписку пользователя."""
+    return await db.run_sync(subscription.cancel_subscription, user_id)
+
+async def expire_subscriptions(db: AsyncSession):
+    """Переводит в статус EXPIRED подписки, срок действия которых истек."""
+    return await db.run_sync(subscription.expire_subscriptions)
@@ -1,7 +1,39 @@
+from sqlalchemy import text, tuple_, func, Integer
 from sqlalchemy.orm import Session
-from models import Product, Category
+from models import Product, Category, Manufacturer, City
 from typing import List, Dict, Any, Optional
 
+# Минимальная длина слова для триграммного индекса
+FTS_MIN_TERM_LENGTH = 3
+
+_fts_enabled = None
+
+def is_fts_enabled(db: Session) -> bool:
+    """Проверяет, создан ли полнотекстовый индекс products_fts (результат кэшируется)."""
+    global _fts_enabled
+    if _fts_enabled is None:
+        _fts_enabled = db.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'")
+        ).first() is not None
+    return _fts_enabled
+
+def build_match_query(columns: str, value: str) -> Optional[str]:
+    """
+    Строит выражение MATCH: каждое слово ищется как подстрока в указанных столбцах.
+    Возвращает None, если в запросе нет слов достаточной длины для индекса.
+    """
+    terms = value.split()
+    if not terms or any(len(term) < FTS_MIN_TERM_LENGTH for term in terms):
+        return None
+    phrases = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+    return f"{{{columns}}} : ({phrases})"
+
+def rebuild_search_index(db: Session):
+    """Перестраивает полнотекстовый индекс по текущему содержимому products."""
+    if is_fts_enabled(db):
+        db.execute(text("INSERT INTO products_fts (products_fts) VALUES ('rebuild')"))
+        db.commit()
+
 def search_by_price(db: Session, max_price: float = None):
     """Поиск товаров по максимальной цене."""
     query = db.query(Product)
@@ -12,32 +44,49 @@ def search_by_price(db: Session, max_price: float = None):
     # Сортировка от дешевых к дорогим
     return query.order_by(Product.price).all()
 
-def search_by_manufacturer(db: Session, manufacturer: str):
-    """Поиск товаров по производителю."""
-    return db.query(Product).filter(Product.manufacturer.ilike(f"%{manufacturer}%")).order_by(Product.price).all()
+def search_by_manufacturer(db: Session, manufacturer_id: int):
+    """Поиск товаров по ID производителя из справочника."""
+    return db.query(Product).filter(Product.manufacturer_id == manufacturer_id).order_by(Product.price).all()
 
-def search_by_city(db: Session, city: str):
-    """Поиск товаров по городу."""
-    return db.query(Product).filter(Product.city.ilike(f"%{city}%")).order_by(Product.price).all()
+def search_by_city(db: Session, city_id: int):
+    """Поиск товаров по ID города из справочника."""
+    return db.query(Product).filter(Product.city_id == city_id).order_by(Product.price).all()
 
 def search_by_name(db: Session, name: str):
     """Поиск товаров по названию."""
-    return db.query(Product).filter(Product.name.ilike(f"%{name}%")).order_by(Product.price).all()
+    return db.query(Product).filter(text_filter(db, "name", name)).order_by(Product.price).all()
 
 def search_by_code(db: Session, code: str):
     """Поиск товара по коду."""
-    return db.query(Product).filter(Product.product_code.ilike(f"%{code}%")).order_by(Product.price).all()
+    return db.query(Product).filter(text_filter(db, "product_code", code)).order_by(Product.price).all()
 
-def advanced_search(db: Session, **kwargs):
-    """Расширенный поиск товаров по нескольким параметрам."""
-    query = db.query(Product)
-    
+def text_filter(db: Session, column: str, value: str):
+    """
+    Условие поиска подстроки в названии или коде товара: через полнотекстовый
+    индекс, если он доступен, иначе через ilike.
+    """
+    match = build_match_query(column, value)
+    if match is not None and is_fts_enabled(db):
+        matched = text(
+            "SELECT rowid FROM products_fts WHERE products_fts MATCH :match"
+        ).bindparams(match=match).columns(rowid=Integer)
+        return Product.id.in_(matched)
+    return getattr(Product, column).ilike(f"%{value}%")
+
+def apply_filters(db: Session, query, **kwargs):
+    """Добавляет к запросу фильтры расширенного поиска."""
     if 'category_id' in kwargs and kwargs['category_id']:
         query = query.filter(Product.category_id == kwargs['category_id'])
     
     if 'max_price' in kwargs and kwargs['max_price']:
         query = query.filter(Product.price <= kwargs['max_price'])
     
+    if 'manufacturer_id' in kwargs and kwargs['manufacturer_id']:
+        query = query.filter(Product.manufacturer_id == kwargs['manufacturer_id'])
+    
+    if 'city_id' in kwargs and kwargs['city_id']:
+        query = query.filter(Product.city_id == kwargs['city_id'])
+    
     if 'manufacturer' in kwargs and kwargs['manufacturer']:
         query = query.filter(Product.manufacturer.ilike(f"%{kwargs['manufacturer']}%"))
     
@@ -45,10 +94,10 @@ def advanced_search(db: Session, **kwargs):
         query = query.filter(Product.city.ilike(f"%{kwargs['city']}%"))
     
     if 'name' in kwargs and kwargs['name']:
-        query = query.filter(Product.name.ilike(f"%{kwargs['name']}%"))
+        query = query.filter(text_filter(db, "name", kwargs['name']))
     
     if 'code' in kwargs and kwargs['code']:
-        query = query.filter(Product.product_code.ilike(f"%{kwargs['code']}%"))
+        query = query.filter(text_filter(db, "product_code", kwargs['code']))
     
     # Специфичные атрибуты для разных типов мебели
     if 'form' in kwargs and kwargs['form']:
@@ -66,18 +115,56 @@ def advanced_search(db: Session, **kwargs):
     if 'has_box' in kwargs and kwargs['has_box'] is not None:
         query = query.filter(Product.has_box == kwargs['has_box'])
     
+    return query
+
+def advanced_search(db: Session, **kwargs):
+    """Расширенный поиск товаров по нескольким параметрам."""
     # Сортировка от дешевых к дорогим
-    return query.order_by(Product.price).all()
+    return apply_filters(db, db.query(Product), **kwargs).order_by(Product.price).all()
+
+def search_page(db: Session, filters: Dict[str, Any], cursor: Optional[tuple] = None,
+                backward: bool = False, limit: int = 10):
+    """
+    Страница результатов расширенного поиска в порядке (цена, id).
+
+    Вместо OFFSET используется курсор - пара (цена, id) товара на границе
+    страницы, поэтому переход на любую страницу - один запрос по индексу.
+
+    Args:
+        filters: Фильтры, как в advanced_search
+        cursor: (цена, id) последнего товара предыдущей страницы или, при
+            backward=True, первого товара следующей страницы
+        backward: Загрузить страницу, предшествующую курсору
+        limit: Количество товаров на странице
+
+    Returns:
+        list: Товары страницы, отсортированные по возрастанию цены
+    """
+    query = apply_filters(db, db.query(Product), **filters)
+    key = tuple_(Product.price, Product.id)
+    if backward:
+        if cursor is not None:
+            query = query.filter(key < cursor)
+        products = query.order_by(Product.price.desc(), Product.id.desc()).limit(limit).all()
+        products.reverse()
+        return products
+    if cursor is not None:
+        query = query.filter(key > cursor)
+    return query.order_by(Product.price, Product.id).limit(limit).all()
+
+def count_products(db: Session, filters: Dict[str, Any]) -> int:
+    """Количество товаров, подходящих под фильтры расширенного поиска."""
+    return apply_filters(db, db.query(func.count(Product.id)), **filters).scalar()
 
 def get_all_manufacturers(db: Session):
-    """Возвращает список всех производителей."""
-    manufacturers = db.query(Product.manufacturer).distinct().all()
-    return [m[0] for m in manufacturers if m[0]]
+    """Возвращает список производителей, у которых есть товары, в виде пар (id, название)."""
+    has_products = db.query(Product.id).filter(Product.manufacturer_id == Manufacturer.id).exists()
+    return db.query(Manufacturer.id, Manufacturer.name).filter(has_products).order_by(Manufacturer.name).all()
 
 def get_all_cities(db: Session):
-    """Возвращает список всех городов."""
-    cities = db.query(Product.city).distinct().all()
-    return [c[0] for c in cities if c[0]]
+    """Возвращает список городов, в которых есть товары, в виде пар (id, название)."""
+    has_products = db.query(Product.id).filter(Product.city_id == City.id).exists()
+    return db.query(City.id, City.name).filter(has_products).order_by(City.name).all()
 
 def get_forms():
     """Возвращает список доступных форм мебели."""
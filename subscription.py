@@ -1,7 +1,9 @@
+from sqlalchemy import update, func
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from models import User, Subscription, SubscriptionStatus
 from config import SUBSCRIPTION_PRICES
+from auth_cache import auth_cache
 
 def get_subscription_price(subscription_type):
     """
@@ -15,30 +17,40 @@ def get_subscription_price(subscription_type):
     """
     return SUBSCRIPTION_PRICES.get(subscription_type, SUBSCRIPTION_PRICES["MONTH"])
 
-def calculate_subscription_end_date(subscription_type):
+def get_subscription_duration(subscription_type):
     """
-    Рассчитывает дату окончания подписки в зависимости от её типа.
+    Возвращает срок действия подписки в зависимости от её типа.
     
     Args:
         subscription_type: Тип подписки (MONTH, YEAR, FOREVER)
         
     Returns:
-        datetime: Дата окончания подписки
+        timedelta: Срок действия подписки
     """
-    now = datetime.utcnow()
-    
     if subscription_type == "MONTH":
         # Подписка на месяц
-        return now + timedelta(days=30)
+        return timedelta(days=30)
     elif subscription_type == "YEAR":
         # Подписка на год
-        return now + timedelta(days=365)
+        return timedelta(days=365)
     elif subscription_type == "FOREVER":
         # "Вечная" подписка (10 лет)
-        return now + timedelta(days=3650)
+        return timedelta(days=3650)
     else:
         # По умолчанию - месяц
-        return now + timedelta(days=30)
+        return timedelta(days=30)
+
+def calculate_subscription_end_date(subscription_type):
+    """
+    Рассчитывает дату окончания подписки в зависимости от её типа.
+    
+    Args:
+        subscription_type: Тип подписки (MONTH, YEAR, FOREVER)
+        
+    Returns:
+        datetime: Дата окончания подписки
+    """
+    return datetime.utcnow() + get_subscription_duration(subscription_type)
 
 def create_subscription(db: Session, user_id, subscription_type, payment_id=None):
     """
@@ -83,6 +95,7 @@ def create_subscription(db: Session, user_id, subscription_type, payment_id=None
     db.commit()
     db.refresh(subscription)
     db.refresh(user)
+    auth_cache.invalidate(user.telegram_id)
     
     return subscription
 
@@ -104,7 +117,13 @@ def get_user_subscription(db: Session, user_id):
 
 def extend_subscription(db: Session, user_id, subscription_type, payment_id=None):
     """
-    Продлевает существующую подписку пользователя.
+    Продлевает подписку пользователя от даты окончания последней подписки
+    (или от текущего момента, если она уже закончилась).
+    
+    Все выполняется в одной транзакции BEGIN IMMEDIATE: блокировка записи
+    берется до чтения даты окончания, поэтому одновременные продления
+    выполняются по очереди и не теряются. Повторный вызов с тем же payment_id
+    не продлевает подписку еще раз, а возвращает уже созданную запись.
     
     Args:
         db: Сессия базы данных
@@ -113,53 +132,52 @@ def extend_subscription(db: Session, user_id, subscription_type, payment_id=None
         payment_id: ID платежа (опционально)
         
     Returns:
-        Subscription: Обновленная подписка
+        Subscription: Созданная (или ранее созданная для payment_id) запись о подписке
     """
-    # Получаем пользователя
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        return None
-    
-    # Получаем текущую подписку
-    current_subscription = get_user_subscription(db, user_id)
-    
-    # Рассчитываем новую дату окончания подписки
-    if current_subscription and current_subscription.end_date > datetime.utcnow():
-        # Если есть активная подписка, продлеваем от даты её окончания
-        if subscription_type == "MONTH":
-            end_date = current_subscription.end_date + timedelta(days=30)
-        elif subscription_type == "YEAR":
-            end_date = current_subscription.end_date + timedelta(days=365)
-        elif subscription_type == "FOREVER":
-            end_date = current_subscription.end_date + timedelta(days=3650)
-        else:
-            end_date = current_subscription.end_date + timedelta(days=30)
-    else:
-        # Если нет активной подписки, создаем новую
-        end_date = calculate_subscription_end_date(subscription_type)
-    
-    # Получаем стоимость подписки
-    price = get_subscription_price(subscription_type)
-    
-    # Создаем новую запись о подписке
-    subscription = Subscription(
-        user_id=user_id,
-        status=SubscriptionStatus.PAID,
-        start_date=datetime.utcnow(),
-        end_date=end_date,
-        payment_id=payment_id,
-        payment_amount=price,
-        payment_date=datetime.utcnow()
-    )
-    
-    # Обновляем статус подписки пользователя
-    user.subscription_status = SubscriptionStatus.PAID
-    user.subscription_expiry = end_date
-    
-    db.add(subscription)
+    # Незафиксированные изменения сессии не должны попасть в эту транзакцию
     db.commit()
-    db.refresh(subscription)
-    db.refresh(user)
+    db.connection().exec_driver_sql("BEGIN IMMEDIATE")
+    try:
+        if payment_id is not None:
+            existing = db.query(Subscription).filter(Subscription.payment_id == payment_id).first()
+            if existing is not None:
+                db.commit()
+                return existing
+        
+        now = datetime.utcnow()
+        # Отмененные записи (EXPIRED) не продлеваются, даже если их дата окончания в будущем
+        latest_end = db.query(func.max(Subscription.end_date)).filter(
+            Subscription.user_id == user_id,
+            Subscription.status.in_([SubscriptionStatus.PAID, SubscriptionStatus.TRIAL])
+        ).scalar()
+        start = latest_end if latest_end and latest_end > now else now
+        end_date = start + get_subscription_duration(subscription_type)
+        
+        telegram_id = db.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(subscription_status=SubscriptionStatus.PAID, subscription_expiry=end_date)
+            .returning(User.telegram_id)
+        ).scalar()
+        if telegram_id is None:
+            db.rollback()
+            return None
+        
+        subscription = Subscription(
+            user_id=user_id,
+            status=SubscriptionStatus.PAID,
+            start_date=now,
+            end_date=end_date,
+            payment_id=payment_id,
+            payment_amount=get_subscription_price(subscription_type),
+            payment_date=now
+        )
+        db.add(subscription)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    auth_cache.invalidate(telegram_id)
     
     return subscription
 
@@ -179,22 +197,24 @@ def cancel_subscription(db: Session, user_id):
     if not user:
         return False
     
-    # Получаем текущую подписку
-    current_subscription = get_user_subscription(db, user_id)
-    if not current_subscription:
+    # Отменяем все записи, которые действуют сейчас или начнут действовать позже:
+    # иначе более ранняя оплата с будущей датой окончания осталась бы текущей
+    # подпиской, и следующее продление отсчитывалось бы от нее
+    now = datetime.utcnow()
+    cancelled = db.query(Subscription).filter(
+        Subscription.user_id == user_id,
+        Subscription.end_date > now
+    ).update({Subscription.status: SubscriptionStatus.EXPIRED, Subscription.end_date: now}, synchronize_session=False)
+    if not cancelled:
         return False
     
-    # Отменяем подписку
-    current_subscription.status = SubscriptionStatus.EXPIRED
-    current_subscription.end_date = datetime.utcnow()
-    
     # Обновляем статус подписки пользователя
     user.subscription_status = SubscriptionStatus.EXPIRED
-    user.subscription_expiry = datetime.utcnow()
+    user.subscription_expiry = now
     
     db.commit()
-    db.refresh(current_subscription)
     db.refresh(user)
+    auth_cache.invalidate(user.telegram_id)
     
     return True
 
@@ -246,3 +266,39 @@ def get_subscription_info(db: Session, user_id):
         "payment_date": current_subscription.payment_date,
         "message": f"У вас активная подписка до {current_subscription.end_date.strftime('%d.%m.%Y')}"
     }
+
+def expire_subscriptions(db: Session):
+    """
+    Переводит в статус EXPIRED подписки, срок действия которых истек: одним
+    UPDATE для пользователей (по индексу статуса и subscription_expiry) и одним
+    для записей подписок (по индексу статуса и end_date).
+    
+    Args:
+        db: Сессия базы данных
+        
+    Returns:
+        tuple: (telegram_id пользователей, чья подписка истекла; количество записей подписок)
+    """
+    now = datetime.utcnow()
+    lapsing = [SubscriptionStatus.PAID, SubscriptionStatus.TRIAL]
+    
+    # last_activity указывается явно: иначе onupdate отметил бы всех как активных
+    telegram_ids = db.execute(
+        update(User)
+        .where(User.subscription_expiry < now, User.subscription_status.in_(lapsing))
+        .values(subscription_status=SubscriptionStatus.EXPIRED, last_activity=User.last_activity)
+        .returning(User.telegram_id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    subscriptions = db.execute(
+        update(Subscription)
+        .where(Subscription.end_date < now, Subscription.status.in_(lapsing))
+        .values(status=SubscriptionStatus.EXPIRED)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    
+    for telegram_id in telegram_ids:
+        auth_cache.invalidate(telegram_id)
+    
+    return telegram_ids, subscriptions
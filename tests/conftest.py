@@ -0,0 +1,26 @@
+"""
+Общие настройки тестов: бот работает с временной базой SQLite.
+
+Адрес базы задается до импорта модулей проекта, так как config.py и
+database.py читают его при импорте.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "test.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_FILE}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import init_db, engine, async_engine
+from migrations import run_migrations
+
+@pytest.fixture(scope="session")
+def database():
+    """База, подготовленная так же, как при запуске бота: таблицы по моделям и все миграции."""
+    init_db()
+    run_migrations()
+    yield engine
+    engine.dispose()
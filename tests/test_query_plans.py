@@ -0,0 +1,12 @@
+"""Горячие запросы (migrations.HOT_QUERIES) должны использовать индексы."""
+from database import engine
+from migrations import MIGRATIONS, check_query_plans, get_schema_version, run_migrations
+
+def test_migrations_bring_schema_to_latest_version(database):
+    with engine.connect() as connection:
+        assert get_schema_version(connection) == MIGRATIONS[-1][0]
+    # Повторный запуск ничего не применяет
+    assert run_migrations() == []
+
+def test_hot_queries_do_not_scan_tables(database):
+    assert check_query_plans() == {}
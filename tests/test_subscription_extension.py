@@ -0,0 +1,81 @@
+"""
+Продление подписки при одновременных подтверждениях оплаты и после отмены.
+
+Подтверждения выполняются так же, как в обработчиках бота: через асинхронную
+сессию и run_sync, поэтому одновременные продления конкурируют за блокировку
+записи SQLite.
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from database import SessionLocal, AsyncSessionLocal, async_engine
+from models import User, Subscription, SubscriptionStatus
+import subscription
+
+def create_user(telegram_id):
+    db = SessionLocal()
+    user = User(telegram_id=telegram_id, subscription_status=SubscriptionStatus.FREE)
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    db.close()
+    return user_id
+
+async def call(function, *args):
+    async with AsyncSessionLocal() as db:
+        return await db.run_sync(function, *args)
+
+def run(coroutine):
+    """Выполняет корутину; соединения aiosqlite привязаны к циклу событий и закрываются вместе с ним."""
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(main())
+
+def extended_days(user_id, since):
+    db = SessionLocal()
+    expiry = db.query(User.subscription_expiry).filter(User.id == user_id).scalar()
+    db.close()
+    return round((expiry - since) / timedelta(days=1))
+
+def test_concurrent_confirmations_extend_once_per_payment(database):
+    payments = 20
+    user_id = create_user("extend-concurrent")
+    started_at = datetime.utcnow()
+
+    # Каждая оплата подтверждается дважды (двойное нажатие кнопки)
+    async def confirm_all():
+        await asyncio.gather(*(
+            call(subscription.extend_subscription, user_id, "MONTH", f"payment-{n}")
+            for n in range(payments) for _ in range(2)
+        ))
+    run(confirm_all())
+
+    assert extended_days(user_id, started_at) == 30 * payments
+    db = SessionLocal()
+    per_payment = db.query(Subscription.payment_id, func.count(Subscription.id)).filter(
+        Subscription.user_id == user_id
+    ).group_by(Subscription.payment_id).all()
+    db.close()
+    assert len(per_payment) == payments
+    assert all(count == 1 for _, count in per_payment)
+
+def test_extension_after_cancel_starts_from_now(database):
+    user_id = create_user("extend-after-cancel")
+
+    async def pay_cancel_pay():
+        await call(subscription.extend_subscription, user_id, "MONTH", "cancel-1")
+        await call(subscription.extend_subscription, user_id, "MONTH", "cancel-2")
+        assert await call(subscription.cancel_subscription, user_id)
+        info = await call(subscription.get_subscription_info, user_id)
+        assert info["status"] == "no_subscription"
+        await call(subscription.extend_subscription, user_id, "MONTH", "cancel-3")
+    started_at = datetime.utcnow()
+    run(pay_cancel_pay())
+
+    # Отмененные оплаты не переносятся в новую подписку
+    assert extended_days(user_id, started_at) == 30
@@ -0,0 +1,133 @@
+"""
+Режим webhook: Telegram сам доставляет обновления на HTTP-сервер бота.
+
+HTTP-сервер Tornado создается здесь, а не внутри Application.run_webhook:
+встроенный сервер python-telegram-bot не позволяет добавить свои адреса без
+подмены его внутренних модулей. Сервер принимает обновления на WEBHOOK_PATH
+и кладет их в Application.update_queue - дальше они обрабатываются так же,
+как при polling. Каждый запрос проверяется по секрету из заголовка
+X-Telegram-Bot-Api-Secret-Token. На том же сервере доступен адрес проверки
+работоспособности для платформы развертывания.
+"""
+import asyncio
+import json
+import logging
+import secrets
+import signal
+from http import HTTPStatus
+import tornado.web
+from tornado.httpserver import HTTPServer
+from telegram import Update
+from telegram.ext import Application, ExtBot
+from application import get_update_stats
+from config import (
+    WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH,
+    WEBHOOK_SECRET_TOKEN, WEBHOOK_MAX_CONNECTIONS, HEALTH_PATH
+)
+
+logger = logging.getLogger(__name__)
+
+class TelegramUpdateHandler(tornado.web.RequestHandler):
+    """Принимает обновление от Telegram и передает его в очередь приложения."""
+
+    SUPPORTED_METHODS = ("POST",)
+
+    def initialize(self, bot_application: Application, secret_token: str):
+        self.bot_application = bot_application
+        self.secret_token = secret_token
+
+    async def post(self):
+        token = self.request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not secrets.compare_digest(token, self.secret_token):
+            raise tornado.web.HTTPError(HTTPStatus.FORBIDDEN)
+        try:
+            data = json.loads(self.request.body)
+        except ValueError:
+            raise tornado.web.HTTPError(HTTPStatus.BAD_REQUEST)
+
+        bot = self.bot_application.bot
+        try:
+            update = Update.de_json(data, bot)
+        except Exception as e:
+            # Telegram повторяет доставку при ошибке, но это обновление не разобрать и повторно
+            logger.error("Не удалось разобрать обновление из webhook: %s", e)
+            return
+        if update is None:
+            return
+        if isinstance(bot, ExtBot):
+            bot.insert_callback_data(update)
+        await self.bot_application.update_queue.put(update)
+
+class HealthHandler(tornado.web.RequestHandler):
+    """Отвечает 200, пока бот принимает обновления."""
+
+    def initialize(self, bot_application: Application):
+        self.bot_application = bot_application
+
+    def get(self):
+        self.write(dict(
+            get_update_stats(), status="ok", pending_updates=self.bot_application.update_queue.qsize()
+        ))
+
+class WebhookServerApp(tornado.web.Application):
+    """Приложение Tornado с адресом webhook и адресом проверки работоспособности."""
+
+    def __init__(self, bot_application: Application, secret_token: str):
+        super().__init__([
+            (rf"/{WEBHOOK_PATH.strip('/')}/?", TelegramUpdateHandler,
+             {"bot_application": bot_application, "secret_token": secret_token}),
+            (HEALTH_PATH, HealthHandler, {"bot_application": bot_application}),
+        ])
+
+    def log_request(self, handler):
+        """Запросы не журналируются: Telegram присылает их на каждое обновление."""
+
+async def serve_webhook(application: Application, webhook_url: str, secret_token: str):
+    """
+    Выполняет приложение в режиме webhook до сигнала остановки. Порядок запуска
+    и остановки тот же, что в Application.run_polling: post_init после
+    initialize, post_stop после stop, post_shutdown после shutdown.
+    """
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for stop_signal in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(stop_signal, stopping.set)
+
+    server = None
+    try:
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+        await application.bot.set_webhook(
+            webhook_url, max_connections=WEBHOOK_MAX_CONNECTIONS, secret_token=secret_token
+        )
+        server = HTTPServer(WebhookServerApp(application, secret_token))
+        server.listen(WEBHOOK_PORT, address=WEBHOOK_LISTEN)
+        await application.start()
+        await stopping.wait()
+    finally:
+        if server is not None:
+            server.stop()
+            await server.close_all_connections()
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+def run_webhook(application: Application):
+    """Запускает бота в режиме webhook (блокирует до остановки, как run_polling)."""
+    if not WEBHOOK_URL:
+        raise RuntimeError("Для режима webhook необходимо задать WEBHOOK_URL")
+
+    # Без секрета любой, кто знает адрес, мог бы присылать боту поддельные обновления
+    secret_token = WEBHOOK_SECRET_TOKEN or secrets.token_urlsafe(32)
+
+    webhook_url = f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH.lstrip('/')}"
+    logger.info(
+        "Режим webhook: %s, сервер %s:%d, соединений не более %d, проверка работоспособности %s",
+        webhook_url, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_MAX_CONNECTIONS, HEALTH_PATH
+    )
+    asyncio.run(serve_webhook(application, webhook_url, secret_token))